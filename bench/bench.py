@@ -0,0 +1,203 @@
+"""Load and latency benchmark for the proxy routes.
+
+Drives every route at a fixed concurrency and reports p50/p95/p99 latency
+and requests per second. Either point it at a running proxy:
+
+    python bench/bench.py --proxy-url http://127.0.0.1:5000
+
+or let it start the fake Streamrun server and the proxy under gunicorn:
+
+    python bench/bench.py --spawn flask --workers 4 --upstream-latency 0.05
+    python bench/bench.py --spawn async
+    python bench/bench.py --spawn flask --workers 4 --preload
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Order matters: go live first so instance routes have something to act on
+ROUTES = [
+    "/api/golive",
+    "/api/status",
+    "/api/instance-data",
+    "/api/elements-categorized",
+    "/api/destinations",
+    "/api/outputs?state=LIVE",
+    "/api/switch-element?element_id=input-pc",
+    "/api/batch?ops=switch-element:input-brb,outputs:LIVE",
+    "/",
+    "/api/stop",
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def command_failed(route, body):
+    """Whether a 200 answer reports a failed upstream call.
+
+    Chat commands answer 200 with an "Error ..." body when Streamrun fails; a
+    batch lists "op: result" per operation, separated by " | ".
+    """
+    text = body.decode("utf-8", "replace")
+    if route.startswith("/api/batch"):
+        results = [part.partition(": ")[2] for part in text.split(" | ")]
+    else:
+        results = [text]
+    return any(result.startswith("Error") for result in results)
+
+
+async def run_route(session, base_url, route, total, concurrency):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                async with session.get(base_url + route) as r:
+                    body = await r.read()
+                    if r.status >= 500 or command_failed(route, body):
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "route": route,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(base_url, routes, total, concurrency):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return [await run_route(session, base_url, route, total, concurrency) for route in routes]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def spawn(args, workdir):
+    """Start the fake upstream and the proxy; return (proxy url, processes)."""
+    fake_port, proxy_port = free_port(), free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "bench", "fake_streamrun.py"),
+        "--port", str(fake_port),
+        "--latency", str(args.upstream_latency),
+        "--jitter", str(args.upstream_jitter),
+        "--error-rate", str(args.upstream_error_rate),
+        "--elements", str(args.elements),
+        "--start-delay", "0",
+    ], stdout=subprocess.DEVNULL)
+    wait_for_port(fake_port)
+
+    env = dict(
+        os.environ,
+        STREAMRUN_BASE_URL=f"http://127.0.0.1:{fake_port}/api/v1",
+        STREAMRUN_SNAPSHOT_PATH=os.path.join(workdir, "snapshot.json"),
+        STREAMRUN_STATE_STORE="sqlite" if args.workers > 1 else "memory",
+        STREAMRUN_STATE_DB=os.path.join(workdir, "state.db"),
+    )
+    # Measure the proxy, not its rate limiter
+    for name in ("STREAMRUN_READ_RATE", "STREAMRUN_READ_BURST", "STREAMRUN_WRITE_RATE", "STREAMRUN_WRITE_BURST"):
+        env.setdefault(name, "100000")
+    command = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{proxy_port}", "-w", str(args.workers)]
+    if args.preload:
+        command.append("--preload")
+    if args.spawn == "async":
+        command += ["-k", "aiohttp.GunicornWebWorker", "streamrun_async:app"]
+    else:
+        command += ["streamrun_proxy:app"]
+    proxy = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(proxy_port)
+    # Give the background config fetch a moment to land
+    time.sleep(0.5)
+    return f"http://127.0.0.1:{proxy_port}", [proxy, fake]
+
+
+def print_table(results):
+    print(f"{'route':<42} {'reqs':>6} {'errs':>5} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['route']:<42} {r['requests']:>6} {r['errors']:>5} {r['rps']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--proxy-url", help="benchmark an already running proxy")
+    parser.add_argument("--spawn", choices=("flask", "async"), help="start the fake upstream and this proxy")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers when spawning")
+    parser.add_argument("--preload", action="store_true", help="build the app once in the gunicorn master")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--routes", help="comma-separated routes (default: all)")
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--upstream-jitter", type=float, default=0.0)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--elements", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    if not args.proxy_url and not args.spawn:
+        parser.error("pass --proxy-url or --spawn")
+
+    routes = args.routes.split(",") if args.routes else ROUTES
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            base_url = args.proxy_url
+            if args.spawn:
+                base_url, processes = spawn(args, workdir)
+            results = asyncio.run(run(base_url.rstrip("/"), routes, args.requests, args.concurrency))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
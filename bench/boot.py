@@ -0,0 +1,79 @@
+"""Cold-start benchmark for the proxy against its boot-time budget.
+
+Imports the app in fresh interpreters, one after another, and reports the
+median and worst time of each startup phase. Exits with status 1 when the
+median total (importing the module until its app is built) goes over the
+budget:
+
+    python bench/boot.py --runs 20 --budget-ms 1000
+    python bench/boot.py --module streamrun_async
+
+Nothing is fetched at import, so no upstream server is needed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ("import_ms", "preload_ms", "ready_ms")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+import streamrun_proxy
+timings = dict(streamrun_proxy.startup_timings, total_ms=(time.perf_counter() - started) * 1000)
+sys.stdout.write(json.dumps(timings))
+"""
+
+
+def boot_once(module, env):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", default="streamrun_proxy", choices=("streamrun_proxy", "streamrun_async"))
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STREAMRUN_BOOT_BUDGET_MS", "1000")))
+    parser.add_argument("--snapshot", help="snapshot file to load at startup (default: none)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            STREAMRUN_SNAPSHOT_PATH=args.snapshot or os.path.join(workdir, "snapshot.json"),
+            STREAMRUN_STATE_DB=os.path.join(workdir, "state.db"),
+            STREAMRUN_LOG_LEVEL="ERROR",
+        )
+        runs = [boot_once(args.module, env) for _ in range(args.runs)]
+
+    results = {}
+    for phase in PHASES + ("total_ms",):
+        values = sorted(run[phase] for run in runs)
+        results[phase] = {"median": statistics.median(values), "max": values[-1]}
+    over = results["total_ms"]["median"] > args.budget_ms
+
+    if args.json:
+        print(json.dumps({"runs": args.runs, "budget_ms": args.budget_ms, "over_budget": over, "phases": results},
+                         indent=2))
+    else:
+        print(f"{'phase':<12} {'median ms':>10} {'max ms':>10}")
+        for phase, r in results.items():
+            print(f"{phase:<12} {r['median']:>10.1f} {r['max']:>10.1f}")
+        print(f"budget {args.budget_ms:.0f}ms: {'OVER' if over else 'ok'}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
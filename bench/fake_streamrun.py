@@ -0,0 +1,277 @@
+"""Local stand-in for the Streamrun API, for benchmarks and offline testing.
+
+Implements the endpoints the proxy calls, with configurable latency and
+error injection:
+
+    python bench/fake_streamrun.py --port 8081 --latency 0.05 --error-rate 0.01
+
+Point the proxy at it with STREAMRUN_BASE_URL=http://127.0.0.1:8081/api/v1.
+
+With --webhook-url and --webhook-secret it also pushes signed instance
+lifecycle events to the proxy. GET /_webhooks lists the events sent so far
+and POST /_webhooks/replay delivers them all again, freshly signed.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROUTES = [
+    ("GET", re.compile(r"^/api/v1/configurations/([^/]+)$"), "get_configuration"),
+    ("GET", re.compile(r"^/api/v1/configurations/([^/]+)/instances$"), "list_instances"),
+    ("POST", re.compile(r"^/api/v1/configurations/([^/]+)/instances$"), "create_instance"),
+    ("PUT", re.compile(r"^/api/v1/configurations/([^/]+)/instances$"), "set_outputs"),
+    ("GET", re.compile(r"^/api/v1/instances/([^/]+)$"), "get_instance"),
+    ("DELETE", re.compile(r"^/api/v1/instances/([^/]+)$"), "delete_instance"),
+    ("PATCH", re.compile(r"^/api/v1/instances/([^/]+)/overrides$"), "patch_overrides"),
+    ("GET", re.compile(r"^/api/v1/destinations$"), "list_destinations"),
+    ("GET", re.compile(r"^/_webhooks$"), "list_webhooks"),
+    ("POST", re.compile(r"^/_webhooks/replay$"), "replay_webhooks"),
+]
+
+
+def build_elements(count):
+    """A switch plus PC/Mobile/BRB inputs, padded with extra cameras up to count."""
+    elements = [
+        {"id": "switch-1", "title": "Scene Switch", "type": "switch"},
+        {"id": "input-pc", "title": "PC Capture", "type": "rtmp"},
+        {"id": "input-mobile", "title": "Mobile IRL", "type": "srt"},
+        {"id": "input-brb", "title": "BRB Screen", "type": "image"},
+    ]
+    for n in range(len(elements), count):
+        elements.append({"id": f"input-cam-{n}", "title": f"Camera {n}", "type": "srt"})
+    return elements
+
+
+class WebhookSender:
+    """Signs and POSTs lifecycle events in order, keeping every event for replay."""
+
+    def __init__(self, url=None, secret=""):
+        self.url = url
+        self.secret = secret
+        self.events = []
+        self.lock = threading.Lock()
+        self.outbox = queue.Queue()
+        if url:
+            threading.Thread(target=self._deliver, daemon=True).start()
+
+    def emit(self, instance):
+        if not self.url:
+            return
+        with self.lock:
+            event = {
+                "id": f"evt-{len(self.events) + 1}",
+                "type": "instance.updated",
+                "created": time.time(),
+                "data": {"instance": instance},
+            }
+            self.events.append(event)
+        self.outbox.put(event)
+
+    def replay(self):
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            self.outbox.put(event)
+        return len(events)
+
+    def _deliver(self):
+        while True:
+            body = json.dumps(self.outbox.get()).encode()
+            timestamp = str(int(time.time()))
+            signature = hmac.new(self.secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+            request = urllib.request.Request(self.url, data=body, method="POST", headers={
+                "Content-Type": "application/json",
+                "X-Streamrun-Signature": f"t={timestamp},v1={signature}",
+            })
+            try:
+                urllib.request.urlopen(request, timeout=5).read()
+            except OSError:
+                pass
+
+
+class FakeStreamrun:
+    """In-memory Streamrun state shared by all handler threads."""
+
+    def __init__(self, slots=1, start_delay=2.0, elements=4, webhooks=None):
+        self.slots = slots
+        self.start_delay = start_delay
+        self.elements = build_elements(elements)
+        self.instances = []
+        self.outputs = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.webhooks = webhooks or WebhookSender()
+
+    def _state(self, instance):
+        if instance["state"] == "STARTING" and time.time() - instance["_created"] >= self.start_delay:
+            instance["state"] = "RUNNING"
+            self._notify(instance)
+        return instance
+
+    def _notify(self, instance):
+        self.webhooks.emit({k: v for k, v in instance.items() if not k.startswith("_")})
+
+    def _promote(self, instance):
+        with self.lock:
+            self._state(instance)
+
+    def _public(self, instance):
+        return {k: v for k, v in self._state(instance).items() if not k.startswith("_")}
+
+    def get_configuration(self, config_id, body):
+        return 200, {"configuration": {"id": config_id, "elements": self.elements}}
+
+    def list_instances(self, config_id, body):
+        with self.lock:
+            live = [self._public(i) for i in reversed(self.instances)
+                    if i["configurationId"] == config_id and i["state"] != "STOPPED"]
+        return 200, {"instances": live}
+
+    def create_instance(self, config_id, body):
+        # Each configuration has its own slots
+        with self.lock:
+            active = [i for i in self.instances if i["configurationId"] == config_id
+                      and self._state(i)["state"] in ("STARTING", "RUNNING")]
+            if len(active) >= self.slots:
+                return 400, {"error": "Configuration has 0 instance slots available"}
+            self.counter += 1
+            instance = {
+                "id": f"inst-{self.counter}",
+                "configurationId": config_id,
+                "state": "STARTING",
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "overrides": {},
+                "_created": time.time(),
+            }
+            self.instances.append(instance)
+            self._notify(instance)
+            # Push STARTING -> RUNNING even if nobody polls the instance
+            timer = threading.Timer(self.start_delay, self._promote, (instance,))
+            timer.daemon = True
+            timer.start()
+            return 201, {"instances": [self._public(instance)]}
+
+    def set_outputs(self, config_id, body):
+        self.outputs[config_id] = body.get("outputs", self.outputs.get(config_id, "OFFLINE"))
+        return 200, {"outputs": self.outputs[config_id]}
+
+    def _find(self, instance_id):
+        for instance in self.instances:
+            if instance["id"] == instance_id:
+                return instance
+        return None
+
+    def get_instance(self, instance_id, body):
+        with self.lock:
+            instance = self._find(instance_id)
+            if instance is None:
+                return 404, {"error": "Instance not found"}
+            return 200, self._public(instance)
+
+    def delete_instance(self, instance_id, body):
+        with self.lock:
+            instance = self._find(instance_id)
+            if instance is None:
+                return 404, {"error": "Instance not found"}
+            instance["state"] = "STOPPED"
+            self._notify(instance)
+            return 204, None
+
+    def patch_overrides(self, instance_id, body):
+        with self.lock:
+            instance = self._find(instance_id)
+            if instance is None:
+                return 404, {"error": "Instance not found"}
+            instance["overrides"].update(body)
+            return 200, self._public(instance)
+
+    def list_destinations(self, body):
+        return 200, [
+            {"id": "dest-twitch", "name": "Twitch"},
+            {"id": "dest-youtube", "name": "YouTube"},
+        ]
+
+    def list_webhooks(self, body):
+        with self.webhooks.lock:
+            return 200, {"events": list(self.webhooks.events)}
+
+    def replay_webhooks(self, body):
+        return 200, {"replayed": self.webhooks.replay()}
+
+
+def make_handler(fake, latency, jitter, error_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = b"" if payload is None else json.dumps(payload).encode()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            if self.command == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            self.send_response(status)
+            if self.command == "GET" and status in (200, 304):
+                self.send_header("ETag", etag)
+            if body:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            delay = latency + random.uniform(0, jitter)
+            if delay:
+                time.sleep(delay)
+            if error_rate and random.random() < error_rate:
+                return self._send(503, {"error": "Injected failure"})
+            path = self.path.split("?", 1)[0]
+            for method, pattern, name in ROUTES:
+                match = pattern.match(path)
+                if match and method == self.command:
+                    body = json.loads(raw) if raw else {}
+                    return self._send(*getattr(fake, name)(*match.groups(), body))
+            self._send(404, {"error": "Not found"})
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="base delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--start-delay", type=float, default=2.0, help="seconds an instance spends STARTING")
+    parser.add_argument("--elements", type=int, default=4, help="number of configuration elements")
+    parser.add_argument("--slots", type=int, default=1, help="concurrent instance slots per configuration")
+    parser.add_argument("--webhook-url", help="e.g. http://127.0.0.1:5000/api/webhooks/streamrun")
+    parser.add_argument("--webhook-secret", default="", help="must match STREAMRUN_WEBHOOK_SECRET")
+    args = parser.parse_args()
+
+    webhooks = WebhookSender(args.webhook_url, args.webhook_secret)
+    fake = FakeStreamrun(slots=args.slots, start_delay=args.start_delay, elements=args.elements, webhooks=webhooks)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake, args.latency, args.jitter, args.error_rate))
+    server.daemon_threads = True
+    print(f"Fake Streamrun listening on http://{args.host}:{args.port}/api/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Structured logging that never makes a request wait on stdout.
+
+Loggers from get_logger() only capture the record and put it on a bounded
+queue. A single writer thread per process formats each record as a JSON line
+(or plain text), redacts secrets, and writes it to stderr. If the queue is
+full the record is dropped and counted instead of blocking the worker.
+
+Every record carries the id of the request it was logged from, taken from the
+X-Request-ID header or generated when the request arrives.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import metrics
+
+# Minimum level written; DEBUG also shows upstream calls and request bodies
+LEVEL = os.environ.get("STREAMRUN_LOG_LEVEL", "INFO").upper()
+
+# "json" for one object per line, "text" for humans
+FORMAT = os.environ.get("STREAMRUN_LOG_FORMAT", "json")
+
+# Records held for the writer before new ones are dropped
+QUEUE_SIZE = int(os.environ.get("STREAMRUN_LOG_QUEUE_SIZE", "10000"))
+
+
+def parse_sample_rates(text):
+    """Parse "/api/status=0.01,/metrics=0" into {route: fraction logged}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        route, _, rate = item.partition("=")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+# Fraction of successful requests to log per route; errors are always logged
+SAMPLE_RATES = parse_sample_rates(
+    os.environ.get("STREAMRUN_LOG_SAMPLE", "/api/status=0.01,/api/instance-data=0.01,/metrics=0")
+)
+
+DROPPED = metrics.Counter("streamrun_log_records_dropped_total", "Log records dropped because the queue was full")
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+_REQUEST_ID = re.compile(r"^[\w.-]{1,64}$")
+_BEARER = re.compile(r"(Bearer\s+)[^\s\"',}]+")
+_secrets = []
+
+_logger = logging.getLogger("streamrun")
+_queue = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+# ============ FORMATTING ============
+
+def redact(line):
+    """Mask bearer tokens and configured secrets in a rendered log line."""
+    line = _BEARER.sub(r"\1[REDACTED]", line)
+    for secret in _secrets:
+        line = line.replace(secret, "[REDACTED]")
+    return line
+
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        if FORMAT == "text":
+            extras = " ".join(f"{key}={value}" for key, value in fields.items())
+            line = (f"{datetime.fromtimestamp(record.created).strftime('%H:%M:%S.%f')[:-3]} "
+                    f"{record.levelname:<7} [{record.request_id or '-'}] {record.getMessage()} {extras}").rstrip()
+            if record.exc_info:
+                line += "\n" + self.formatException(record.exc_info)
+        else:
+            entry = {
+                "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                "request_id": record.request_id,
+                "pid": record.process,
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            line = json.dumps(entry, default=str)
+        return redact(line)
+
+
+# ============ WRITER ============
+
+def _write_records(records, handler):
+    while True:
+        record = records.get()
+        try:
+            handler.handle(record)
+        except Exception:
+            pass
+        records.task_done()
+
+
+def start_writer():
+    """Start this process's writer thread; cheap once running, redone after fork."""
+    global _queue, _writer_pid
+    pid = os.getpid()
+    if _writer_pid == pid:
+        return
+    with _writer_lock:
+        if _writer_pid == pid:
+            return
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(StructuredFormatter())
+        # A fresh queue: one inherited across fork may hold a lock nobody will release
+        _queue = queue.Queue(QUEUE_SIZE)
+        threading.Thread(target=_write_records, args=(_queue, handler), name="log-writer", daemon=True).start()
+        _writer_pid = pid
+
+
+def configure(secrets=()):
+    """Set the level and the secrets to redact, and start the writer."""
+    _secrets[:] = [secret for secret in secrets if secret]
+    _logger.setLevel(LEVEL)
+    start_writer()
+    atexit.register(flush)
+
+
+def flush(timeout=1.0):
+    """Wait briefly for queued records to be written (for shutdown and scripts)."""
+    records = _queue
+    deadline = time.monotonic() + timeout
+    while records is not None and records.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+# ============ LOGGING API ============
+
+class StructuredLogger:
+    """log.info("message", key=value, ...) with the fields kept structured."""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        record = self._logger.makeRecord(
+            self._logger.name, level, "", 0, msg, None,
+            sys.exc_info() if exc_info else None,
+        )
+        record.fields = fields
+        record.request_id = request_id.get()
+        records = _queue
+        if records is None:
+            return
+        try:
+            records.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(name):
+    return StructuredLogger(f"streamrun.{name}")
+
+
+def bind_request_id(incoming=None):
+    """Use the caller's X-Request-ID if sane, else a new id; returns (id, reset token)."""
+    value = incoming if incoming and _REQUEST_ID.match(incoming) else uuid.uuid4().hex[:16]
+    return value, request_id.set(value)
+
+
+def sampled(route, status):
+    """Whether to write the access log line for a finished request."""
+    if status >= 400:
+        return True
+    rate = SAMPLE_RATES.get(route, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+_access = get_logger("access")
+
+
+def access(method, route, path, status, elapsed):
+    """One line per request, sampled per route."""
+    if sampled(route, status):
+        level = _access.error if status >= 500 else _access.info
+        level("request", method=method, route=route, path=path, status=status,
+              ms=round(elapsed * 1000, 1))
@@ -0,0 +1,233 @@
+"""Opt-in request timing and an on-demand sampling profiler.
+
+With timing on, each request collects the time spent waiting on Streamrun
+and serializing JSON, answers with a Server-Timing header that splits its
+duration into app, upstream and serialize, and is ranked against the
+slowest requests seen so far. A request that enters the slowest N and
+takes at least SLOW_REQUEST_LOG_MS is logged with its upstream calls.
+With timing off, the only cost left is a context variable lookup per
+upstream call.
+
+The sampling profiler runs for a fixed window on a background thread,
+recording every other thread's stack at an interval, and reports the
+result as collapsed stacks (one "frame;frame;frame count" line per stack,
+the input format of flamegraph tools).
+"""
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+import logs
+
+# Server-Timing headers and slow-request tracking; can be flipped at runtime
+TIMING_ENABLED = os.environ.get("STREAMRUN_SERVER_TIMING", "0").lower() in ("1", "true", "yes", "on")
+
+# How many of the slowest requests to keep (and log as they come in)
+SLOW_REQUESTS = int(os.environ.get("STREAMRUN_SLOW_REQUESTS", "10"))
+
+# Requests faster than this (milliseconds) are ranked but never logged, so a
+# half-empty list after startup or a reset does not log every request
+SLOW_REQUEST_LOG_MS = float(os.environ.get("STREAMRUN_SLOW_REQUEST_LOG_MS", "250"))
+
+# Profiler limits: longest window and shortest sampling interval (seconds)
+PROFILE_MAX_SECONDS = 300.0
+PROFILE_MIN_INTERVAL = 0.001
+
+log = logs.get_logger("profiling")
+
+_timing = ContextVar("request_timing", default=None)
+
+_slowest = []  # min-heap of (ms, sequence, entry)
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+# ============ REQUEST TIMING ============
+
+def set_timing(enabled):
+    global TIMING_ENABLED
+    TIMING_ENABLED = enabled
+
+
+def start_request():
+    """Start timing the current request; returns a token for finish_request, or None when off."""
+    if not TIMING_ENABLED:
+        return None
+    return _timing.set({"started": time.perf_counter(), "upstream": 0.0, "serialize": 0.0, "calls": []})
+
+
+def add_upstream(call, elapsed):
+    """Count time spent on an upstream call (or waiting for a shared one)."""
+    timing = _timing.get()
+    if timing is not None:
+        timing["upstream"] += elapsed
+        timing["calls"].append(f"{call} {elapsed * 1000:.1f}ms")
+
+
+def add_serialize(elapsed):
+    timing = _timing.get()
+    if timing is not None:
+        timing["serialize"] += elapsed
+
+
+def finish_request(token, method, route, path, status):
+    """Stop timing; returns the Server-Timing header value.
+
+    Upstream time is summed over all calls, so a batch that ran calls in
+    parallel can report more upstream time than the request took; app time
+    is what remains of the wall-clock duration and never goes below zero.
+    """
+    timing = _timing.get()
+    _timing.reset(token)
+    total = time.perf_counter() - timing["started"]
+    upstream, serialize = timing["upstream"], timing["serialize"]
+    app = max(0.0, total - upstream - serialize)
+    note_request({
+        "method": method,
+        "route": route,
+        "path": path,
+        "status": status,
+        "ms": round(total * 1000, 1),
+        "app_ms": round(app * 1000, 1),
+        "upstream_ms": round(upstream * 1000, 1),
+        "serialize_ms": round(serialize * 1000, 1),
+        "upstream_calls": list(timing["calls"]),
+    })
+    return (
+        f'app;dur={app * 1000:.1f}, '
+        f'upstream;dur={upstream * 1000:.1f};desc="{len(timing["calls"])} calls", '
+        f'serialize;dur={serialize * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+
+def discard_request(token):
+    """Drop the timing of a request that ended without a response."""
+    if token is not None:
+        _timing.reset(token)
+
+
+def note_request(entry):
+    """Keep entry if it is among the SLOW_REQUESTS slowest, and log it if it
+    took at least SLOW_REQUEST_LOG_MS."""
+    if SLOW_REQUESTS <= 0:
+        return
+    item = (entry["ms"], next(_sequence), entry)
+    with _slowest_lock:
+        if len(_slowest) < SLOW_REQUESTS:
+            heapq.heappush(_slowest, item)
+        elif item[0] > _slowest[0][0]:
+            heapq.heapreplace(_slowest, item)
+        else:
+            return
+    if entry["ms"] >= SLOW_REQUEST_LOG_MS:
+        log.warning("Slow request", **entry)
+
+
+def slowest_requests():
+    """The slowest requests kept so far, slowest first."""
+    with _slowest_lock:
+        return [entry for _, _, entry in sorted(_slowest, reverse=True)]
+
+
+def reset_slowest():
+    with _slowest_lock:
+        _slowest.clear()
+
+
+def timing_report():
+    """Plain-text summary for the admin endpoint."""
+    lines = [f"Server-Timing {'on' if TIMING_ENABLED else 'off'}"]
+    for entry in slowest_requests():
+        lines.append(
+            f"{entry['ms']}ms {entry['method']} {entry['path']} {entry['status']} "
+            f"(app {entry['app_ms']}ms, upstream {entry['upstream_ms']}ms, serialize {entry['serialize_ms']}ms)"
+        )
+        lines.extend(f"    {call}" for call in entry["upstream_calls"])
+    return "\n".join(lines)
+
+
+# ============ SAMPLING PROFILER ============
+
+_profile = {
+    "running": False,
+    "started_at": None,
+    "seconds": 0.0,
+    "interval": 0.0,
+    "samples": 0,
+    "stacks": Counter(),
+    "stop": threading.Event(),
+}
+_profile_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _sample(seconds, interval, stop):
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    stacks = Counter()
+    samples = 0
+    while time.monotonic() < deadline and not stop.is_set():
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if ident not in names:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stack.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(stack))] += 1
+        samples += 1
+        stop.wait(interval)
+    with _profile_lock:
+        _profile["stacks"] = stacks
+        _profile["samples"] = samples
+        _profile["running"] = False
+    log.info("Profile finished", samples=samples, stacks=len(stacks))
+
+
+def start_profile(seconds, interval):
+    """Start a profiling window; returns an error message or None."""
+    seconds = min(max(seconds, 0.0), PROFILE_MAX_SECONDS)
+    interval = max(interval, PROFILE_MIN_INTERVAL)
+    with _profile_lock:
+        if _profile["running"]:
+            return "Profiler already running"
+        stop = threading.Event()
+        _profile.update(running=True, started_at=time.time(), seconds=seconds, interval=interval,
+                        samples=0, stacks=Counter(), stop=stop)
+    threading.Thread(target=_sample, args=(seconds, interval, stop), name="profiler", daemon=True).start()
+    log.info("Profile started", seconds=seconds, interval=interval)
+    return None
+
+
+def stop_profile():
+    with _profile_lock:
+        _profile["stop"].set()
+
+
+def profile_report(limit=200):
+    """Status line plus the most sampled collapsed stacks of the last window."""
+    with _profile_lock:
+        profile = dict(_profile)
+    if profile["started_at"] is None:
+        return "No profile yet"
+    if profile["running"]:
+        remaining = profile["started_at"] + profile["seconds"] - time.time()
+        return f"Profiling, {max(0.0, remaining):.0f}s left"
+    lines = [f"{profile['samples']} samples every {profile['interval'] * 1000:.0f}ms "
+             f"over {profile['seconds']:g}s"]
+    lines.extend(f"{stack} {count}" for stack, count in profile["stacks"].most_common(limit))
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+"""Versioned key/value stores for proxy state shared between workers.
+
+Every key holds a JSON-serializable value and a version that goes up on each
+write. Readers remember the versions they have seen and ask for what has
+changed since, so a steady-state check costs almost nothing.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+
+class MemoryStateStore:
+    """Process-local store. The default when running a single worker."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def changed_since(self, versions):
+        """Return {key: (version, value)} for keys whose version differs."""
+        with self._lock:
+            return {
+                key: row for key, row in self._rows.items()
+                if versions.get(key) != row[0]
+            }
+
+    def read(self, keys):
+        """Return {key: (version, value)} for those of keys that exist."""
+        with self._lock:
+            return {key: self._rows[key] for key in keys if key in self._rows}
+
+    def put(self, key, value):
+        """Store value under key and return its new version."""
+        with self._lock:
+            version = self._rows.get(key, (0, None))[0] + 1
+            self._rows[key] = (version, value)
+            return version
+
+
+class SqliteStateStore:
+    """Store backed by a local SQLite database in WAL mode.
+
+    All workers on a host open the same file. Reads first check
+    PRAGMA data_version, which only moves when another connection commits,
+    so an unchanged store costs a single pragma.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL)"
+        )
+
+    def _connect(self):
+        # One connection per thread, reopened after fork
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+            local.pid = os.getpid()
+            local.data_version = None
+        return local.conn
+
+    def changed_since(self, versions):
+        """Return {key: (version, value)} for keys whose version differs."""
+        conn = self._connect()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._local.data_version:
+            return {}
+        self._local.data_version = data_version
+        rows = conn.execute("SELECT key, version, value FROM state").fetchall()
+        return {
+            key: (version, json.loads(value)) for key, version, value in rows
+            if versions.get(key) != version
+        }
+
+    def read(self, keys):
+        """Return {key: (version, value)} for those of keys that exist."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT key, version, value FROM state WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall()
+        return {key: (version, json.loads(value)) for key, version, value in rows}
+
+    def put(self, key, value):
+        """Store value under key and return its new version."""
+        # Plain UPDATE/INSERT/SELECT rather than an upsert with RETURNING,
+        # which needs SQLite 3.35; BEGIN IMMEDIATE keeps the three atomic.
+        conn = self._connect()
+        encoded = json.dumps(value)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute(
+                "UPDATE state SET version = version + 1, value = ? WHERE key = ?", (encoded, key)
+            ).rowcount:
+                conn.execute("INSERT INTO state (key, version, value) VALUES (?, 1, ?)", (key, encoded))
+            version = conn.execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()[0]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return version
+
+
+def open_state_store(kind, path=None):
+    """Build the store named by kind ("memory" or "sqlite")."""
+    if kind == "memory":
+        return MemoryStateStore()
+    if kind == "sqlite":
+        return SqliteStateStore(path)
+    raise ValueError(f"Unknown state store: {kind}")
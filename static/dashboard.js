@@ -0,0 +1,161 @@
+// A dashboard opened under /c/<configuration id>/ controls that configuration;
+// the server redirects /?config=<id> there
+const CONFIG_PREFIX = (window.location.pathname.match(/^\/c\/[^/]+/) || [''])[0];
+const API_BASE = window.location.origin + CONFIG_PREFIX;
+let currentElement = null;
+let eventsConnected = false;
+
+function showMessage(text, type = 'info') {
+    const msg = document.getElementById('message');
+    msg.textContent = text;
+    msg.className = `message show message-${type}`;
+    setTimeout(() => msg.classList.remove('show'), 5000);
+}
+
+function setLoading(show) {
+    document.getElementById('loading').classList.toggle('show', show);
+}
+
+function renderInstanceData(data, stale = false) {
+    document.getElementById('instanceId').textContent = data.id || 'None';
+    document.getElementById('instanceState').textContent = (data.state || 'UNKNOWN') + (stale ? ' (stale)' : '');
+    document.getElementById('instanceTime').textContent = data.started_at || '—';
+
+    const statusBadge = document.getElementById('streamStatus');
+    const state = (data.state || 'UNKNOWN').toLowerCase();
+    statusBadge.className = `status-badge ${state === 'running' || state === 'queued' ? 'online' : 'offline'}`;
+    statusBadge.textContent = data.state || 'UNKNOWN';
+}
+
+function refreshInstanceData() {
+    fetch(`${API_BASE}/api/instance-data`)
+        .then(r => r.json().then(data => renderInstanceData(data, r.headers.get('X-Streamrun-Stale') === '1')))
+        .catch(e => console.error('Error refreshing:', e));
+}
+
+function markActiveElement(elementId, status = 'confirmed') {
+    currentElement = elementId;
+    document.querySelectorAll('#elementButtons .btn-element').forEach(btn => {
+        const active = btn.getAttribute('data-element-id') === elementId;
+        btn.classList.toggle('active', active);
+        btn.classList.toggle('pending', active && status === 'pending');
+    });
+}
+
+function applySwitchEvent(data) {
+    markActiveElement(data.element_id, data.status);
+    if (data.status === 'failed') {
+        showMessage('Switch failed, rolled back', 'error');
+    }
+}
+
+function renderElements(data) {
+    const container = document.getElementById('elementButtons');
+    container.innerHTML = '';
+
+    Object.keys(data).forEach(cat => {
+        if (data[cat] && data[cat].id) {
+            const btn = document.createElement('button');
+            btn.className = 'btn btn-element';
+            btn.setAttribute('data-element-id', data[cat].id);
+            btn.innerHTML = `📺 ${cat}<span class="element-name">${data[cat].name}</span>`;
+            btn.onclick = () => switchElementTo(data[cat].id, btn);
+            container.appendChild(btn);
+        }
+    });
+    markActiveElement(currentElement);
+}
+
+function loadElements() {
+    fetch(`${API_BASE}/api/elements-categorized`)
+        .then(r => r.json())
+        .then(renderElements)
+        .catch(e => console.error('Error loading elements:', e));
+}
+
+// Server push; while it is down the dashboard falls back to polling. A server
+// that cannot hold streams open answers 503, which closes the EventSource for
+// good instead of reconnecting.
+function connectEvents() {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource(`${API_BASE}/api/events`);
+    source.onopen = () => { eventsConnected = true; };
+    source.onerror = () => { eventsConnected = false; };
+    source.addEventListener('instance', e => renderInstanceData(JSON.parse(e.data)));
+    source.addEventListener('elements', e => renderElements(JSON.parse(e.data)));
+    source.addEventListener('switch', e => applySwitchEvent(JSON.parse(e.data)));
+}
+
+function callAPI(endpoint, params = '') {
+    setLoading(true);
+    const url = `${API_BASE}${endpoint}${params}`;
+    fetch(url)
+        .then(r => r.text())
+        .then(text => {
+            showMessage(text, 'success');
+            setLoading(false);
+            if (!eventsConnected) {
+                setTimeout(refreshInstanceData, 1000);
+            }
+        })
+        .catch(e => {
+            showMessage('Error: ' + e.message, 'error');
+            setLoading(false);
+        });
+}
+
+function goLive() {
+    callAPI('/api/golive');
+}
+
+function stopInstance() {
+    if (confirm('Stop stream instance?')) {
+        callAPI('/api/stop');
+    }
+}
+
+function toggleLive() {
+    callAPI('/api/outputs?state=LIVE');
+}
+
+function toggleOffline() {
+    callAPI('/api/outputs?state=OFFLINE');
+}
+
+function switchElementTo(elementId, btnElement) {
+    // With live events the switch is optimistic: the button turns pending at
+    // once and the 'switch' event confirms it or rolls it back
+    const optimistic = eventsConnected;
+    setLoading(!optimistic);
+    if (optimistic) {
+        markActiveElement(elementId, 'pending');
+    }
+    const mode = optimistic ? 'optimistic' : 'blocking';
+    const url = `${API_BASE}/api/switch-element?element_id=${encodeURIComponent(elementId)}&mode=${mode}`;
+    fetch(url)
+        .then(r => r.text())
+        .then(text => {
+            showMessage(text, 'success');
+            if (!optimistic) {
+                markActiveElement(elementId);
+            }
+            setLoading(false);
+        })
+        .catch(e => {
+            showMessage('Error: ' + e.message, 'error');
+            setLoading(false);
+        });
+}
+
+function refreshStatus() {
+    refreshInstanceData();
+    loadElements();
+    showMessage('Status refreshed', 'info');
+}
+
+// Load on startup
+refreshInstanceData();
+loadElements();
+connectEvents();
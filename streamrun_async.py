@@ -0,0 +1,750 @@
+"""Asyncio serving mode for the Streamrun proxy.
+
+Exposes the same routes and plain-text/JSON responses as the Flask app in
+streamrun_proxy.py, but waits on streamrun.com with a non-blocking aiohttp
+client so one process can hold hundreds of slow upstream calls at once.
+With a shared state store (STREAMRUN_STATE_STORE=sqlite) store reads and
+writes run on a thread pool so a busy database never stalls the loop.
+
+Run it directly:
+    python streamrun_async.py
+or under gunicorn:
+    gunicorn streamrun_async:app --worker-class aiohttp.GunicornWebWorker
+
+The aiohttp worker does not tell the app how many workers there are, so
+"auto" means the in-memory store here. Set STREAMRUN_STATE_STORE=sqlite
+when running more than one.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+import logs
+import metrics
+import profiling
+import streamrun_proxy as proxy
+
+# Verbs that are safe to send again after a failure
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+session_key = web.AppKey("session", aiohttp.ClientSession)
+flights_key = web.AppKey("flights", dict)
+poller_key = web.AppKey("poller", asyncio.Task)
+switch_locks_key = web.AppKey("switch_locks", dict)
+switch_tasks_key = web.AppKey("switch_tasks", set)
+status_wakeup_key = web.AppKey("status_wakeup", asyncio.Event)
+
+log = logs.get_logger("async")
+
+
+# ============ STATE STORE ============
+# Proxy calls that read or write the shared state store (syncing, loading a
+# configuration, set_instance, set_active_input, ...) block. A SQLite write
+# can wait up to its busy timeout on another worker, so with a shared store
+# they run on the default executor, in the caller's configuration context.
+# The in-memory store never waits and is called inline.
+
+async def store_call(fn, *args):
+    """Run a proxy call that touches the state store without blocking the loop."""
+    if proxy.STATE_STORE_KIND == "memory":
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, context.run, fn, *args)
+
+
+# ============ UPSTREAM CLIENT ============
+
+async def upstream(app, method, path, **kwargs):
+    """Call the Streamrun API and return (status, body text)."""
+    status, text, _ = await upstream_response(app, method, path, **kwargs)
+    return status, text
+
+
+async def acquire_upstream_token(method):
+    name, bucket = proxy.upstream_bucket(method)
+    deadline = time.monotonic() + proxy.throttle_wait(method)
+    while True:
+        wait = proxy.take_token(bucket)
+        if wait == 0:
+            return
+        if time.monotonic() + wait > deadline:
+            proxy.THROTTLED.inc(name)
+            raise proxy.UpstreamThrottled(f"Too many Streamrun API calls, try again in {wait:.1f}s")
+        await asyncio.sleep(wait)
+
+
+async def upstream_response(app, method, path, **kwargs):
+    """Call the Streamrun API and return (status, body text, headers)."""
+    url = f"{proxy.BASE_URL}{path}"
+    endpoint = proxy.endpoint_name(path)
+    attempts = proxy.UPSTREAM_RETRIES + 1 if method in IDEMPOTENT_METHODS else 1
+    proxy.circuit_allow(endpoint)
+    await acquire_upstream_token(method)
+    proxy.UPSTREAM_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                async with app[session_key].request(method, url, **kwargs) as r:
+                    text = await r.text()
+                    if r.status not in RETRY_STATUSES or last:
+                        elapsed = time.perf_counter() - started
+                        proxy.UPSTREAM_LATENCY.observe(elapsed, method, endpoint)
+                        proxy.UPSTREAM_RESPONSES.inc(method, endpoint, r.status)
+                        profiling.add_upstream(f"{method} {endpoint} {r.status}", elapsed)
+                        proxy.circuit_record(endpoint, proxy.upstream_healthy(r.status))
+                        log.debug("Upstream call", method=method, path=path, status=r.status,
+                                  ms=round(elapsed * 1000, 1))
+                        return r.status, text, r.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last:
+                    elapsed = time.perf_counter() - started
+                    proxy.UPSTREAM_LATENCY.observe(elapsed, method, endpoint)
+                    proxy.UPSTREAM_RESPONSES.inc(method, endpoint, "error")
+                    profiling.add_upstream(f"{method} {endpoint} error", elapsed)
+                    proxy.circuit_record(endpoint, False)
+                    log.warning("Upstream call failed", method=method, path=path,
+                                ms=round(elapsed * 1000, 1), error=str(e))
+                    raise
+            await asyncio.sleep(proxy.UPSTREAM_RETRY_BACKOFF * (2 ** attempt))
+    finally:
+        proxy.UPSTREAM_IN_FLIGHT.dec()
+
+
+async def single_flight(app, key, make_coro):
+    """Await one shared task per key; concurrent callers get its result or error."""
+    flights = app[flights_key]
+    task = flights.get(key)
+    proxy.CACHE_REQUESTS.inc("singleflight", "leader" if task is None else "shared")
+    if task is None:
+        task = asyncio.ensure_future(make_coro())
+        flights[key] = task
+        task.add_done_callback(lambda _: flights.pop(key, None))
+        return await asyncio.shield(task)
+    started = time.perf_counter()
+    try:
+        return await asyncio.shield(task)
+    finally:
+        # Time spent riding on another caller's upstream call
+        profiling.add_upstream(f"shared {key[0]}", time.perf_counter() - started)
+
+
+async def upstream_get(app, path):
+    """Coalesced GET: concurrent callers for the same path share one request."""
+    return await single_flight(app, ("GET", path), lambda: upstream(app, "GET", path))
+
+
+async def cached_get(app, path, max_age=proxy.RESPONSE_CACHE_TTL):
+    """GET through the proxy's response cache, revalidating once max_age has passed."""
+    entry = proxy.cache_entry(path)
+    if proxy.is_fresh(entry, max_age):
+        proxy.CACHE_REQUESTS.inc("response", "hit")
+        return entry
+
+    async def fetch():
+        try:
+            status, body, headers = await upstream_response(
+                app, "GET", path, headers=proxy.conditional_headers(entry)
+            )
+        except proxy.UpstreamUnavailable as e:
+            if entry is None:
+                raise
+            throttled = isinstance(e, proxy.UpstreamThrottled)
+            proxy.CACHE_REQUESTS.inc("response", "throttled" if throttled else "circuit_open")
+            return proxy.stale_entry(entry)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if entry is None or not entry["ok"]:
+                raise
+            proxy.CACHE_REQUESTS.inc("response", "upstream_error")
+            return proxy.stale_entry(entry)
+        if not proxy.upstream_healthy(status) and entry is not None and entry["ok"]:
+            proxy.CACHE_REQUESTS.inc("response", "upstream_error")
+            return proxy.stale_entry(entry)
+        return proxy.cache_response(path, entry, status, headers, lambda: json.loads(body))
+
+    return await single_flight(app, ("cached", path), fetch)
+
+
+def ok(status):
+    return 200 <= status < 400
+
+
+# ============ BACKGROUND WORK ============
+
+async def refresh_instance_state(app):
+    instance_id = proxy.current_configuration()["instance"]["id"]
+    if not instance_id:
+        return None
+    try:
+        status, text = await upstream_get(app, f"/instances/{instance_id}")
+        error = None if ok(status) else f"Error {status}"
+        state = json.loads(text).get("state", "UNKNOWN") if ok(status) else None
+    except proxy.UpstreamUnavailable:
+        # Throttled or circuit open: keep reporting the last known state
+        error, state = None, None
+    except Exception as e:
+        log.warning("Error refreshing instance state", instance_id=instance_id, error=str(e))
+        error, state = f"Error: {str(e)}", None
+    await store_call(proxy.record_instance_state, instance_id, state, error)
+    return state
+
+
+def request_status_refresh(app):
+    """Ask the poller to refresh the current configuration's instance soon."""
+    proxy.current_configuration()["status_requested"] = True
+    app[status_wakeup_key].set()
+
+
+async def status_poller(app):
+    wakeup = app[status_wakeup_key]
+    while True:
+        try:
+            await asyncio.wait_for(wakeup.wait(), proxy.next_status_poll())
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        await store_call(proxy.sync_shared_state)
+        proxy.evict_idle_configurations()
+        for state in proxy.configurations():
+            with proxy.using_configuration(state):
+                if proxy.status_poll_due():
+                    await refresh_instance_state(app)
+
+
+async def on_startup(app):
+    logs.start_writer()
+    proxy.ensure_startup_fetch()
+    proxy.ensure_config_refresher()
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=proxy.UPSTREAM_CONNECT_TIMEOUT,
+        sock_read=proxy.UPSTREAM_READ_TIMEOUT,
+    )
+    connector = aiohttp.TCPConnector(limit=proxy.UPSTREAM_POOL_SIZE * 10, keepalive_timeout=60)
+    app[session_key] = aiohttp.ClientSession(headers=proxy.HEADERS, timeout=timeout, connector=connector)
+    app[flights_key] = {}
+    app[status_wakeup_key] = asyncio.Event()
+    app[poller_key] = asyncio.create_task(status_poller(app))
+    app[switch_locks_key] = {}
+    app[switch_tasks_key] = set()
+
+
+async def on_cleanup(app):
+    app[poller_key].cancel()
+    await app[session_key].close()
+
+
+# ============ ROUTES ============
+
+def text(body, status=200):
+    return web.Response(text=body, status=status, content_type="text/html")
+
+
+def json_response(data, status=200):
+    started = time.perf_counter()
+    body = json.dumps(data)
+    profiling.add_serialize(time.perf_counter() - started)
+    return web.Response(text=body, status=status, content_type="application/json")
+
+
+def serve_asset(request, path):
+    asset = proxy.static_assets.get(path)
+    if asset is None:
+        return text("Not found", status=404)
+    status, headers, body = proxy.negotiate_asset(
+        asset,
+        request.headers.get("Accept-Encoding", ""),
+        request.headers.get("If-None-Match", "")
+    )
+    return web.Response(body=body, status=status, headers=headers)
+
+
+async def dashboard(request):
+    if "config" in request.query and "config_id" not in request.match_info:
+        raise web.HTTPFound(proxy.dashboard_location(proxy.configuration_id()))
+    return serve_asset(request, "/")
+
+
+async def dashboard_asset(request):
+    return serve_asset(request, f"/assets/{request.match_info['name']}")
+
+
+def serve_state(request, kind):
+    status, headers, body = proxy.negotiate_state(kind, request.headers.get("If-None-Match", ""))
+    return web.Response(body=body, status=status, headers=headers)
+
+
+async def instance_data(request):
+    if proxy.current_configuration()["instance"]["id"] and proxy.status_age() > proxy.STATUS_MAX_AGE:
+        request_status_refresh(request.app)
+    return serve_state(request, "instance")
+
+
+async def get_elements_categorized(request):
+    return serve_state(request, "elements")
+
+
+async def api_events(request):
+    if not proxy.events_supported(True):
+        return text("Server-Sent Events are turned off", status=503)
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(maxsize=proxy.EVENTS_QUEUE_SIZE)
+
+    def offer(message):
+        try:
+            messages.put_nowait(message)
+        except asyncio.QueueFull:
+            proxy.unsubscribe_events(deliver)
+
+    def deliver(message):
+        # Events can be published from other threads
+        loop.call_soon_threadsafe(offer, message)
+
+    response = web.StreamResponse(headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.content_type = "text/event-stream"
+    await response.prepare(request)
+    proxy.subscribe_events(deliver)
+    try:
+        await response.write(proxy.initial_events().encode())
+        last_sent = time.monotonic()
+        while proxy.is_subscribed(deliver):
+            try:
+                message = await asyncio.wait_for(messages.get(), proxy.EVENTS_SYNC_INTERVAL)
+            except asyncio.TimeoutError:
+                # Pick up changes made by other workers
+                await store_call(proxy.sync_shared_state)
+                if time.monotonic() - last_sent < proxy.EVENTS_HEARTBEAT:
+                    continue
+                message = ": keep-alive\n\n"
+            await response.write(message.encode())
+            last_sent = time.monotonic()
+    finally:
+        proxy.unsubscribe_events(deliver)
+    return response
+
+
+async def api_status(request):
+    try:
+        if not proxy.current_configuration()["instance"]["id"]:
+            return text("No active instance. Go live first.")
+        if proxy.status_age() > proxy.STATUS_MAX_AGE:
+            refresh = asyncio.ensure_future(refresh_instance_state(request.app))
+            try:
+                await asyncio.wait_for(asyncio.shield(refresh), proxy.STATUS_REVALIDATE_TIMEOUT)
+                proxy.CACHE_REQUESTS.inc("status", "refreshed")
+            except asyncio.TimeoutError:
+                proxy.CACHE_REQUESTS.inc("status", "stale")
+        else:
+            proxy.CACHE_REQUESTS.inc("status", "hit")
+        return text(proxy.status_answer())
+    except Exception as e:
+        log.error("Error in api_status", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def start_instance(app):
+    known = proxy.known_active_instance()
+    if known:
+        return known
+
+    path = f"/configurations/{proxy.configuration_id()}/instances"
+    status, body = await upstream(app, "POST", path, json=proxy.golive_body())
+
+    if status == 400:
+        error_text = body.lower()
+        if "0 instance slots" in error_text or "no available slots" in error_text:
+            log.info("Instance already running (no slots available)")
+            # The registry usually knows which one; list only when it does not
+            inst = proxy.trusted_active_instance()
+            if inst is None:
+                try:
+                    status, body = await upstream_get(app, path)
+                    if ok(status):
+                        proxy.record_instance_list(json.loads(body).get("instances", []))
+                except proxy.UpstreamUnavailable:
+                    # Throttled or circuit open: go with what the registry has
+                    pass
+                inst = proxy.active_instance()
+            if inst:
+                return await store_call(proxy.adopt_running_instance, inst)
+            return "Instance already running"
+        return f"Error: {body}"
+
+    if not ok(status):
+        log.warning("Upstream error", status=status, body=body)
+        return f"Error {status}: {body}"
+
+    try:
+        if await store_call(proxy.record_created_instance, json.loads(body)):
+            return "Starting stream"
+    except ValueError:
+        pass
+
+    try:
+        status, body = await upstream_get(app, path)
+    except proxy.UpstreamUnavailable:
+        # The instance was created; the poller and webhooks will name it
+        return "Stream starting"
+    if ok(status):
+        proxy.record_instance_list(json.loads(body).get("instances", []))
+        if await store_call(proxy.adopt_newest_instance):
+            return "Starting stream"
+    return "Stream starting"
+
+
+async def api_golive(request):
+    app = request.app
+    try:
+        key = request.headers.get("Idempotency-Key") or request.query.get("key")
+        if key:
+            remembered = proxy.idempotent_result(key)
+            if remembered is not None:
+                return text(remembered)
+        result = await single_flight(app, ("golive", proxy.configuration_id()), lambda: start_instance(app))
+        if key:
+            proxy.remember_result(key, result)
+        return text(result)
+    except Exception as e:
+        log.error("Error in api_golive", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def stop_instance(app):
+    instance_id = proxy.current_configuration()["instance"]["id"]
+    if not instance_id:
+        return "No active instance"
+    status, body = await upstream(app, "DELETE", f"/instances/{instance_id}")
+    if status in (200, 204):
+        await store_call(proxy.set_instance, None, "STOPPED")
+        return "Stream stopped"
+    return f"Error {status}: {body}"
+
+
+async def api_stop(request):
+    try:
+        return text(await stop_instance(request.app))
+    except Exception as e:
+        log.error("Error in api_stop", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def set_outputs(app, state):
+    state = state.upper()
+    if state not in ("LIVE", "OFFLINE"):
+        return "Invalid state"
+    if not proxy.current_configuration()["instance"]["id"]:
+        return "No active instance. Start stream first."
+    path = f"/configurations/{proxy.configuration_id()}/instances"
+    status, body = await upstream(app, "PUT", path, json={"outputs": state})
+    if not ok(status):
+        log.warning("Upstream error", status=status, body=body)
+        return f"Error {status}: {body}"
+    return f"Outputs {state}"
+
+
+async def api_outputs(request):
+    try:
+        return text(await set_outputs(request.app, request.query.get("state", "LIVE")))
+    except Exception as e:
+        log.error("Error in api_outputs", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def patch_switch(app, instance_id, element_id):
+    path = f"/instances/{instance_id}/overrides"
+    status, resp = await upstream(app, "PATCH", path, json=proxy.switch_body(element_id))
+    if not ok(status):
+        log.warning("Upstream error", status=status, body=resp)
+        return f"Error {status}: {resp}"
+    return None
+
+
+async def switch_element(app, ref):
+    started = time.perf_counter()
+    element_id, problem = proxy.check_switch(ref)
+    if problem:
+        return problem
+    error = await patch_switch(app, proxy.current_configuration()["instance"]["id"], element_id)
+    proxy.SWITCH_LATENCY.observe(time.perf_counter() - started, "blocking", "failed" if error else "confirmed")
+    if error:
+        return error
+    await store_call(proxy.set_active_input, element_id)
+    return "Switched to element"
+
+
+async def send_switch(app, op_id, instance_id, element_id):
+    # One PATCH at a time per configuration, in request order, like the Flask
+    # switch threads
+    lock = app[switch_locks_key].setdefault(proxy.configuration_id(), asyncio.Lock())
+    async with lock:
+        if proxy.switch_superseded(op_id):
+            await store_call(proxy.finish_switch, op_id, "superseded")
+            return
+        try:
+            error = await patch_switch(app, instance_id, element_id)
+        except Exception as e:
+            error = f"Error: {str(e)}"
+        await store_call(proxy.finish_switch, op_id, "failed" if error else "confirmed", error)
+
+
+async def switch_element_optimistic(app, ref):
+    element_id, problem = proxy.check_switch(ref)
+    if problem:
+        return problem
+    op_id = await store_call(proxy.begin_switch, element_id)
+    instance_id = proxy.current_configuration()["instance"]["id"]
+    task = asyncio.create_task(send_switch(app, op_id, instance_id, element_id))
+    app[switch_tasks_key].add(task)
+    task.add_done_callback(app[switch_tasks_key].discard)
+    return f"Switching to element (op {op_id})"
+
+
+async def api_switch_element(request):
+    try:
+        element_id = request.query.get("element_id")
+        if request.query.get("mode", proxy.SWITCH_MODE) == "optimistic":
+            return text(await switch_element_optimistic(request.app, element_id))
+        return text(await switch_element(request.app, element_id))
+    except Exception as e:
+        log.error("Error in api_switch_element", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+# Operation name -> coroutine function taking (app, argument or nothing)
+BATCH_OPERATIONS = {
+    "golive": lambda app: single_flight(app, ("golive", proxy.configuration_id()), lambda: start_instance(app)),
+    "stop": stop_instance,
+    "outputs": set_outputs,
+    "switch-element": switch_element,
+}
+
+
+async def run_batch(app, operations):
+    """Run parsed operations, each as soon as its dependencies succeed."""
+    tasks = {}
+
+    async def run(operation):
+        dependencies = {dep: await tasks[dep] for dep in operation["after"]}
+        if not all(result["ok"] for result in dependencies.values()):
+            return proxy.skipped_result(operation, dependencies)
+        started = time.perf_counter()
+        handler = BATCH_OPERATIONS[operation["op"]]
+        try:
+            if proxy.BATCH_OPERATIONS[operation["op"]][1]:
+                result = await handler(app, operation["arg"])
+            else:
+                result = await handler(app)
+        except Exception as e:
+            log.error("Error in batch operation", op=operation["op"], error=str(e))
+            result = f"Error: {str(e)}"
+        return proxy.batch_result(operation, result, started)
+
+    for operation in operations:
+        tasks[operation["id"]] = asyncio.ensure_future(run(operation))
+    return await asyncio.gather(*tasks.values())
+
+
+async def api_batch(request):
+    body = None
+    if request.method == "POST" and request.can_read_body:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+    as_json = body is not None or request.query.get("format") == "json"
+    try:
+        if body is not None:
+            operations = proxy.parse_batch(body.get("operations") if isinstance(body, dict) else body)
+        else:
+            operations = proxy.parse_batch(proxy.parse_batch_query(request.query.get("ops", "")))
+    except ValueError as e:
+        message = f"Invalid batch: {e}"
+        return json_response({"ok": False, "error": message}, status=400) if as_json else text(message)
+
+    try:
+        results = await run_batch(request.app, operations)
+    except Exception as e:
+        log.error("Error in api_batch", error=str(e))
+        return text(f"Error: {str(e)}")
+    if as_json:
+        return json_response({"ok": all(r["ok"] for r in results), "results": results})
+    return text(proxy.batch_text(results))
+
+
+async def api_destinations(request):
+    try:
+        entry = await cached_get(request.app, "/destinations")
+        if not entry["ok"]:
+            return text(f"Error {entry['status']}")
+        body = proxy.memoized(entry, "text", lambda: proxy.format_destinations(entry["data"]))
+        return text(f"{body} (stale)" if entry.get("stale") else body)
+    except Exception as e:
+        log.error("Error in api_destinations", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def api_switch_status(request):
+    return text(proxy.switch_op_status(request.query.get("op")))
+
+
+async def api_refresh_config(request):
+    try:
+        # The configuration fetch goes through the blocking client shared with the refresher thread
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return text(await loop.run_in_executor(None, context.run, proxy.refresh_configuration))
+    except Exception as e:
+        log.error("Error in api_refresh_config", error=str(e))
+        return text(f"Error: {str(e)}")
+
+
+async def api_webhook(request):
+    body = await request.read()
+    status, message = await store_call(proxy.handle_webhook, body, request.headers.get("X-Streamrun-Signature"))
+    return text(message, status)
+
+
+async def admin_timing(request):
+    status, message = proxy.admin_timing(request.query, request.headers)
+    return text(message, status)
+
+
+async def admin_profile(request):
+    status, message = proxy.admin_profile(request.query, request.headers)
+    return text(message, status)
+
+
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+# Dashboard and API routes are also served under this prefix
+CONFIGURATION_PREFIX = "/c/{config_id}"
+
+
+def route_name(request):
+    """The route a request matched, with any /c/{config_id} prefix dropped."""
+    resource = request.match_info.route.resource
+    return resource.canonical.removeprefix(CONFIGURATION_PREFIX) if resource is not None else "unmatched"
+
+
+@web.middleware
+async def record_request(request, handler):
+    route = route_name(request)
+    proxy.REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    request_id, token = logs.bind_request_id(request.headers.get("X-Request-ID"))
+    timing_token = profiling.start_request()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        if not response.prepared:
+            response.headers["X-Request-ID"] = request_id
+            if timing_token is not None:
+                response.headers["Server-Timing"] = profiling.finish_request(
+                    timing_token, request.method, route, request.path, status)
+                timing_token = None
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        proxy.REQUESTS_IN_FLIGHT.dec()
+        proxy.REQUEST_LATENCY.observe(elapsed, route)
+        proxy.REQUESTS.inc(route, status)
+        logs.access(request.method, route, request.path, status, elapsed)
+        profiling.discard_request(timing_token)
+        logs.request_id.reset(token)
+
+
+# Routes that change the stream and are subject to per-caller cooldowns
+COOLDOWN_ROUTES = ("/api/golive", "/api/stop", "/api/outputs", "/api/switch-element", "/api/batch")
+
+
+@web.middleware
+async def select_configuration(request, handler):
+    config_id = request.match_info.get("config_id") or request.query.get("config") or proxy.CONFIGURATION_ID
+    state = await store_call(proxy.get_configuration, config_id)
+    if state is None:
+        return text("Unknown configuration", status=404)
+    with proxy.using_configuration(state):
+        return await handler(request)
+
+
+@web.middleware
+async def caller_cooldown(request, handler):
+    route = route_name(request)
+    if route in COOLDOWN_ROUTES:
+        remaining = proxy.cooldown_remaining(route, proxy.caller_key(request.query, request.headers))
+        if remaining:
+            return text(f"Cooldown: try again in {remaining:.0f}s")
+    return await handler(request)
+
+
+@web.middleware
+async def handle_500(request, handler):
+    try:
+        await store_call(proxy.sync_shared_state)
+        return await handler(request)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        log.error("500 Error", error=str(e))
+        return text(f"Server Error: {str(e)}", status=500)
+
+
+ROUTES = [
+    ("GET", "/", dashboard),
+    ("GET", "/assets/{name}", dashboard_asset),
+    ("GET", "/api/instance-data", instance_data),
+    ("GET", "/api/elements-categorized", get_elements_categorized),
+    ("GET", "/api/events", api_events),
+    ("GET", "/api/status", api_status),
+    ("GET", "/api/golive", api_golive),
+    ("GET", "/api/stop", api_stop),
+    ("GET", "/api/outputs", api_outputs),
+    ("GET", "/api/switch-element", api_switch_element),
+    ("GET", "/api/batch", api_batch),
+    ("POST", "/api/batch", api_batch),
+    ("GET", "/api/destinations", api_destinations),
+    ("GET", "/api/switch-status", api_switch_status),
+    ("GET", "/api/refresh-config", api_refresh_config),
+    ("POST", "/api/webhooks/streamrun", api_webhook),
+    ("GET", "/admin/timing", admin_timing),
+    ("POST", "/admin/timing", admin_timing),
+    ("GET", "/admin/profile", admin_profile),
+    ("POST", "/admin/profile", admin_profile),
+    ("GET", "/metrics", metrics_endpoint),
+]
+
+
+def build_app():
+    """Build the aiohttp application with the proxy routes."""
+    proxy.resolve_state_store(multiprocess=False)
+    proxy.preload()
+    app = web.Application(middlewares=[record_request, select_configuration, handle_500, caller_cooldown])
+    for method, path, handler in ROUTES:
+        add = app.router.add_get if method == "GET" else app.router.add_post
+        add(path, handler)
+        # Same dashboard and API for another configuration under /c/{config_id}/
+        if (path == "/" or path.startswith("/api/")) and handler is not api_webhook:
+            add(CONFIGURATION_PREFIX + path, handler)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+app = build_app()
+
+
+if __name__ == "__main__":
+    web.run_app(app, host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
@@ -1,815 +1,3008 @@
-from flask import Flask, request, jsonify
+"""Flask proxy between StreamElements chat commands and the Streamrun API.
+
+Plain-text /api/ routes start and stop the stream, toggle outputs and switch
+inputs; the dashboard at / drives the same routes. Run it under gunicorn:
+
+    STREAMRUN_STATE_STORE=sqlite gunicorn -w 4 --threads 8 --preload streamrun_proxy:app
+
+Workers share instance and element state through the store named by
+STREAMRUN_STATE_STORE. The default, "auto", uses SQLite whenever gunicorn
+runs more than one worker and memory otherwise.
+
+The dashboard and overlays follow changes over /api/events (Server-Sent
+Events), and every open stream holds a worker thread for as long as it is
+open. Under the default sync worker that is the worker's only thread, so
+/api/events answers 503 there and clients keep polling. Use a threaded
+(--threads N) or gevent worker, or streamrun_async, to serve it; see
+STREAMRUN_EVENTS to override the check.
+"""
+import time
+_boot_started = time.perf_counter()
+
+from flask import Blueprint, Flask, current_app, request, jsonify, g, redirect
+from flask.json.provider import DefaultJSONProvider
 import os
+import threading
+import tempfile
+import re
+import queue
+import hashlib
+import hmac
+import gzip
+import gc
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote
 from datetime import datetime
 import json
+import uuid
+import bisect
+import itertools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from state_store import open_state_store
+import metrics
+import logs
+import profiling
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, counting serialization time for Server-Timing."""
 
-app = Flask(__name__)
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            profiling.add_serialize(time.perf_counter() - started)
+
+
+# Routes and request hooks; create_app() mounts them on a Flask app
+routes = Blueprint("streamrun", __name__)
 
 STREAMRUN_API_KEY = os.environ.get("STREAMRUN_API_KEY", "Qcd3vB4x85XSTuw683O9CaYXC6DU17sgDjamzmrgxks")
 CONFIGURATION_ID = os.environ.get("STREAMRUN_CONFIGURATION_ID", "cmk8ofbmy005npb01zxi6yzec")
 
-BASE_URL = "https://streamrun.com/api/v1"
+# Other configurations requests may select with /c/<id>/... or ?config=<id>,
+# comma-separated; empty serves only CONFIGURATION_ID. Each one loaded costs
+# an upstream read and a snapshot file, so this is never open-ended.
+CONFIGURATION_IDS = set(filter(None, (
+    part.strip() for part in os.environ.get("STREAMRUN_CONFIGURATION_IDS", "").split(",")
+)))
+
+# Configurations kept loaded per worker, and seconds one may go unused before
+# it is dropped (0 keeps them until the LRU is full); CONFIGURATION_ID stays
+MAX_CONFIGURATIONS = max(1, int(os.environ.get("STREAMRUN_MAX_CONFIGURATIONS", "32")))
+CONFIGURATION_IDLE_TTL = float(os.environ.get("STREAMRUN_CONFIGURATION_IDLE_TTL", "3600"))
+
+BASE_URL = os.environ.get("STREAMRUN_BASE_URL", "https://streamrun.com/api/v1").rstrip("/")
 HEADERS = {
     "Authorization": f"Bearer {STREAMRUN_API_KEY}",
     "Content-Type": "application/json"
 }
 
-# Store current instance ID in memory
-current_instance = {
-    "id": None,
-    "started_at": None,
-    "state": "UNKNOWN"
-}
+# Bearer token for the /admin/ endpoints (timing, profiler); unset disables them
+ADMIN_TOKEN = os.environ.get("STREAMRUN_ADMIN_TOKEN", "")
 
-# Cache elements with categories
-elements_cache = {
-    "PC": None,
-    "Mobile": None,
-    "BRB Screen": None
-}
+# Structured logs go through a background writer; secrets are never written
+log = logs.get_logger("proxy")
+logs.configure(secrets=[STREAMRUN_API_KEY, ADMIN_TOKEN])
+
+# Upstream client tuning
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("STREAMRUN_CONNECT_TIMEOUT", "3.05"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("STREAMRUN_READ_TIMEOUT", "10"))
+UPSTREAM_RETRIES = int(os.environ.get("STREAMRUN_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.environ.get("STREAMRUN_RETRY_BACKOFF", "0.3"))
+UPSTREAM_POOL_SIZE = int(os.environ.get("STREAMRUN_POOL_SIZE", "10"))
+
+# Upstream token buckets per worker (calls per second, burst). Mutating calls
+# wait up to UPSTREAM_THROTTLE_WAIT for a token; reads fall back to cached data.
+UPSTREAM_READ_RATE = float(os.environ.get("STREAMRUN_READ_RATE", "5"))
+UPSTREAM_READ_BURST = float(os.environ.get("STREAMRUN_READ_BURST", "10"))
+UPSTREAM_WRITE_RATE = float(os.environ.get("STREAMRUN_WRITE_RATE", "2"))
+UPSTREAM_WRITE_BURST = float(os.environ.get("STREAMRUN_WRITE_BURST", "5"))
+UPSTREAM_THROTTLE_WAIT = float(os.environ.get("STREAMRUN_THROTTLE_WAIT", "1"))
+
+# Seconds a caller (?user= / ?channel= / X-Caller header) must wait between
+# commands on the same mutating route; 0 disables cooldowns
+CALLER_COOLDOWN = float(os.environ.get("STREAMRUN_CALLER_COOLDOWN", "0"))
+
+# Circuit breaker per upstream endpoint: consecutive failures (timeouts, 5xx,
+# 429) that open it, and seconds it stays open before one probe call is let
+# through. 0 failures disables the breaker.
+BREAKER_FAILURES = int(os.environ.get("STREAMRUN_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.environ.get("STREAMRUN_BREAKER_RESET", "15"))
+
+# Conditional-request cache for rarely changing GETs (destinations, configuration)
+RESPONSE_CACHE_TTL = float(os.environ.get("STREAMRUN_RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("STREAMRUN_RESPONSE_CACHE_SIZE", "64"))
+
+# Instance status poller tuning (seconds)
+STATUS_POLL_INTERVAL = float(os.environ.get("STREAMRUN_STATUS_POLL_INTERVAL", "10"))
+STATUS_POLL_FAST_INTERVAL = float(os.environ.get("STREAMRUN_STATUS_POLL_FAST_INTERVAL", "2"))
+STATUS_POLL_SLOW_INTERVAL = float(os.environ.get("STREAMRUN_STATUS_POLL_SLOW_INTERVAL", "30"))
+STATUS_MAX_AGE = float(os.environ.get("STREAMRUN_STATUS_MAX_AGE", "15"))
+STATUS_REVALIDATE_TIMEOUT = float(os.environ.get("STREAMRUN_STATUS_REVALIDATE_TIMEOUT", "1.5"))
+
+# Instance lifecycle webhooks: shared signing secret (unset disables the
+# route), how old a signed timestamp may be, and how long after the last
+# webhook the pushed state is trusted without polling (seconds)
+WEBHOOK_SECRET = os.environ.get("STREAMRUN_WEBHOOK_SECRET", "")
+WEBHOOK_TOLERANCE = float(os.environ.get("STREAMRUN_WEBHOOK_TOLERANCE", "300"))
+WEBHOOK_TRUST = float(os.environ.get("STREAMRUN_WEBHOOK_TRUST", "300"))
+
+# How long a go-live result is replayed for a repeated idempotency key (seconds)
+GOLIVE_IDEMPOTENCY_TTL = float(os.environ.get("STREAMRUN_GOLIVE_IDEMPOTENCY_TTL", "600"))
+
+# Switch mode when a request does not pass ?mode=: "blocking" waits for the
+# upstream PATCH, "optimistic" answers at once and confirms over /api/events
+SWITCH_MODE = os.environ.get("STREAMRUN_SWITCH_MODE", "blocking")
+
+# Batch commands: most operations per batch, and how many run at once per worker
+BATCH_MAX_OPERATIONS = int(os.environ.get("STREAMRUN_BATCH_MAX_OPERATIONS", "10"))
+BATCH_CONCURRENCY = int(os.environ.get("STREAMRUN_BATCH_CONCURRENCY", "4"))
+
+# Server-Sent Events: keep-alive period and per-subscriber backlog before it is dropped
+EVENTS_HEARTBEAT = float(os.environ.get("STREAMRUN_EVENTS_HEARTBEAT", "15"))
+EVENTS_SYNC_INTERVAL = 1.0
+EVENTS_QUEUE_SIZE = 100
+
+# Whether /api/events is served: "auto" only when the worker handles requests
+# on several threads or greenlets (wsgi.multithread), "on"/"off" to force it
+EVENTS_MODE = os.environ.get("STREAMRUN_EVENTS", "auto").lower()
+
+# Element category rules: a JSON list, or a path to a JSON file holding one.
+# Each rule is {"category": ..., "match": [...], "exclude": [...], "types": [...]};
+# see DEFAULT_CATEGORY_RULES.
+CATEGORY_RULES = os.environ.get("STREAMRUN_CATEGORY_RULES", "")
+
+# Seconds between background configuration re-fetches (a conditional GET);
+# 0 turns the refresher off and leaves /api/refresh-config as the only trigger
+CONFIG_REFRESH_INTERVAL = float(os.environ.get("STREAMRUN_CONFIG_REFRESH_INTERVAL", "300"))
+
+# Last known element categorization, loaded at startup before the live fetch
+SNAPSHOT_PATH = os.environ.get(
+    "STREAMRUN_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamrun_snapshot.json")
+)
+
+# Where state shared between workers lives: "memory" (single worker), "sqlite",
+# or "auto": sqlite once a request shows several worker processes
+STATE_STORE_KIND = os.environ.get("STREAMRUN_STATE_STORE", "auto")
+STATE_DB_PATH = os.environ.get(
+    "STREAMRUN_STATE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamrun_state.db")
+)
+
+# Configuration states are this worker's view of the shared store. An "auto"
+# store starts in memory until resolve_state_store() settles it.
+state_store = open_state_store("memory" if STATE_STORE_KIND == "auto" else STATE_STORE_KIND, STATE_DB_PATH)
+_state_versions = {}
+_state_store_lock = threading.Lock()
+
+
+def resolve_state_store(multiprocess):
+    """Settle an "auto" store: SQLite when the server runs several worker
+    processes (gunicorn -w N sets wsgi.multiprocess for N > 1), else memory.
+
+    Each worker would otherwise keep its own instance state, and a stop routed
+    to another worker than the golive would find nothing running.
+    """
+    global state_store, STATE_STORE_KIND
+    if STATE_STORE_KIND != "auto":
+        return
+    with _state_store_lock:
+        if STATE_STORE_KIND != "auto":
+            return
+        if multiprocess:
+            state_store = open_state_store("sqlite", STATE_DB_PATH)
+            # Versions seen in the placeholder mean nothing to the shared store
+            _state_versions.clear()
+        STATE_STORE_KIND = "sqlite" if multiprocess else "memory"
+        log.info("State store selected", kind=STATE_STORE_KIND)
+
+
+# ============ CONFIGURATIONS ============
+# One process serves many Streamrun configurations. Each request picks one
+# with a /c/<configuration id>/ path prefix or ?config=<id> (default
+# CONFIGURATION_ID; others must be in CONFIGURATION_IDS), and everything tied to a configuration - its instance,
+# element registry, switch element and active input - lives in that
+# configuration's state dict. States sit in an LRU of MAX_CONFIGURATIONS and
+# are reloaded from the snapshot and shared store when used again. The
+# upstream session, response cache, rate limits and breakers are shared.
+
+_CONFIGURATION_ID = re.compile(r"^[\w-]{1,64}$")
+
+# Dashboard and API routes are also served under this prefix
+CONFIGURATION_PREFIX = "/c/<config_id>"
+
+# Stamps for the "versions" of each configuration; see STATE RESPONSES
+_payload_versions = itertools.count(1)
+
+
+def new_configuration(config_id):
+    """Empty state for one configuration."""
+    return {
+        "id": config_id,
+        # The configuration's current instance
+        "instance": {
+            "id": None,
+            "started_at": None,
+            "state": "UNKNOWN",
+            "checked_at": None,  # time.time() of the last confirmed state
+            "pushed_at": None  # time.time() of the last lifecycle webhook
+        },
+        # Elements with categories (one key per category rule)
+        "categories": {},
+        # Every configuration element, indexed by id, lowercased title and
+        # type, plus the category each element id was sorted into and the
+        # rules that did it
+        "registry": {
+            "elements": [],
+            "by_id": {},
+            "by_title": {},
+            "by_type": {},
+            "category_of": {},
+            "rules": None
+        },
+        # The switch element ID (found from config)
+        "switch_element_id": None,
+        # Input the switch element shows (or is being switched to) through
+        # this proxy: status is "confirmed", "pending" (optimistic switch in
+        # flight) or "failed" (rolled back to confirmed_id)
+        "active_input": {
+            "element_id": None,
+            "updated_at": None,
+            "status": "confirmed",
+            "op_id": None,
+            "confirmed_id": None
+        },
+        # Every known instance, see INSTANCE REGISTRY
+        "instances": {"by_id": {}, "by_state": {}, "order": [], "newest": None, "active": None},
+        "applied_config": None,  # configuration response last categorized
+        "last_diff": None,
+        "status_generation": 0,
+        "status_error": None,
+        "status_requested": False,
+        "last_instance_event": None,
+        # Serialized /api/instance-data and /api/elements-categorized bodies
+        # and the payload versions they were built from
+        "versions": {"instance": 0, "elements": 0},
+        "responses": {},
+        "used_at": time.monotonic(),
+        # Set once the snapshot and shared state are in; see get_configuration
+        "loaded": threading.Event()
+    }
+
+
+_default_configuration = new_configuration(CONFIGURATION_ID)
+# preload() fills it before any request arrives
+_default_configuration["loaded"].set()
+_configurations = OrderedDict([(CONFIGURATION_ID, _default_configuration)])
+_configurations_lock = threading.Lock()
+_configuration = contextvars.ContextVar("configuration", default=_default_configuration)
+
+
+def current_configuration():
+    """State of the configuration this request (or background task) works on."""
+    return _configuration.get()
+
+
+def configuration_id():
+    return _configuration.get()["id"]
+
+
+@contextmanager
+def using_configuration(state):
+    """Run the block against another configuration's state."""
+    token = _configuration.set(state)
+    try:
+        yield state
+    finally:
+        _configuration.reset(token)
+
+
+def configurations():
+    """The loaded configuration states, least recently used first."""
+    with _configurations_lock:
+        return list(_configurations.values())
+
+
+def loaded_configuration(config_id):
+    """State for config_id if it is loaded, without loading or touching it."""
+    with _configurations_lock:
+        return _configurations.get(config_id)
+
+
+def configuration_allowed(config_id):
+    if config_id == CONFIGURATION_ID:
+        return True
+    return bool(_CONFIGURATION_ID.match(config_id)) and config_id in CONFIGURATION_IDS
+
+
+def get_configuration(config_id):
+    """State for config_id, loading it if needed; None if it is not allowed.
+
+    A new configuration goes into the LRU empty and is loaded outside the
+    lock; concurrent requests for it wait until it is loaded.
+    """
+    if not configuration_allowed(config_id):
+        return None
+    with _configurations_lock:
+        state = _configurations.get(config_id)
+        loading = state is None
+        if loading:
+            state = _configurations[config_id] = new_configuration(config_id)
+        else:
+            _configurations.move_to_end(config_id)
+            state["used_at"] = time.monotonic()
+    if not loading:
+        state["loaded"].wait()
+        return state
+    try:
+        with using_configuration(state):
+            load_configuration()
+    finally:
+        state["loaded"].set()
+    with _configurations_lock:
+        evicted = _evict_configurations()
+    finish_evictions(evicted)
+    return state
+
+
+def _evict_configurations():
+    """Drop idle configurations, then the least recently used over the limit.
+
+    Configurations with open /api/events streams are not dropped for idling.
+    The caller holds _configurations_lock.
+    """
+    now = time.monotonic()
+    with _event_lock:
+        watched = set(_event_subscribers.values())
+    evicted = []
+    for config_id, state in list(_configurations.items()):
+        if config_id == CONFIGURATION_ID:
+            continue
+        if len(_configurations) > MAX_CONFIGURATIONS:
+            reason = "lru"
+        elif (CONFIGURATION_IDLE_TTL > 0 and config_id not in watched
+              and now - state["used_at"] > CONFIGURATION_IDLE_TTL):
+            reason = "idle"
+        else:
+            continue
+        del _configurations[config_id]
+        evicted.append((config_id, reason))
+    CONFIGURATIONS_LOADED.set(value=len(_configurations))
+    return evicted
+
+
+def evict_idle_configurations():
+    with _configurations_lock:
+        evicted = _evict_configurations()
+    finish_evictions(evicted)
+
+
+def finish_evictions(evicted):
+    for config_id, reason in evicted:
+        for kind in SHARED_KINDS:
+            _state_versions.pop(shared_key(kind, config_id), None)
+        close_switch_executor(config_id)
+        CONFIGURATION_EVICTIONS.inc(reason)
+        log.info("Configuration evicted", configuration=config_id, reason=reason)
+
+
+def load_configuration():
+    """Fill a newly loaded configuration from its snapshot and the shared store,
+    then fetch the live configuration in the background."""
+    apply_elements([])
+    load_snapshot()
+    keys = [shared_key(kind, configuration_id()) for kind in SHARED_KINDS]
+    for key, (version, value) in state_store.read(keys).items():
+        _state_versions[key] = version
+        apply_shared_value(key.partition(":")[0], value)
+    threading.Thread(
+        target=_fetch_configuration, args=(current_configuration(),), name="config-fetch", daemon=True
+    ).start()
+    log.info("Configuration loaded", configuration=configuration_id())
+
+
+# ============ METRICS ============
+
+REQUESTS = metrics.Counter(
+    "streamrun_proxy_requests_total", "Requests served, by route and status code", ("route", "status"))
+REQUEST_LATENCY = metrics.Histogram(
+    "streamrun_proxy_request_duration_seconds", "Time to produce a response, by route", ("route",))
+REQUESTS_IN_FLIGHT = metrics.Gauge(
+    "streamrun_proxy_requests_in_flight", "Requests currently being handled")
+UPSTREAM_LATENCY = metrics.Histogram(
+    "streamrun_upstream_request_duration_seconds",
+    "Streamrun API call latency including retries, by endpoint", ("method", "endpoint"))
+UPSTREAM_RESPONSES = metrics.Counter(
+    "streamrun_upstream_responses_total",
+    "Streamrun API responses by endpoint and status code", ("method", "endpoint", "status"))
+UPSTREAM_IN_FLIGHT = metrics.Gauge(
+    "streamrun_upstream_requests_in_flight", "Streamrun API calls currently waiting")
+CACHE_REQUESTS = metrics.Counter(
+    "streamrun_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+EVENT_SUBSCRIBERS = metrics.Gauge(
+    "streamrun_event_subscribers", "Open /api/events streams")
+THROTTLED = metrics.Counter(
+    "streamrun_throttled_total", "Calls held back by the rate limiter or a cooldown", ("limit",))
+SWITCH_LATENCY = metrics.Histogram(
+    "streamrun_switch_seconds", "Switch request to upstream confirmation or rollback", ("mode", "result"))
+WEBHOOKS = metrics.Counter(
+    "streamrun_webhooks_total", "Lifecycle webhook deliveries, by outcome", ("result",))
+CIRCUIT_STATE = metrics.Gauge(
+    "streamrun_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)", ("endpoint",))
+CIRCUIT_TRANSITIONS = metrics.Counter(
+    "streamrun_circuit_transitions_total", "Circuit breaker state changes, by new state", ("endpoint", "state"))
+CONFIGURATIONS_LOADED = metrics.Gauge(
+    "streamrun_configurations_loaded", "Configurations with state loaded in this worker")
+CONFIGURATION_EVICTIONS = metrics.Counter(
+    "streamrun_configuration_evictions_total", "Configurations dropped from the LRU, by reason", ("reason",))
+STARTUP_SECONDS = metrics.Gauge(
+    "streamrun_proxy_startup_seconds", "Time spent in each startup phase", ("phase",))
+
+_ID_SEGMENT = re.compile(r"/(configurations|instances)/[^/]+")
+_endpoint_names = {}
+
+
+def endpoint_name(path):
+    """Upstream path with ids replaced, e.g. /instances/{id}/overrides."""
+    name = _endpoint_names.get(path)
+    if name is None:
+        if len(_endpoint_names) > 1000:
+            _endpoint_names.clear()
+        name = _endpoint_names[path] = _ID_SEGMENT.sub(r"/\1/{id}", path)
+    return name
+
+
+@routes.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_id, g.request_id_token = logs.bind_request_id(request.headers.get("X-Request-ID"))
+    g.timing_token = profiling.start_request()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+@routes.before_app_request
+def _resolve_state_store():
+    resolve_state_store(request.environ.get("wsgi.multiprocess", False))
+
+
+@routes.app_url_value_preprocessor
+def _pull_configuration_id(endpoint, values):
+    g.configuration_id = (values or {}).pop("config_id", None) or request.args.get("config")
+
+
+@routes.before_app_request
+def _select_configuration():
+    state = get_configuration(g.get("configuration_id") or CONFIGURATION_ID)
+    if state is None:
+        return "Unknown configuration", 404
+    g.configuration_token = _configuration.set(state)
+
+
+@routes.after_app_request
+def _record_request(response):
+    if "request_started" in g:
+        # /c/<config_id>/api/status is counted and sampled as /api/status
+        route = request.url_rule.rule.removeprefix(CONFIGURATION_PREFIX) if request.url_rule else "unmatched"
+        elapsed = time.perf_counter() - g.request_started
+        REQUEST_LATENCY.observe(elapsed, route)
+        REQUESTS.inc(route, response.status_code)
+        logs.access(request.method, route, request.path, response.status_code, elapsed)
+        response.headers["X-Request-ID"] = g.request_id
+        if g.timing_token is not None:
+            response.headers["Server-Timing"] = profiling.finish_request(
+                g.timing_token, request.method, route, request.path, response.status_code)
+            g.timing_token = None
+    return response
+
+
+@routes.teardown_app_request
+def _finish_request(exc):
+    if "request_started" in g:
+        REQUESTS_IN_FLIGHT.dec()
+        profiling.discard_request(g.timing_token)
+        logs.request_id.reset(g.request_id_token)
+    if "configuration_token" in g:
+        _configuration.reset(g.configuration_token)
+
+
+# ============ RATE LIMITS ============
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling upstream; read paths fall back to cached data."""
+
+
+class UpstreamThrottled(UpstreamUnavailable):
+    """Raised when the upstream token bucket has no budget left for a call."""
+
+
+def _token_bucket(rate, burst):
+    return {"rate": rate, "burst": burst, "tokens": burst, "updated": time.monotonic(), "lock": threading.Lock()}
+
+
+_read_bucket = _token_bucket(UPSTREAM_READ_RATE, UPSTREAM_READ_BURST)
+_write_bucket = _token_bucket(UPSTREAM_WRITE_RATE, UPSTREAM_WRITE_BURST)
+
+
+def upstream_bucket(method):
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read", _read_bucket
+    return "write", _write_bucket
+
+
+def take_token(bucket):
+    """Take a token if one is available; otherwise return seconds until one is."""
+    with bucket["lock"]:
+        now = time.monotonic()
+        bucket["tokens"] = min(bucket["burst"], bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+        bucket["updated"] = now
+        if bucket["tokens"] >= 1:
+            bucket["tokens"] -= 1
+            return 0.0
+        return (1 - bucket["tokens"]) / bucket["rate"] if bucket["rate"] > 0 else float("inf")
+
+
+def throttle_wait(method):
+    """How long a call may wait for a token: reads never wait, writes briefly."""
+    return 0.0 if upstream_bucket(method)[0] == "read" else UPSTREAM_THROTTLE_WAIT
+
+
+def acquire_upstream_token(method):
+    name, bucket = upstream_bucket(method)
+    deadline = time.monotonic() + throttle_wait(method)
+    while True:
+        wait = take_token(bucket)
+        if wait == 0:
+            return
+        if time.monotonic() + wait > deadline:
+            THROTTLED.inc(name)
+            raise UpstreamThrottled(f"Too many Streamrun API calls, try again in {wait:.1f}s")
+        time.sleep(wait)
+
+
+_cooldowns = {}
+_cooldowns_lock = threading.Lock()
+
+
+def caller_key(args, headers):
+    """Identify the chat user/channel behind a request, or None if anonymous."""
+    user = args.get("user") or headers.get("X-Caller")
+    channel = args.get("channel")
+    if not user and not channel:
+        return None
+    return f"{channel or ''}:{user or ''}"
+
+
+def cooldown_remaining(route, caller):
+    """Seconds caller still has to wait on route (in the current configuration);
+    starts a new cooldown if none."""
+    if not CALLER_COOLDOWN or caller is None:
+        return 0.0
+    now = time.monotonic()
+    key = (configuration_id(), route, caller)
+    with _cooldowns_lock:
+        until = _cooldowns.get(key, 0.0)
+        if until > now:
+            THROTTLED.inc("cooldown")
+            return until - now
+        if len(_cooldowns) > 10000:
+            for stale in [k for k, v in _cooldowns.items() if v <= now]:
+                del _cooldowns[stale]
+        _cooldowns[key] = now + CALLER_COOLDOWN
+    return 0.0
+
+
+def caller_cooldown(view):
+    """Reject repeat commands from the same caller within CALLER_COOLDOWN."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        route = request.url_rule.rule.removeprefix(CONFIGURATION_PREFIX)
+        remaining = cooldown_remaining(route, caller_key(request.args, request.headers))
+        if remaining:
+            return f"Cooldown: try again in {remaining:.0f}s"
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ============ CIRCUIT BREAKERS ============
+# One breaker per upstream endpoint (as named in metrics). Closed lets calls
+# through; BREAKER_FAILURES consecutive failures open it, and calls then fail
+# at once. After BREAKER_RESET seconds it goes half-open and lets a single
+# probe through: success closes it, failure opens it again.
+
+class CircuitOpen(UpstreamUnavailable):
+    """Raised when the breaker for an endpoint is not letting calls through."""
+
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+_circuits = {}
+_circuits_lock = threading.Lock()
+
+
+def _circuit(endpoint):
+    circuit = _circuits.get(endpoint)
+    if circuit is None:
+        circuit = _circuits[endpoint] = {"state": "closed", "failures": 0, "opened_at": 0.0, "probe_at": None}
+    return circuit
+
+
+def _set_circuit_state(endpoint, circuit, state):
+    circuit["state"] = state
+    CIRCUIT_STATE.set(endpoint, value=CIRCUIT_STATES[state])
+    CIRCUIT_TRANSITIONS.inc(endpoint, state)
+    log.warning("Circuit breaker state changed", endpoint=endpoint, state=state, failures=circuit["failures"])
+
+
+def circuit_state(endpoint):
+    with _circuits_lock:
+        circuit = _circuits.get(endpoint)
+        return circuit["state"] if circuit else "closed"
+
+
+def circuit_allow(endpoint):
+    """Raise CircuitOpen unless a call to endpoint may go out now."""
+    if BREAKER_FAILURES <= 0:
+        return
+    with _circuits_lock:
+        circuit = _circuit(endpoint)
+        if circuit["state"] == "closed":
+            return
+        now = time.monotonic()
+        if circuit["state"] == "open" and now - circuit["opened_at"] >= BREAKER_RESET:
+            _set_circuit_state(endpoint, circuit, "half_open")
+        if circuit["state"] == "half_open":
+            # One probe at a time; a probe that never reports back expires
+            if circuit["probe_at"] is None or now - circuit["probe_at"] >= BREAKER_RESET:
+                circuit["probe_at"] = now
+                return
+        retry_in = max(0.0, circuit["opened_at"] + BREAKER_RESET - now)
+    raise CircuitOpen(f"Streamrun API unavailable ({endpoint}), retry in {retry_in:.0f}s")
+
+
+def circuit_record(endpoint, success):
+    """Count the outcome of a call that circuit_allow let through."""
+    if BREAKER_FAILURES <= 0:
+        return
+    with _circuits_lock:
+        circuit = _circuit(endpoint)
+        circuit["probe_at"] = None
+        if success:
+            circuit["failures"] = 0
+            if circuit["state"] != "closed":
+                _set_circuit_state(endpoint, circuit, "closed")
+            return
+        circuit["failures"] += 1
+        if circuit["state"] == "half_open" or (
+            circuit["state"] == "closed" and circuit["failures"] >= BREAKER_FAILURES
+        ):
+            circuit["opened_at"] = time.monotonic()
+            _set_circuit_state(endpoint, circuit, "open")
+
+
+def upstream_healthy(status):
+    """Whether a response status means upstream itself is working."""
+    return status < 500 and status != 429
+
+
+# ============ UPSTREAM CLIENT ============
+
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """Return this worker's pooled keep-alive session (rebuilt after fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        retry = Retry(
+            total=UPSTREAM_RETRIES,
+            connect=UPSTREAM_RETRIES,
+            read=UPSTREAM_RETRIES,
+            status=UPSTREAM_RETRIES,
+            backoff_factor=UPSTREAM_RETRY_BACKOFF,
+            status_forcelist=(429, 502, 503, 504),
+            # Only idempotent verbs are retried; POST/PATCH go out exactly once
+            allowed_methods=frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]),
+            # A 429's Retry-After can ask for hours (urllib3 would sleep up to
+            # six); back off as the async client does instead
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=UPSTREAM_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+        _session_pid = pid
+    return _session
+
+
+def upstream(method, path, **kwargs):
+    """Call the Streamrun API at BASE_URL + path through the shared session."""
+    kwargs.setdefault("timeout", (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT))
+    url = f"{BASE_URL}{path}"
+    endpoint = endpoint_name(path)
+    circuit_allow(endpoint)
+    acquire_upstream_token(method)
+    UPSTREAM_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        r = get_session().request(method, url, **kwargs)
+    except requests.RequestException as e:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_LATENCY.observe(elapsed, method, endpoint)
+        UPSTREAM_RESPONSES.inc(method, endpoint, "error")
+        profiling.add_upstream(f"{method} {endpoint} error", elapsed)
+        circuit_record(endpoint, False)
+        log.warning("Upstream call failed", method=method, path=path, ms=round(elapsed * 1000, 1), error=str(e))
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec()
+    elapsed = time.perf_counter() - started
+    UPSTREAM_LATENCY.observe(elapsed, method, endpoint)
+    UPSTREAM_RESPONSES.inc(method, endpoint, r.status_code)
+    profiling.add_upstream(f"{method} {endpoint} {r.status_code}", elapsed)
+    circuit_record(endpoint, upstream_healthy(r.status_code))
+    log.debug("Upstream call", method=method, path=path, status=r.status_code, ms=round(elapsed * 1000, 1))
+    return r
+
+
+# In-flight calls keyed by (method, path); concurrent callers share one result
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(key, fn):
+    """Run fn() once per key at a time; concurrent callers get its result or error."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = {"done": threading.Event(), "result": None, "error": None}
+    CACHE_REQUESTS.inc("singleflight", "leader" if leader else "shared")
+    if not leader:
+        started = time.perf_counter()
+        flight["done"].wait()
+        # Time spent riding on another caller's upstream call
+        profiling.add_upstream(f"shared {key[0]}", time.perf_counter() - started)
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["result"]
+    try:
+        flight["result"] = fn()
+        return flight["result"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight["done"].set()
+
+
+def upstream_get(path, **kwargs):
+    """Coalesced GET: one upstream request per path no matter how many callers."""
+    return single_flight(("GET", path), lambda: upstream("GET", path, **kwargs))
+
+
+# ============ RESPONSE CACHE ============
+# Entries are keyed by upstream path and kept in LRU order. Within
+# RESPONSE_CACHE_TTL an entry is served as-is; after that it is revalidated
+# with If-None-Match/If-Modified-Since. A changed body replaces the entry
+# with a bumped version, which also drops anything memoized from it.
+
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def cache_entry(path):
+    """Return the cached entry for path (marking it recently used), or None."""
+    with _response_cache_lock:
+        entry = _response_cache.get(path)
+        if entry is not None:
+            _response_cache.move_to_end(path)
+        return entry
+
+
+def is_fresh(entry, max_age):
+    return entry is not None and time.time() - entry["fetched_at"] < max_age
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def cache_response(path, previous, status_code, headers, load):
+    """Fold an upstream answer into the cache and return the entry to use.
+
+    load() parses the body; it is only called when the body changed.
+    Errors are returned as uncached entries with ok=False.
+    """
+    if status_code == 304 and previous is not None:
+        CACHE_REQUESTS.inc("response", "revalidated")
+        previous["fetched_at"] = time.time()
+        return previous
+    if not 200 <= status_code < 300:
+        CACHE_REQUESTS.inc("response", "error")
+        return {"ok": False, "status": status_code, "data": None}
+    CACHE_REQUESTS.inc("response", "miss")
+    entry = {
+        "ok": True,
+        "status": status_code,
+        "data": load(),
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "version": previous["version"] + 1 if previous is not None else 1,
+        "derived": {}
+    }
+    with _response_cache_lock:
+        _response_cache[path] = entry
+        _response_cache.move_to_end(path)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return entry
+
+
+def memoized(entry, name, fn):
+    """fn() computed once per cache entry version."""
+    derived = entry["derived"]
+    if name not in derived:
+        derived[name] = fn()
+    return derived[name]
+
+
+def stale_entry(entry):
+    """The last good entry, marked so routes can say the data may be old."""
+    return dict(entry, stale=True)
+
+
+def cached_get(path, max_age=RESPONSE_CACHE_TTL):
+    """GET through the response cache, revalidating once max_age has passed."""
+    entry = cache_entry(path)
+    if is_fresh(entry, max_age):
+        CACHE_REQUESTS.inc("response", "hit")
+        return entry
+
+    def fetch():
+        try:
+            r = upstream("GET", path, headers=conditional_headers(entry))
+        except UpstreamUnavailable as e:
+            # Throttled or circuit open: a stale answer beats an error
+            if entry is None:
+                raise
+            CACHE_REQUESTS.inc("response", "throttled" if isinstance(e, UpstreamThrottled) else "circuit_open")
+            return stale_entry(entry)
+        except requests.RequestException:
+            if entry is None or not entry["ok"]:
+                raise
+            CACHE_REQUESTS.inc("response", "upstream_error")
+            return stale_entry(entry)
+        if not upstream_healthy(r.status_code) and entry is not None and entry["ok"]:
+            CACHE_REQUESTS.inc("response", "upstream_error")
+            return stale_entry(entry)
+        return cache_response(path, entry, r.status_code, r.headers, r.json)
+
+    return single_flight(("cached", path), fetch)
+
+
+# ============ ELEMENT REGISTRY ============
+# Rules are checked in order and the first one that matches a title wins.
+# Within a category the last matching element wins.
+
+DEFAULT_CATEGORY_RULES = [
+    {"category": "PC", "match": ["pc"], "exclude": ["screen", "mobile"]},
+    {"category": "Mobile", "match": ["mobile"]},
+    {"category": "BRB Screen", "match": ["brb", "be right back", "break"]}
+]
+
+
+def load_category_rules():
+    """Read the category rules from STREAMRUN_CATEGORY_RULES, or the defaults."""
+    source = CATEGORY_RULES.strip()
+    if not source:
+        return DEFAULT_CATEGORY_RULES
+    try:
+        if source.startswith("["):
+            rules = json.loads(source)
+        else:
+            with open(source) as f:
+                rules = json.load(f)
+        validate_category_rules(rules)
+        return rules
+    except (OSError, ValueError) as e:
+        log.error("Error loading category rules, using defaults", error=str(e))
+        return DEFAULT_CATEGORY_RULES
+
+
+def validate_category_rules(rules):
+    """Raise ValueError unless rules is a list of well-formed rule dicts."""
+    if not isinstance(rules, list):
+        raise ValueError("category rules must be a list")
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f"rule {index} is not an object")
+        if not isinstance(rule.get("category"), str) or not rule["category"]:
+            raise ValueError(f"rule {index} needs a category name")
+        for key in ("match", "exclude", "types"):
+            words = rule.get(key)
+            if words is not None and not (isinstance(words, list) and all(isinstance(w, str) for w in words)):
+                raise ValueError(f"rule {index}: {key} must be a list of strings")
+
+
+def _substring_pattern(words):
+    if not words:
+        return None
+    return re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+
+
+def compile_category_rules(rules):
+    """Turn rule dicts into (category, match, exclude, types) tuples."""
+    compiled = []
+    for rule in rules:
+        compiled.append((
+            rule["category"],
+            _substring_pattern(rule.get("match")),
+            _substring_pattern(rule.get("exclude")),
+            set(rule["types"]) if rule.get("types") else None
+        ))
+    return compiled
+
+
+def match_category(rules, title, elem_type):
+    """The first rule category that title/type satisfies, or None."""
+    for category, match, exclude, types in rules:
+        if types is not None and elem_type not in types:
+            continue
+        if match is not None and not match.search(title):
+            continue
+        if exclude is not None and exclude.search(title):
+            continue
+        return category
+    return None
+
+
+def diff_elements(old, new):
+    """Compare element lists by id: {"added", "removed", "changed"} id lists."""
+    before = {element.get("id", ""): element for element in old}
+    after = {element.get("id", ""): element for element in new}
+    return {
+        "added": [elem_id for elem_id in after if elem_id not in before],
+        "removed": [elem_id for elem_id in before if elem_id not in after],
+        "changed": [elem_id for elem_id in after if elem_id in before and before[elem_id] != after[elem_id]],
+    }
+
+
+def apply_elements(elements):
+    """Index and categorize configuration elements, then swap the results in.
+
+    Only elements added or changed since the last call are run through the
+    rules, and only categories that gained or lost an element are rebuilt;
+    the rest carry over. New rules or a reordered list rebuild everything.
+    Returns the diff against the previous elements.
+    """
+    state = current_configuration()
+    rule_source = load_category_rules()
+    rules = compile_category_rules(rule_source)
+    previous = state["registry"]
+    diff = diff_elements(previous["elements"], elements)
+    dirty = set(diff["added"]) | set(diff["changed"])
+    gone = set(diff["removed"]) | dirty
+    # "Last match wins" depends on order, so a reordered list is rebuilt
+    same_order = (
+        [element.get("id", "") for element in elements if element.get("id", "") not in dirty]
+        == [element.get("id", "") for element in previous["elements"] if element.get("id", "") not in gone]
+    )
+    incremental = previous["rules"] == rule_source and same_order
+
+    registry = {"elements": elements, "by_id": {}, "by_title": {}, "by_type": {},
+                "category_of": {}, "rules": rule_source}
+    switch_id = None
+
+    for element in elements:
+        elem_id = element.get("id", "")
+        if incremental and elem_id not in dirty:
+            entry = previous["by_id"][elem_id]
+            category = previous["category_of"][elem_id]
+        else:
+            elem_title = element.get("title", "")
+            entry = {"name": elem_title, "id": elem_id, "type": element.get("type", "")}
+            category = match_category(rules, elem_title, entry["type"])
+
+        registry["by_id"][elem_id] = entry
+        registry["by_title"][entry["name"].lower()] = entry
+        registry["by_type"].setdefault(entry["type"], []).append(entry)
+        registry["category_of"][elem_id] = category
+
+        # Find the switch element
+        if entry["type"] == "switch" or "switch" in elem_id.lower():
+            switch_id = elem_id
+
+    if incremental:
+        touched = {previous["category_of"].get(elem_id) for elem_id in diff["removed"] + diff["changed"]}
+        touched |= {registry["category_of"][elem_id] for elem_id in dirty}
+        touched.discard(None)
+        categories = dict(state["categories"])
+    else:
+        categories = {category: None for category, _, _, _ in rules}
+        touched = set(categories)
+    for category in touched:
+        categories[category] = None
+    for elem_id, category in registry["category_of"].items():
+        if category in touched:
+            categories[category] = registry["by_id"][elem_id]
+
+    # Rebind rather than mutate so readers never see a half-built cache
+    state["registry"] = registry
+    state["categories"] = categories
+    state["switch_element_id"] = switch_id
+    state["versions"]["elements"] = next(_payload_versions)
+    return diff
+
+
+def lookup_element(ref):
+    """Find an element by id, then by category name or title (case-insensitive)."""
+    state = current_configuration()
+    entry = state["registry"]["by_id"].get(ref)
+    if entry is not None:
+        return entry
+    lowered = ref.lower()
+    for category, categorized in state["categories"].items():
+        if categorized and category.lower() == lowered:
+            return categorized
+    return state["registry"]["by_title"].get(lowered)
+
+
+def resolve_element_id(ref):
+    """Element id for ref, or None when the configuration is known and lacks it."""
+    element = lookup_element(ref)
+    if element is not None:
+        return element["id"]
+    # Before the first config load there is nothing to validate against
+    return None if current_configuration()["registry"]["by_id"] else ref
+
+
+def elements_changed(diff, previous_categories):
+    return any(diff.values()) or current_configuration()["categories"] != previous_categories
+
+
+def describe_diff(diff):
+    return f"{len(diff['added'])} added, {len(diff['removed'])} removed, {len(diff['changed'])} changed"
+
+
+def categorize_elements(data):
+    """Categorize the elements of a configuration response into its categories."""
+    state = current_configuration()
+    config = data.get("configuration", {})
+    previous_categories = state["categories"]
+    diff = state["last_diff"] = apply_elements(config.get("elements", []))
+    if not elements_changed(diff, previous_categories):
+        return
+    log.info("Elements loaded", configuration=state["id"], elements=len(state["registry"]["by_id"]),
+             diff=describe_diff(diff), categories=list(state["categories"]),
+             switch_element=state["switch_element_id"])
+    publish_elements()
 
-# Store the switch element ID (found from config)
-switch_element_id = None
+
+ACTIVE_STATES = ("RUNNING", "QUEUED", "STARTING")
+
+
+# ============ INSTANCE REGISTRY ============
+# Every instance of a configuration this worker has heard about - from create
+# and list responses, status refreshes, webhooks, stops and other workers -
+# indexed by id and by state and kept in created-at order. Each update is
+# folded in incrementally and re-derives the newest and the newest active
+# instance, so go-live reads them in O(1) instead of listing upstream.
+
+INSTANCE_REGISTRY_SIZE = 50
+
+_instances_lock = threading.Lock()
+_instance_sequence = itertools.count()
+
+
+def _index_instance(registry, instance_id, state, created_at=None):
+    entry = registry["by_id"].get(instance_id)
+    if entry is not None and created_at and not entry["created_at"]:
+        # Learned the creation time late: move it to its place in the order
+        registry["order"].remove((entry["order_key"], instance_id))
+        entry["created_at"] = created_at
+        entry["order_key"] = (created_at, entry["order_key"][1])
+        bisect.insort(registry["order"], (entry["order_key"], instance_id))
+    if entry is None:
+        entry = registry["by_id"][instance_id] = {
+            "id": instance_id,
+            "state": None,
+            "created_at": created_at,
+            # Ties and unknown creation times fall back to the order seen
+            "order_key": (created_at or "", next(_instance_sequence))
+        }
+        bisect.insort(registry["order"], (entry["order_key"], instance_id))
+    if state and entry["state"] != state:
+        if entry["state"] is not None:
+            registry["by_state"][entry["state"]].discard(instance_id)
+        registry["by_state"].setdefault(state, set()).add(instance_id)
+        entry["state"] = state
+    entry["seen_at"] = time.time()
+
+
+def _drop_instance(registry, instance_id):
+    entry = registry["by_id"].pop(instance_id)
+    registry["order"].remove((entry["order_key"], instance_id))
+    if entry["state"] is not None:
+        registry["by_state"][entry["state"]].discard(instance_id)
+
+
+def _derive_instances(registry):
+    """Trim the oldest inactive instances and recompute newest/active."""
+    by_id, order = registry["by_id"], registry["order"]
+    for _, instance_id in list(order):
+        if len(order) <= INSTANCE_REGISTRY_SIZE:
+            break
+        if by_id[instance_id]["state"] not in ACTIVE_STATES:
+            _drop_instance(registry, instance_id)
+    registry["newest"] = order[-1][1] if order else None
+    active = [instance_id for state in ACTIVE_STATES for instance_id in registry["by_state"].get(state, ())]
+    registry["active"] = max(active, key=lambda instance_id: by_id[instance_id]["order_key"], default=None)
+
+
+def _instance_fields(instance):
+    return (
+        instance.get("id"),
+        (instance.get("state") or "").upper() or None,
+        instance.get("createdAt") or instance.get("created_at")
+    )
+
+
+def record_instance(instance_id, state, created_at=None):
+    """Fold one instance (as far as it is known) into the current configuration's registry."""
+    registry = current_configuration()["instances"]
+    with _instances_lock:
+        _index_instance(registry, instance_id, state, created_at)
+        _derive_instances(registry)
+
+
+def record_upstream_instance(instance):
+    """record_instance() for an instance object from the Streamrun API."""
+    instance_id, state, created_at = _instance_fields(instance)
+    if instance_id:
+        record_instance(instance_id, state, created_at)
+
+
+def record_instance_list(instances):
+    """Replace what the registry knows with a full instances listing.
+
+    Instances the listing no longer shows are dropped.
+    """
+    registry = current_configuration()["instances"]
+    listed = set()
+    with _instances_lock:
+        for instance in instances:
+            instance_id, state, created_at = _instance_fields(instance)
+            if instance_id:
+                _index_instance(registry, instance_id, state, created_at)
+                listed.add(instance_id)
+        for instance_id in [i for i in registry["by_id"] if i not in listed]:
+            _drop_instance(registry, instance_id)
+        _derive_instances(registry)
+
+
+def active_instance():
+    """The newest RUNNING/QUEUED/STARTING instance, or None."""
+    registry = current_configuration()["instances"]
+    with _instances_lock:
+        return dict(registry["by_id"][registry["active"]]) if registry["active"] else None
+
+
+def newest_instance():
+    """The most recently created instance in any state, or None."""
+    registry = current_configuration()["instances"]
+    with _instances_lock:
+        return dict(registry["by_id"][registry["newest"]]) if registry["newest"] else None
+
+
+def trusted_active_instance():
+    """active_instance() if the registry heard about it recently enough to
+    answer without asking upstream."""
+    instance = active_instance()
+    if instance is None:
+        return None
+    if webhooks_live() or time.time() - instance["seen_at"] <= STATUS_MAX_AGE:
+        return instance
+    return None
+
+
+def instance_from_create_response(data):
+    """The new instance named in a create-instances response, or None."""
+    if isinstance(data, list):
+        data = {"instances": data}
+    if not isinstance(data, dict):
+        return None
+    instances = data.get("instances")
+    candidates = [instances[0]] if isinstance(instances, list) and instances else []
+    candidates += [data.get("instance"), data]
+    for candidate in candidates:
+        if isinstance(candidate, dict) and candidate.get("id"):
+            return candidate
+    return None
+
+
+def format_destinations(data):
+    """Render a destinations list as plain text for chat."""
+    lines = []
+    for d in data:
+        name = d.get("name", "unknown")
+        dest_id = d.get("id", "no-id")
+        lines.append(f"{name}:{dest_id}")
+    return " | ".join(lines) or "No destinations"
+
+
+def golive_body():
+    """Request body for starting a single instance of the configuration."""
+    return {
+        "numberOfInstances": 1,
+        "instanceSettings": [
+            {
+                "name": "Live Stream Instance",
+                "overrides": {}
+            }
+        ]
+    }
 
 
 def fetch_and_categorize_elements():
     """Fetch elements from configuration and categorize them."""
-    global switch_element_id
+    state = current_configuration()
     try:
-        url = f"{BASE_URL}/configurations/{CONFIGURATION_ID}"
-        r = requests.get(url, headers=HEADERS)
-        if not r.ok:
-            print(f"Error fetching config: {r.status_code}")
+        entry = cached_get(f"/configurations/{state['id']}", max_age=0)
+        if not entry["ok"]:
+            log.warning("Error fetching config", configuration=state["id"], status=entry["status"])
             return False
-        
-        data = r.json()
-        config = data.get("configuration", {})
-        elements = config.get("elements", [])
-        
-        # Reset categories
-        elements_cache["PC"] = None
-        elements_cache["Mobile"] = None
-        elements_cache["BRB Screen"] = None
-        
-        # Map elements by title and find switch element
-        for element in elements:
-            elem_id = element.get("id", "")
-            elem_title = element.get("title", "")
-            elem_type = element.get("type", "")
-            
-            # Find the switch element
-            if elem_type == "switch" or "switch" in elem_id.lower():
-                switch_element_id = elem_id
-                print(f"Found switch element: {elem_id}")
-            
-            # Match by title
-            title_lower = elem_title.lower()
-            
-            if "pc" in title_lower and "screen" not in title_lower and "mobile" not in title_lower:
-                elements_cache["PC"] = {"name": elem_title, "id": elem_id, "type": elem_type}
-            elif "mobile" in title_lower:
-                elements_cache["Mobile"] = {"name": elem_title, "id": elem_id, "type": elem_type}
-            elif "brb" in title_lower or "be right back" in title_lower or "break" in title_lower:
-                elements_cache["BRB Screen"] = {"name": elem_title, "id": elem_id, "type": elem_type}
-        
-        print(f"Elements loaded: PC={elements_cache['PC']}, Mobile={elements_cache['Mobile']}, BRB Screen={elements_cache['BRB Screen']}")
-        print(f"Switch element ID: {switch_element_id}")
+
+        # Unchanged configuration (304): nothing to re-categorize. Compared by
+        # identity because versions restart if the shared cache drops the entry.
+        if entry["data"] is state["applied_config"]:
+            state["last_diff"] = {"added": [], "removed": [], "changed": []}
+            return True
+        categorize_elements(entry["data"])
+        state["applied_config"] = entry["data"]
+        save_snapshot()
         return True
     except Exception as e:
-        print(f"Error fetching elements: {e}")
+        log.error("Error fetching elements", configuration=state["id"], error=str(e))
+        return False
+
+
+def snapshot_path():
+    """SNAPSHOT_PATH for CONFIGURATION_ID, a sibling file per other configuration."""
+    config_id = configuration_id()
+    if config_id == CONFIGURATION_ID:
+        return SNAPSHOT_PATH
+    root, ext = os.path.splitext(SNAPSHOT_PATH)
+    return f"{root}.{config_id}{ext}"
+
+
+def save_snapshot():
+    """Atomically write the current configuration elements to its snapshot file."""
+    path = snapshot_path()
+    snapshot = {
+        "configuration_id": configuration_id(),
+        "elements": current_configuration()["registry"]["elements"],
+        "saved_at": datetime.now().isoformat()
+    }
+    try:
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.error("Error saving snapshot", error=str(e))
+
+
+def load_snapshot():
+    """Load and categorize the last saved elements for this configuration, if any."""
+    try:
+        with open(snapshot_path()) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        log.error("Error loading snapshot", error=str(e))
+        return False
+    if snapshot.get("configuration_id") != configuration_id() or not isinstance(snapshot.get("elements"), list):
         return False
+    apply_elements(snapshot["elements"])
+    log.info("Loaded snapshot", configuration=configuration_id(), saved_at=snapshot.get("saved_at"))
+    return True
+
+
+def _fetch_config_on_startup(started):
+    if fetch_and_categorize_elements():
+        startup_timings["config_ms"] = (time.perf_counter() - started) * 1000
+        log.info("Live configuration loaded", ms_after_worker_start=round(startup_timings["config_ms"], 1))
+
+
+def _fetch_configuration(state):
+    with using_configuration(state):
+        fetch_and_categorize_elements()
+
+
+_startup_fetch_pid = None
+_startup_fetch_lock = threading.Lock()
+
+
+def ensure_startup_fetch():
+    """Fetch the live configuration once per worker process.
+
+    Runs on the worker's first request (or aiohttp startup) rather than at
+    import, so a preloading master never has a thread mid-call when it forks.
+    """
+    global _startup_fetch_pid
+    pid = os.getpid()
+    if _startup_fetch_pid == pid:
+        return
+    with _startup_fetch_lock:
+        if _startup_fetch_pid == pid:
+            return
+        threading.Thread(
+            target=_fetch_config_on_startup, args=(time.perf_counter(),), name="config-fetch", daemon=True
+        ).start()
+        _startup_fetch_pid = pid
+
+
+def refresh_configuration():
+    """Re-fetch the configuration now and return a plain-text summary."""
+    if not fetch_and_categorize_elements():
+        return "Error refreshing configuration"
+    last_diff = current_configuration()["last_diff"]
+    if not any(last_diff.values()):
+        return "Configuration unchanged"
+    return f"Configuration updated: {describe_diff(last_diff)}"
+
+
+_config_refresher_pid = None
+_config_refresher_lock = threading.Lock()
+
+
+def _config_refresher():
+    while True:
+        time.sleep(CONFIG_REFRESH_INTERVAL)
+        for state in configurations():
+            _fetch_configuration(state)
+
+
+def ensure_config_refresher():
+    """Start the periodic configuration refresh once per worker process."""
+    global _config_refresher_pid
+    pid = os.getpid()
+    if CONFIG_REFRESH_INTERVAL <= 0 or _config_refresher_pid == pid:
+        return
+    with _config_refresher_lock:
+        if _config_refresher_pid == pid:
+            return
+        threading.Thread(target=_config_refresher, name="config-refresh", daemon=True).start()
+        _config_refresher_pid = pid
+
+
+# ============ SHARED STATE ============
+# Writes go to the state store under "<kind>:<configuration id>"; every
+# request first pulls in whatever other workers changed, so any worker can
+# serve stop/outputs/switch. Keys of configurations this worker has not
+# loaded are skipped until it loads them.
+
+SHARED_KINDS = ("instance", "elements", "switch")
+
+
+def shared_key(kind, config_id=None):
+    return f"{kind}:{config_id or configuration_id()}"
+
+
+_publish_lock = threading.Lock()
+
+
+def publish_instance():
+    """Store the instance state for other workers and push it to subscribers.
+
+    Never called with _status_cond held: the store write can wait on SQLite.
+    Publishers queue on _publish_lock and each stores the state as it is
+    then, so the last write is never an older state.
+    """
+    instance = current_configuration()["instance"]
+    with _publish_lock:
+        with _status_cond:
+            value = {
+                "id": instance["id"],
+                "state": instance["state"],
+                "started_at": instance["started_at"],
+                "checked_at": instance["checked_at"],
+                "pushed_at": instance["pushed_at"]
+            }
+        _state_versions[shared_key("instance")] = state_store.put(shared_key("instance"), value)
+    emit_instance_event()
+
+
+def publish_elements():
+    _state_versions[shared_key("elements")] = state_store.put(shared_key("elements"), {
+        "elements": current_configuration()["registry"]["elements"]
+    })
+    publish_event("elements", elements_payload())
+
+
+def set_active_input(element_id, status="confirmed", op_id=None):
+    """Record the input the switch element now shows (or will, once confirmed)."""
+    active_input = current_configuration()["active_input"]
+    active_input["element_id"] = element_id
+    active_input["updated_at"] = datetime.now().isoformat()
+    active_input["status"] = status
+    active_input["op_id"] = op_id
+    if status == "confirmed":
+        active_input["confirmed_id"] = element_id
+    _state_versions[shared_key("switch")] = state_store.put(shared_key("switch"), dict(active_input))
+    publish_event("switch", switch_payload())
+
+
+def set_confirmed_input(element_id):
+    """Record the input upstream confirmed without changing what is displayed."""
+    active_input = current_configuration()["active_input"]
+    active_input["confirmed_id"] = element_id
+    _state_versions[shared_key("switch")] = state_store.put(shared_key("switch"), dict(active_input))
+
+
+def apply_shared_value(kind, value):
+    """Fold a value another worker stored into the current configuration."""
+    state = current_configuration()
+    if kind == "instance":
+        previous_id = state["instance"]["id"]
+        with _status_cond:
+            state["instance"].update(value)
+        if value["id"] or previous_id:
+            record_instance(value["id"] or previous_id, value["state"], value["started_at"])
+        emit_instance_event()
+    elif kind == "elements":
+        previous_categories = state["categories"]
+        if elements_changed(apply_elements(value["elements"]), previous_categories):
+            publish_event("elements", elements_payload())
+    elif kind == "switch":
+        state["active_input"].update(value)
+        publish_event("switch", switch_payload())
+
+
+def sync_shared_state():
+    """Apply changes other workers made to the shared store since the last sync."""
+    for key, (version, value) in state_store.changed_since(_state_versions).items():
+        kind, _, config_id = key.partition(":")
+        state = loaded_configuration(config_id)
+        if state is None:
+            continue
+        _state_versions[key] = version
+        with using_configuration(state):
+            apply_shared_value(kind, value)
+
+
+# ============ EVENTS ============
+# Subscribers are callables that take an encoded SSE message and must not
+# block; one that raises (e.g. a full queue) is dropped and can reconnect.
+# Each receives the events of the configuration it subscribed under.
+
+_event_subscribers = {}  # deliver -> configuration id
+_event_lock = threading.Lock()
+
+
+def instance_payload():
+    instance = current_configuration()["instance"]
+    return {
+        "id": instance["id"] or "None",
+        "state": instance["state"],
+        "started_at": instance["started_at"] or "—"
+    }
+
+
+def elements_payload():
+    return current_configuration()["categories"]
+
+
+def switch_payload():
+    active_input = current_configuration()["active_input"]
+    return {
+        "element_id": active_input["element_id"],
+        "status": active_input["status"],
+        "op_id": active_input["op_id"]
+    }
+
+
+def events_supported(multithread):
+    """Whether this worker can hold /api/events streams open.
+
+    A sync worker serves one request at a time, so a stream would block every
+    other request until gunicorn kills the worker for timing out.
+    """
+    if EVENTS_MODE in ("on", "off"):
+        return EVENTS_MODE == "on"
+    return multithread
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def initial_events():
+    """Messages that bring a new subscriber up to date."""
+    return (
+        format_event("instance", instance_payload())
+        + format_event("switch", switch_payload())
+        + format_event("elements", elements_payload())
+    )
+
+
+def subscribe_events(deliver):
+    with _event_lock:
+        _event_subscribers[deliver] = configuration_id()
+        EVENT_SUBSCRIBERS.set(value=len(_event_subscribers))
+
+
+def unsubscribe_events(deliver):
+    with _event_lock:
+        _event_subscribers.pop(deliver, None)
+        EVENT_SUBSCRIBERS.set(value=len(_event_subscribers))
+
+
+def is_subscribed(deliver):
+    return deliver in _event_subscribers
+
+
+def publish_event(event, data):
+    """Send one event to every subscriber of the current configuration in this worker."""
+    message = format_event(event, data)
+    config_id = configuration_id()
+    with _event_lock:
+        subscribers = [deliver for deliver, subscribed in _event_subscribers.items() if subscribed == config_id]
+    for deliver in subscribers:
+        try:
+            deliver(message)
+        except Exception:
+            unsubscribe_events(deliver)
+
+
+def emit_instance_event():
+    # Status refreshes that confirm the same state are not worth a push
+    state = current_configuration()
+    payload = instance_payload()
+    if payload != state["last_instance_event"]:
+        state["last_instance_event"] = payload
+        state["versions"]["instance"] = next(_payload_versions)
+        publish_event("instance", payload)
+
+
+# ============ STATE RESPONSES ============
+# The dashboard and overlays poll /api/instance-data and
+# /api/elements-categorized. Each configuration keeps the last serialized
+# body of both with the payload version it was built from; the instance
+# version moves when emit_instance_event sees a new payload and the elements
+# version when apply_elements rebinds the categories. A poll therefore costs
+# a version check, and one that sends the body's ETag gets a 304.
+
+# Seconds clients may reuse a state response before revalidating; 0 means always revalidate
+STATE_CACHE_TTL = float(os.environ.get("STREAMRUN_STATE_CACHE_TTL", "1"))
+
+STATE_PAYLOADS = {"instance": instance_payload, "elements": elements_payload}
+
+
+def state_response(kind):
+    """The cached {"version", "body", "etag"} for kind, rebuilt if its version moved."""
+    state = current_configuration()
+    # Read the version first: a change racing the rebuild leaves it stale, never wrong
+    version = state["versions"][kind]
+    cached = state["responses"].get(kind)
+    if cached is not None and cached["version"] == version:
+        CACHE_REQUESTS.inc("state", "hit")
+        return cached
+    started = time.perf_counter()
+    body = json.dumps(STATE_PAYLOADS[kind](), separators=(",", ":")).encode()
+    profiling.add_serialize(time.perf_counter() - started)
+    # Derived from the content so every worker hands out the same ETag
+    cached = {"version": version, "body": body, "etag": f'"{hashlib.sha256(body).hexdigest()[:16]}"'}
+    state["responses"][kind] = cached
+    CACHE_REQUESTS.inc("state", "miss")
+    return cached
+
+
+def negotiate_state(kind, if_none_match):
+    """Pick the response for a state endpoint: (status, headers, body)."""
+    cached = state_response(kind)
+    headers = {
+        "ETag": cached["etag"],
+        "Cache-Control": f"max-age={STATE_CACHE_TTL:g}" if STATE_CACHE_TTL > 0 else "no-cache"
+    }
+    if kind == "instance" and instance_circuit_open():
+        # The body is the last known state; flag it without changing the ETag
+        headers["X-Streamrun-Stale"] = "1"
+        headers["Warning"] = '110 - "Response is Stale"'
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in candidates or cached["etag"] in candidates:
+        CACHE_REQUESTS.inc("state", "not_modified")
+        return 304, headers, b""
+    headers["Content-Type"] = "application/json"
+    return 200, headers, cached["body"]
+
+
+# ============ INSTANCE STATUS POLLER ============
+# A background thread keeps each configuration's instance state fresh so
+# /api/status and /api/instance-data answer from memory instead of calling
+# upstream.
+
+_status_cond = threading.Condition()
+_status_wakeup = threading.Event()
+_status_poller_pid = None
+
+
+def set_instance(instance_id, state, started_at=None):
+    """Record an instance state learned outside the poller (go-live/stop)."""
+    config = current_configuration()
+    instance = config["instance"]
+    # Stopping clears the current instance; the registry keeps its final state
+    if instance_id or instance["id"]:
+        record_instance(instance_id or instance["id"], state, started_at)
+    with _status_cond:
+        instance["id"] = instance_id
+        instance["state"] = state
+        if started_at is not None or instance_id is None:
+            instance["started_at"] = started_at
+        instance["checked_at"] = time.time()
+        config["status_generation"] += 1
+        config["status_error"] = None
+        _status_cond.notify_all()
+    publish_instance()
+
+
+def status_age():
+    """Seconds since the instance state was last confirmed (inf if never).
+
+    While lifecycle webhooks are arriving the state is pushed on every change,
+    so it counts as fresh and nothing needs to poll.
+    """
+    if webhooks_live():
+        return 0.0
+    checked_at = current_configuration()["instance"]["checked_at"]
+    if checked_at is None:
+        return float("inf")
+    return time.time() - checked_at
+
+
+def refresh_instance_state():
+    """Fetch the current instance state from upstream into the configuration."""
+    instance_id = current_configuration()["instance"]["id"]
+    if not instance_id:
+        return None
+    try:
+        r = upstream_get(f"/instances/{instance_id}")
+        error = None if r.ok else f"Error {r.status_code}"
+        state = r.json().get("state", "UNKNOWN") if r.ok else None
+    except UpstreamUnavailable:
+        # Throttled or circuit open: keep reporting the last known state
+        error, state = None, None
+    except Exception as e:
+        log.warning("Error refreshing instance state", instance_id=instance_id, error=str(e))
+        error, state = f"Error: {str(e)}", None
+    record_instance_state(instance_id, state, error)
+    return state
+
+
+def record_instance_state(instance_id, state, error=None):
+    """Store the outcome of a status refresh for instance_id."""
+    config = current_configuration()
+    instance = config["instance"]
+    changed = False
+    with _status_cond:
+        # Ignore the result if the instance changed while we were waiting
+        if instance["id"] == instance_id:
+            if state is not None:
+                record_instance(instance_id, state)
+                instance["state"] = state
+                instance["checked_at"] = time.time()
+                changed = True
+            config["status_error"] = error
+        config["status_generation"] += 1
+        _status_cond.notify_all()
+    if changed:
+        publish_instance()
+
+
+def status_text():
+    """Plain-text answer for /api/status from the in-memory state."""
+    config = current_configuration()
+    if config["instance"]["checked_at"] is None and config["status_error"]:
+        return config["status_error"]
+    return config["instance"]["state"]
+
+
+def instance_circuit_open():
+    """True while the breaker for the instance endpoint is not letting polls through."""
+    instance_id = current_configuration()["instance"]["id"]
+    return bool(instance_id) and circuit_state(endpoint_name(f"/instances/{instance_id}")) != "closed"
+
+
+def instance_status_stale():
+    """True when the status is old because the instance endpoint is failing."""
+    return status_age() > STATUS_MAX_AGE and instance_circuit_open()
+
+
+def status_answer():
+    """status_text(), flagged when it is the last known state during an outage."""
+    text = status_text()
+    return f"{text} (stale)" if instance_status_stale() else text
+
+
+def status_poll_interval():
+    """Seconds until the next poll, based on how quickly the state is moving."""
+    state = (current_configuration()["instance"]["state"] or "").upper()
+    if state in ("QUEUED", "STARTING"):
+        return STATUS_POLL_FAST_INTERVAL
+    if state in ("RUNNING", "STOPPED"):
+        return STATUS_POLL_SLOW_INTERVAL
+    return STATUS_POLL_INTERVAL
+
+
+def next_status_poll():
+    """Seconds until the poller should look again: the shortest interval of
+    any configuration with an instance."""
+    intervals = []
+    for state in configurations():
+        if state["instance"]["id"]:
+            with using_configuration(state):
+                intervals.append(status_poll_interval())
+    return min(intervals, default=STATUS_POLL_INTERVAL)
+
+
+def status_poll_due():
+    """Whether the current configuration's instance should be polled now.
+
+    On a timer, the call is skipped if another worker refreshed recently.
+    """
+    state = current_configuration()
+    requested, state["status_requested"] = state["status_requested"], False
+    return bool(state["instance"]["id"]) and (requested or status_age() >= status_poll_interval())
+
+
+def request_status_refresh():
+    """Ask the poller to refresh the current configuration's instance soon."""
+    current_configuration()["status_requested"] = True
+    _status_wakeup.set()
+
+
+def _status_poller():
+    while True:
+        _status_wakeup.wait(timeout=next_status_poll())
+        _status_wakeup.clear()
+        sync_shared_state()
+        evict_idle_configurations()
+        for state in configurations():
+            with using_configuration(state):
+                if status_poll_due():
+                    refresh_instance_state()
+
+
+def ensure_status_poller():
+    """Start the poller thread once per worker process."""
+    global _status_poller_pid
+    pid = os.getpid()
+    if _status_poller_pid == pid:
+        return
+    with _status_cond:
+        if _status_poller_pid == pid:
+            return
+        threading.Thread(target=_status_poller, name="status-poller", daemon=True).start()
+        _status_poller_pid = pid
+
+
+def wait_for_fresh_status(timeout):
+    """Wake the poller and wait up to timeout for it to report back."""
+    state = current_configuration()
+    with _status_cond:
+        generation = state["status_generation"]
+        request_status_refresh()
+        _status_cond.wait_for(lambda: state["status_generation"] != generation, timeout=timeout)
+
+
+# ============ WEBHOOKS ============
+# Streamrun can push instance lifecycle events instead of being polled:
+#
+#     POST /api/webhooks/streamrun
+#     X-Streamrun-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">
+#     {"id": "evt-1", "type": "instance.updated", "created": 1700000000.0,
+#      "data": {"instance": {"id": "...", "state": "RUNNING", "createdAt": "..."}}}
+#
+# Deliveries are idempotent: repeated event ids are acknowledged and ignored,
+# and an event older than the last one applied to its instance changes
+# nothing, so a stand-in can replay its whole log safely. Events for a
+# configuration that is not loaded are not remembered, so a replay after it
+# loads applies them. Events are applied one at a time.
+
+_webhook_event_ids = OrderedDict()
+_webhook_latest = OrderedDict()  # instance id -> created time of its newest event
+_webhook_lock = threading.Lock()
+
+
+def webhook_signature(secret, timestamp, body):
+    message = f"{timestamp}.".encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_webhook(body, header, now=None):
+    """Check an X-Streamrun-Signature header; returns an error message or None."""
+    parts = dict(item.split("=", 1) for item in (header or "").split(",") if "=" in item)
+    timestamp, signature = parts.get("t"), parts.get("v1")
+    if not timestamp or not signature:
+        return "Missing signature"
+    try:
+        age = (now or time.time()) - float(timestamp)
+    except ValueError:
+        return "Bad signature timestamp"
+    if abs(age) > WEBHOOK_TOLERANCE:
+        return "Signature expired"
+    if not hmac.compare_digest(webhook_signature(WEBHOOK_SECRET, timestamp, body), signature):
+        return "Bad signature"
+    return None
+
+
+def webhooks_live():
+    """Whether a webhook arrived recently enough to trust pushed state."""
+    pushed_at = current_configuration()["instance"]["pushed_at"]
+    return bool(WEBHOOK_SECRET) and pushed_at is not None and time.time() - pushed_at < WEBHOOK_TRUST
+
+
+def configuration_for_instance(instance):
+    """The loaded configuration an event's instance belongs to, or None.
+
+    Events that do not name their configuration go to the one whose current
+    instance they describe, else to CONFIGURATION_ID.
+    """
+    config_id = instance.get("configurationId") or instance.get("configuration_id")
+    if config_id:
+        return loaded_configuration(config_id)
+    for state in configurations():
+        if state["instance"]["id"] == instance.get("id"):
+            return state
+    return loaded_configuration(CONFIGURATION_ID)
+
+
+def apply_instance_event(event_id, created, instance):
+    """Fold one lifecycle event into its configuration; returns a short result."""
+    instance_id = instance.get("id")
+    state = (instance.get("state") or "").upper()
+    if not instance_id or not state:
+        return "Ignored: no instance"
+    # Not remembered: a replay once the configuration is loaded applies it
+    config = configuration_for_instance(instance)
+    if config is None:
+        return "Ignored: configuration not loaded"
+    with _webhook_lock:
+        if event_id in _webhook_event_ids:
+            return "Duplicate"
+        if created < _webhook_latest.get(instance_id, created):
+            result = "Ignored: out of order"
+        else:
+            with using_configuration(config):
+                result = apply_configuration_event(instance_id, state, instance, created)
+            _webhook_latest[instance_id] = created
+            _webhook_latest.move_to_end(instance_id)
+            if len(_webhook_latest) > 1024:
+                _webhook_latest.popitem(last=False)
+        # Only marked once handled, so an event that failed to apply can be redelivered
+        _webhook_event_ids[event_id] = True
+        if len(_webhook_event_ids) > 1024:
+            _webhook_event_ids.popitem(last=False)
+    return result
+
+
+def newer_instance_active(instance_id, created):
+    """Whether another active instance should stay current over instance_id.
+
+    That is one the registry orders after it, or the current instance when it
+    was last pushed by a newer event. The caller holds _webhook_lock.
+    """
+    newest = active_instance()
+    if newest is not None and newest["id"] != instance_id:
+        return True
+    current_instance = current_configuration()["instance"]
+    current_id = current_instance["id"]
+    return (
+        current_id not in (None, instance_id)
+        and (current_instance["state"] or "").upper() in ACTIVE_STATES
+        and _webhook_latest.get(current_id, created) > created
+    )
+
+
+def apply_configuration_event(instance_id, state, instance, created):
+    record_upstream_instance(instance)
+    with _status_cond:
+        current_instance = current_configuration()["instance"]
+        current_instance["pushed_at"] = time.time()
+        current_id = current_instance["id"]
+    if state in ACTIVE_STATES:
+        # The newest active instance wins, even one started outside the proxy
+        if newer_instance_active(instance_id, created):
+            publish_instance()
+            return "Ignored: newer instance active"
+        set_instance(instance_id, state, instance.get("createdAt") or instance.get("created_at"))
+    elif current_id == instance_id:
+        set_instance(None, state)
+    else:
+        publish_instance()
+        return "Ignored: not the current instance"
+    return f"Instance {state}"
+
+
+def handle_webhook(body, signature):
+    """Verify and apply a webhook delivery; returns (HTTP status, plain text)."""
+    if not WEBHOOK_SECRET:
+        return 404, "Webhooks are not configured"
+    error = verify_webhook(body, signature)
+    if error:
+        WEBHOOKS.inc("rejected")
+        log.warning("Rejected webhook", reason=error)
+        return 401, error
+    try:
+        event = json.loads(body)
+        data = event.get("data") or {}
+        result = apply_instance_event(
+            str(event["id"]), float(event.get("created") or 0), data.get("instance") or {}
+        )
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        WEBHOOKS.inc("invalid")
+        return 400, f"Invalid event: {str(e)}"
+    WEBHOOKS.inc("duplicate" if result == "Duplicate" else "accepted")
+    log.info("Webhook", event_id=event["id"], type=event.get("type"), result=result)
+    return 200, result
+
+
+@routes.route("/api/webhooks/streamrun", methods=["POST"])
+def api_webhook():
+    """Instance lifecycle events pushed by Streamrun - returns plain text."""
+    status, message = handle_webhook(request.get_data(), request.headers.get("X-Streamrun-Signature"))
+    return message, status
+
+
+@routes.before_app_request
+def _start_background_workers():
+    logs.start_writer()
+    ensure_startup_fetch()
+    ensure_status_poller()
+    ensure_config_refresher()
+    sync_shared_state()
+
+
+# ============ WEB DASHBOARD ============
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Brotli is optional; without it clients get gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _build_asset(body, content_type, cache_control):
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    variants = {
+        "identity": (body, f'"{digest}"'),
+        "gzip": (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+    }
+    if brotli is not None:
+        variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+    return {
+        "digest": digest,
+        "content_type": content_type,
+        "cache_control": cache_control,
+        "variants": variants,
+        "etags": {etag for _, etag in variants.values()}
+    }
+
+
+def build_static_assets():
+    """Precompress the dashboard files and give CSS/JS content-hashed URLs."""
+    assets = {}
+    urls = {}
+    for name, content_type in (
+        ("dashboard.css", "text/css; charset=utf-8"),
+        ("dashboard.js", "application/javascript; charset=utf-8")
+    ):
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            asset = _build_asset(f.read(), content_type, IMMUTABLE_CACHE_CONTROL)
+        stem, ext = os.path.splitext(name)
+        urls[name] = f"/assets/{stem}.{asset['digest']}{ext}"
+        assets[urls[name]] = asset
+
+    with open(os.path.join(STATIC_DIR, "dashboard.html"), encoding="utf-8") as f:
+        html = f.read()
+    for name, url in urls.items():
+        html = html.replace("{{ %s }}" % name, url)
+    # The page URL is not versioned, so browsers revalidate it with the ETag
+    assets["/"] = _build_asset(html.encode("utf-8"), "text/html; charset=utf-8", "no-cache")
+    return assets
 
 
-# Fetch elements on startup
-fetch_and_categorize_elements()
+static_assets = {}
 
 
-# ============ WEB DASHBOARD ============
+def _accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        q = params.strip().replace(" ", "")
+        if q in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def negotiate_asset(asset, accept_encoding, if_none_match):
+    """Pick the response for a static asset: (status, headers, body)."""
+    headers = {
+        "Cache-Control": asset["cache_control"],
+        "Vary": "Accept-Encoding"
+    }
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip", "identity"):
+        if encoding in asset["variants"] and (encoding == "identity" or encoding in accepted):
+            body, etag = asset["variants"][encoding]
+            break
+    headers["ETag"] = etag
+
+    # If-None-Match uses weak comparison, and every variant has the same content
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in candidates or candidates & asset["etags"]:
+        CACHE_REQUESTS.inc("static", "not_modified")
+        return 304, headers, b""
+    CACHE_REQUESTS.inc("static", "sent")
+
+    headers["Content-Type"] = asset["content_type"]
+    headers["Content-Length"] = str(len(body))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return 200, headers, body
+
+
+def serve_asset(path):
+    asset = static_assets.get(path)
+    if asset is None:
+        return "Not found", 404
+    status, headers, body = negotiate_asset(
+        asset,
+        request.headers.get("Accept-Encoding", ""),
+        request.headers.get("If-None-Match", "")
+    )
+    return current_app.response_class(body, status=status, headers=headers)
+
 
-@app.route("/")
+def serve_state(kind):
+    status, headers, body = negotiate_state(kind, request.headers.get("If-None-Match", ""))
+    return current_app.response_class(body, status=status, headers=headers)
+
+
+@routes.route("/")
 def dashboard():
     """Serve the web control panel."""
-    html = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Streamrun Control Panel</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                background: #2a2a2a;
-                color: #fff;
-                min-height: 100vh;
-                padding: 20px;
-            }
-            
-            .dashboard {
-                max-width: 1200px;
-                margin: 0 auto;
-            }
-            
-            .header {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-bottom: 30px;
-            }
-            
-            .header h1 {
-                font-size: 24px;
-                font-weight: 600;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            
-            .grid {
-                display: grid;
-                grid-template-columns: repeat(3, 1fr);
-                gap: 20px;
-                margin-bottom: 20px;
-            }
-            
-            .panel {
-                background: #3a3a3a;
-                border-radius: 8px;
-                padding: 20px;
-                border: 1px solid #4a4a4a;
-            }
-            
-            .panel-title {
-                font-size: 16px;
-                font-weight: 600;
-                margin-bottom: 15px;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            
-            .panel-title .status-badge {
-                display: inline-block;
-                padding: 4px 12px;
-                border-radius: 12px;
-                font-size: 12px;
-                font-weight: 600;
-                margin-left: auto;
-            }
-            
-            .status-badge.online {
-                background: #28a745;
-                color: white;
-            }
-            
-            .status-badge.offline {
-                background: #dc3545;
-                color: white;
-            }
-            
-            .status-badge.unknown {
-                background: #6c757d;
-                color: white;
-            }
-            
-            .btn-group {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 10px;
-                margin-bottom: 15px;
-            }
-            
-            .btn-group.full {
-                grid-template-columns: 1fr;
-            }
-            
-            .btn {
-                padding: 12px 16px;
-                border: none;
-                border-radius: 6px;
-                font-size: 14px;
-                font-weight: 600;
-                cursor: pointer;
-                transition: all 0.2s ease;
-                text-align: center;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 6px;
-            }
-            
-            .btn:hover {
-                transform: translateY(-1px);
-                box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
-            }
-            
-            .btn:active {
-                transform: translateY(0);
-            }
-            
-            .btn-primary {
-                background: #667eea;
-                color: white;
-            }
-            
-            .btn-primary:hover {
-                background: #5568d3;
-            }
-            
-            .btn-success {
-                background: #28a745;
-                color: white;
-            }
-            
-            .btn-success:hover {
-                background: #218838;
-            }
-            
-            .btn-danger {
-                background: #dc3545;
-                color: white;
-            }
-            
-            .btn-danger:hover {
-                background: #c82333;
-            }
-            
-            .btn-info {
-                background: #17a2b8;
-                color: white;
-            }
-            
-            .btn-info:hover {
-                background: #138496;
-            }
-            
-            .btn-secondary {
-                background: #6c757d;
-                color: white;
-            }
-            
-            .btn-secondary:hover {
-                background: #5a6268;
-            }
-            
-            .btn-element {
-                background: #667eea;
-                color: white;
-                padding: 14px 12px;
-                flex-direction: column;
-                font-size: 13px;
-            }
-            
-            .btn-element:hover {
-                background: #5568d3;
-            }
-            
-            .btn-element.active {
-                background: #28a745;
-                box-shadow: 0 0 10px rgba(40, 167, 69, 0.4);
-            }
-            
-            .element-name {
-                font-size: 11px;
-                margin-top: 4px;
-                opacity: 0.9;
-            }
-            
-            .message {
-                padding: 12px 16px;
-                border-radius: 6px;
-                margin-bottom: 15px;
-                font-size: 13px;
-                display: none;
-            }
-            
-            .message.show {
-                display: block;
-            }
-            
-            .message-success {
-                background: #d4edda;
-                color: #155724;
-                border: 1px solid #c3e6cb;
-            }
-            
-            .message-error {
-                background: #f8d7da;
-                color: #721c24;
-                border: 1px solid #f5c6cb;
-            }
-            
-            .message-info {
-                background: #d1ecf1;
-                color: #0c5460;
-                border: 1px solid #bee5eb;
-            }
-            
-            .loading {
-                display: none;
-                text-align: center;
-                color: #667eea;
-                font-size: 13px;
-                padding: 10px;
-            }
-            
-            .loading.show {
-                display: block;
-            }
-            
-            .spinner {
-                display: inline-block;
-                width: 12px;
-                height: 12px;
-                border: 2px solid #4a4a4a;
-                border-top: 2px solid #667eea;
-                border-radius: 50%;
-                animation: spin 0.8s linear infinite;
-                margin-right: 6px;
-            }
-            
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-            
-            .info-block {
-                background: #2a2a2a;
-                border-radius: 6px;
-                padding: 12px;
-                font-size: 13px;
-                margin-bottom: 10px;
-            }
-            
-            .info-row {
-                display: flex;
-                justify-content: space-between;
-                padding: 6px 0;
-            }
-            
-            .info-row strong {
-                color: #aaa;
-            }
-            
-            .info-row span {
-                color: #fff;
-                font-weight: 600;
-            }
-            
-            .full-width {
-                grid-column: 1 / -1;
-            }
-            
-            @media (max-width: 1024px) {
-                .grid {
-                    grid-template-columns: repeat(2, 1fr);
-                }
-            }
-            
-            @media (max-width: 768px) {
-                .grid {
-                    grid-template-columns: 1fr;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="dashboard">
-            <div class="header">
-                <h1>🎬 Streamrun Control Panel</h1>
-                <div id="message" class="message"></div>
-            </div>
-            
-            <div id="loading" class="loading"><span class="spinner"></span> Loading...</div>
-            
-            <div class="grid">
-                <!-- Stream Control Panel -->
-                <div class="panel">
-                    <div class="panel-title">
-                        Stream
-                        <span class="status-badge offline" id="streamStatus">Offline</span>
-                    </div>
-                    <div class="btn-group full">
-                        <button class="btn btn-success" onclick="goLive()">▶ Start</button>
-                        <button class="btn btn-danger" onclick="stopInstance()">⏹ Stop</button>
-                    </div>
-                    <div class="info-block">
-                        <div class="info-row">
-                            <strong>Instance:</strong>
-                            <span id="instanceId">None</span>
-                        </div>
-                        <div class="info-row">
-                            <strong>State:</strong>
-                            <span id="instanceState">UNKNOWN</span>
-                        </div>
-                        <div class="info-row">
-                            <strong>Started:</strong>
-                            <span id="instanceTime">—</span>
-                        </div>
-                    </div>
-                </div>
-                
-                <!-- Element Selection Panel -->
-                <div class="panel">
-                    <div class="panel-title">
-                        Element
-                        <span class="status-badge offline">Select</span>
-                    </div>
-                    <div style="display: grid; grid-template-columns: 1fr 1fr 1fr; gap: 8px;" id="elementButtons">
-                        <!-- Buttons will be inserted here by JavaScript -->
-                    </div>
-                </div>
-                
-                <!-- Scene / Output Selection Panel -->
-                <div class="panel">
-                    <div class="panel-title">
-                        Scene
-                        <span class="status-badge online">Active</span>
-                    </div>
-                    <div class="btn-group full">
-                        <button class="btn btn-primary" onclick="toggleLive()">📡 LIVE</button>
-                        <button class="btn btn-secondary" onclick="toggleOffline()">📡 OFFLINE</button>
-                    </div>
-                </div>
-            </div>
-            
-            <!-- Bottom action buttons -->
-            <div class="grid full-width" style="grid-template-columns: 1fr;">
-                <button class="btn btn-info" onclick="refreshStatus()">🔄 Refresh Status</button>
-            </div>
-        </div>
-        
-        <script>
-            const API_BASE = window.location.origin;
-            let currentElement = null;
-            
-            function showMessage(text, type = 'info') {
-                const msg = document.getElementById('message');
-                msg.textContent = text;
-                msg.className = `message show message-${type}`;
-                setTimeout(() => msg.classList.remove('show'), 5000);
-            }
-            
-            function setLoading(show) {
-                document.getElementById('loading').classList.toggle('show', show);
-            }
-            
-            function refreshInstanceData() {
-                fetch(`${API_BASE}/api/instance-data`)
-                    .then(r => r.json())
-                    .then(data => {
-                        document.getElementById('instanceId').textContent = data.id || 'None';
-                        document.getElementById('instanceState').textContent = data.state || 'UNKNOWN';
-                        document.getElementById('instanceTime').textContent = data.started_at || '—';
-                        
-                        const statusBadge = document.getElementById('streamStatus');
-                        const state = (data.state || 'UNKNOWN').toLowerCase();
-                        statusBadge.className = `status-badge ${state === 'running' || state === 'queued' ? 'online' : 'offline'}`;
-                        statusBadge.textContent = data.state || 'UNKNOWN';
-                    })
-                    .catch(e => console.error('Error refreshing:', e));
-            }
-            
-            function loadElements() {
-                fetch(`${API_BASE}/api/elements-categorized`)
-                    .then(r => r.json())
-                    .then(data => {
-                        const container = document.getElementById('elementButtons');
-                        container.innerHTML = '';
-                        
-                        const categories = ['PC', 'Mobile', 'BRB Screen'];
-                        categories.forEach(cat => {
-                            if (data[cat] && data[cat].id) {
-                                const btn = document.createElement('button');
-                                btn.className = 'btn btn-element';
-                                btn.setAttribute('data-element-id', data[cat].id);
-                                btn.innerHTML = `📺 ${cat}<span class="element-name">${data[cat].name}</span>`;
-                                btn.onclick = () => switchElementTo(data[cat].id, btn);
-                                container.appendChild(btn);
-                            }
-                        });
-                    })
-                    .catch(e => console.error('Error loading elements:', e));
-            }
-            
-            function callAPI(endpoint, params = '') {
-                setLoading(true);
-                const url = `${API_BASE}${endpoint}${params}`;
-                fetch(url)
-                    .then(r => r.text())
-                    .then(text => {
-                        showMessage(text, 'success');
-                        setLoading(false);
-                        setTimeout(refreshInstanceData, 1000);
-                    })
-                    .catch(e => {
-                        showMessage('Error: ' + e.message, 'error');
-                        setLoading(false);
-                    });
-            }
-            
-            function goLive() {
-                callAPI('/api/golive');
-            }
-            
-            function stopInstance() {
-                if (confirm('Stop stream instance?')) {
-                    callAPI('/api/stop');
-                }
-            }
-            
-            function toggleLive() {
-                callAPI('/api/outputs?state=LIVE');
-            }
-            
-            function toggleOffline() {
-                callAPI('/api/outputs?state=OFFLINE');
-            }
-            
-            function switchElementTo(elementId, btnElement) {
-                setLoading(true);
-                const url = `${API_BASE}/api/switch-element?element_id=${encodeURIComponent(elementId)}`;
-                fetch(url)
-                    .then(r => r.text())
-                    .then(text => {
-                        showMessage(text, 'success');
-                        
-                        // Update active button styling
-                        document.querySelectorAll('#elementButtons .btn-element').forEach(btn => {
-                            btn.classList.remove('active');
-                        });
-                        if (btnElement) {
-                            btnElement.classList.add('active');
-                        }
-                        
-                        currentElement = elementId;
-                        setLoading(false);
-                    })
-                    .catch(e => {
-                        showMessage('Error: ' + e.message, 'error');
-                        setLoading(false);
-                    });
-            }
-            
-            function refreshStatus() {
-                refreshInstanceData();
-                loadElements();
-                showMessage('Status refreshed', 'info');
-            }
-            
-            // Load on startup
-            refreshInstanceData();
-            loadElements();
-        </script>
-    </body>
-    </html>
+    if "config" in request.args and not request.url_rule.rule.startswith(CONFIGURATION_PREFIX):
+        return redirect(dashboard_location(configuration_id()))
+    return serve_asset("/")
+
+
+def dashboard_location(config_id):
+    """Where the dashboard for config_id lives.
+
+    The page takes its configuration from the path, so /?config=<id> is
+    redirected there rather than served as the default configuration's.
     """
-    return html
+    return f"/c/{quote(config_id, safe='')}/"
 
 
-@app.route("/api/instance-data")
+@routes.route("/assets/<name>")
+def dashboard_asset(name):
+    """Serve a versioned dashboard asset."""
+    return serve_asset(f"/assets/{name}")
+
+
+@routes.route("/api/instance-data")
 def instance_data():
     """API endpoint for current instance data (JSON)."""
-    return jsonify({
-        "id": current_instance["id"] or "None",
-        "state": current_instance["state"],
-        "started_at": current_instance["started_at"] or "—"
-    })
+    if current_configuration()["instance"]["id"] and status_age() > STATUS_MAX_AGE:
+        request_status_refresh()
+    return serve_state("instance")
 
 
-@app.route("/api/elements-categorized")
+@routes.route("/api/elements-categorized")
 def get_elements_categorized():
-    """Get categorized elements (PC, Mobile, BRB Screen)."""
-    return jsonify({
-        "PC": elements_cache["PC"],
-        "Mobile": elements_cache["Mobile"],
-        "BRB Screen": elements_cache["BRB Screen"]
-    })
+    """Get categorized elements (one entry per category rule)."""
+    return serve_state("elements")
+
+
+@routes.route("/api/events")
+def api_events():
+    """Server-Sent Events stream of instance, switch input and element changes.
+
+    Each open stream holds a worker thread; under a sync worker this answers
+    503 and clients stay on polling.
+    """
+    if not events_supported(request.environ.get("wsgi.multithread", False)):
+        return "Server-Sent Events need a threaded or async worker", 503
+    messages = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+    deliver = messages.put_nowait
+    subscribe_events(deliver)
+    # The stream is iterated after the request, outside its configuration
+    state = current_configuration()
+
+    def stream():
+        try:
+            with using_configuration(state):
+                yield initial_events()
+            last_sent = time.monotonic()
+            while is_subscribed(deliver):
+                try:
+                    yield messages.get(timeout=EVENTS_SYNC_INTERVAL)
+                    last_sent = time.monotonic()
+                except queue.Empty:
+                    # Pick up changes made by other workers
+                    sync_shared_state()
+                    if time.monotonic() - last_sent >= EVENTS_HEARTBEAT:
+                        yield ": keep-alive\n\n"
+                        last_sent = time.monotonic()
+        finally:
+            unsubscribe_events(deliver)
+
+    return current_app.response_class(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # ============ STREAMELEMENTS FRIENDLY API ============
 # These endpoints return PLAIN TEXT only - perfect for $(customapi)
 
-@app.route("/api/status")
+@routes.route("/api/status")
 def api_status():
     """Check instance status - returns plain text."""
     try:
-        instance_id = current_instance["id"]
+        instance_id = current_configuration()["instance"]["id"]
         
         if not instance_id:
             return "No active instance. Go live first."
 
-        url = f"{BASE_URL}/instances/{instance_id}"
-        r = requests.get(url, headers=HEADERS)
-        if not r.ok:
-            return f"Error {r.status_code}"
+        # Serve from memory; when stale, give the poller a short window to
+        # revalidate and fall back to the last known state if upstream is slow
+        if status_age() > STATUS_MAX_AGE:
+            wait_for_fresh_status(STATUS_REVALIDATE_TIMEOUT)
+            CACHE_REQUESTS.inc("status", "refreshed" if status_age() <= STATUS_MAX_AGE else "stale")
+        else:
+            CACHE_REQUESTS.inc("status", "hit")
 
-        data = r.json()
-        state = data.get("state", "UNKNOWN")
-        current_instance["state"] = state
-        return state
+        return status_answer()
     except Exception as e:
-        print(f"Error in api_status: {e}")
+        log.error("Error in api_status", error=str(e))
         return f"Error: {str(e)}"
 
 
-@app.route("/api/golive")
-def api_golive():
-    """Start instance - returns plain text. Detects if already running by 0 slots error."""
-    try:
-        body = {
-            "numberOfInstances": 1,
-            "instanceSettings": [
-                {
-                    "name": "Live Stream Instance",
-                    "overrides": {}
-                }
-            ]
-        }
+# ============ GO LIVE ============
+# Going live is idempotent: a fresh local state that already shows a live
+# instance answers without calling upstream, concurrent callers share one
+# pending start, and a caller-supplied idempotency key replays the result.
+
+_golive_results = OrderedDict()
+_golive_results_lock = threading.Lock()
+
+
+def known_active_instance():
+    """Go-live answer when fresh local state already shows a live instance."""
+    current_instance = current_configuration()["instance"]
+    state = (current_instance["state"] or "").upper()
+    if current_instance["id"] and state in ACTIVE_STATES and status_age() <= STATUS_MAX_AGE:
+        return f"Instance already running: {state}"
+    return None
+
+
+def record_created_instance(data):
+    """Record the instance a create response names; False if it names none."""
+    created = instance_from_create_response(data)
+    if created is None:
+        return False
+    state = (created.get("state") or "RUNNING").upper()
+    started_at = created.get("createdAt") or created.get("created_at") or datetime.now().isoformat()
+    set_instance(created["id"], state, started_at)
+    return True
 
-        url = f"{BASE_URL}/configurations/{CONFIGURATION_ID}/instances"
-        print(f"POST {url} with body: {body}")
-        r = requests.post(url, headers=HEADERS, json=body)
-        
-        # Check if instance is already running (0 slots available)
-        if r.status_code == 400:
-            error_text = r.text.lower()
-            if "0 instance slots" in error_text or "no available slots" in error_text:
-                print("Instance already running (no slots available)")
-                # Get existing instance
-                instances_url = f"{BASE_URL}/configurations/{CONFIGURATION_ID}/instances"
-                instances_r = requests.get(instances_url, headers=HEADERS)
-                
-                if instances_r.ok:
-                    instances_data = instances_r.json()
-                    instances = instances_data.get("instances", [])
-                    if instances:
-                        for inst in instances:
-                            state = inst.get("state", "").upper()
-                            if state in ("RUNNING", "QUEUED", "STARTING"):
-                                instance_id = inst.get("id")
-                                if instance_id:
-                                    current_instance["id"] = instance_id
-                                    current_instance["state"] = state
-                                    created_at = inst.get("createdAt") or inst.get("created_at")
-                                    current_instance["started_at"] = created_at
-                                    return f"Instance already running: {state}"
-                
-                return "Instance already running"
-            else:
-                return f"Error: {r.text}"
-        
-        if not r.ok:
-            error_text = r.text
-            print(f"Error {r.status_code}: {error_text}")
-            return f"Error {r.status_code}: {error_text}"
-
-        # Successfully created new instance
-        instances_url = f"{BASE_URL}/configurations/{CONFIGURATION_ID}/instances"
-        instances_r = requests.get(instances_url, headers=HEADERS)
-        
-        if instances_r.ok:
-            instances_data = instances_r.json()
-            instances = instances_data.get("instances", [])
-            if instances:
-                latest = instances[0]
-                instance_id = latest.get("id")
-                if instance_id:
-                    current_instance["id"] = instance_id
-                    current_instance["started_at"] = datetime.now().isoformat()
-                    current_instance["state"] = "RUNNING"
-                    return "Starting stream"
 
+def adopt_running_instance(instance):
+    """Make an already running registry instance current; returns the go-live answer."""
+    set_instance(instance["id"], instance["state"], instance["created_at"])
+    return f"Instance already running: {instance['state']}"
+
+
+def adopt_newest_instance():
+    """After a create response that did not name the instance, make the newest
+    listed one current; False if none is known."""
+    instance = newest_instance()
+    if instance is None:
+        return False
+    set_instance(instance["id"], instance["state"] or "RUNNING", instance["created_at"] or datetime.now().isoformat())
+    return True
+
+
+def idempotent_result(key):
+    """The remembered go-live result for key, if it has not expired."""
+    key = (configuration_id(), key)
+    with _golive_results_lock:
+        remembered = _golive_results.get(key)
+        if remembered is None:
+            return None
+        expires_at, result = remembered
+        if expires_at < time.time():
+            del _golive_results[key]
+            return None
+        return result
+
+
+def remember_result(key, result):
+    # Errors are not remembered so the caller can retry with the same key
+    if result.startswith("Error"):
+        return
+    key = (configuration_id(), key)
+    with _golive_results_lock:
+        _golive_results[key] = (time.time() + GOLIVE_IDEMPOTENCY_TTL, result)
+        while len(_golive_results) > 256:
+            _golive_results.popitem(last=False)
+
+
+def _start_instance():
+    known = known_active_instance()
+    if known:
+        return known
+
+    body = golive_body()
+
+    path = f"/configurations/{configuration_id()}/instances"
+    log.debug("Creating instance", path=path, body=body)
+    r = upstream("POST", path, json=body)
+    
+    # Check if instance is already running (0 slots available)
+    if r.status_code == 400:
+        error_text = r.text.lower()
+        if "0 instance slots" in error_text or "no available slots" in error_text:
+            log.info("Instance already running (no slots available)")
+            # The registry usually knows which one; list only when it does not
+            inst = trusted_active_instance()
+            if inst is None:
+                try:
+                    instances_r = upstream("GET", path)
+                    if instances_r.ok:
+                        record_instance_list(instances_r.json().get("instances", []))
+                except UpstreamUnavailable:
+                    # Throttled or circuit open: go with what the registry has
+                    pass
+                inst = active_instance()
+            if inst:
+                return adopt_running_instance(inst)
+            return "Instance already running"
+        else:
+            return f"Error: {r.text}"
+    
+    if not r.ok:
+        error_text = r.text
+        log.warning("Upstream error", status=r.status_code, body=error_text)
+        return f"Error {r.status_code}: {error_text}"
+
+    # Successfully created new instance; the response usually names it
+    try:
+        recorded = record_created_instance(r.json())
+    except ValueError:
+        recorded = False
+    if recorded:
+        return "Starting stream"
+
+    try:
+        instances_r = upstream("GET", path)
+    except UpstreamUnavailable:
+        # The instance was created; the poller and webhooks will name it
         return "Stream starting"
+
+    if instances_r.ok:
+        record_instance_list(instances_r.json().get("instances", []))
+        if adopt_newest_instance():
+            return "Starting stream"
+
+    return "Stream starting"
+
+
+def start_instance():
+    """Go live, sharing one pending start between concurrent callers."""
+    return single_flight(("golive", configuration_id()), _start_instance)
+
+
+@routes.route("/api/golive")
+@caller_cooldown
+def api_golive():
+    """Start instance - returns plain text. Detects if already running by 0 slots error.
+
+    Pass an Idempotency-Key header (or ?key=) to make retries replay the first result.
+    """
+    try:
+        key = request.headers.get("Idempotency-Key") or request.args.get("key")
+        if key:
+            remembered = idempotent_result(key)
+            if remembered is not None:
+                return remembered
+        result = start_instance()
+        if key:
+            remember_result(key, result)
+        return result
     except Exception as e:
-        print(f"Error in api_golive: {e}")
+        log.error("Error in api_golive", error=str(e))
         return f"Error: {str(e)}"
 
 
-@app.route("/api/stop")
+def stop_instance():
+    instance_id = current_configuration()["instance"]["id"]
+
+    if not instance_id:
+        return "No active instance"
+
+    r = upstream("DELETE", f"/instances/{instance_id}")
+    if r.status_code in (200, 204):
+        set_instance(None, "STOPPED")
+        return "Stream stopped"
+    return f"Error {r.status_code}: {r.text}"
+
+
+@routes.route("/api/stop")
+@caller_cooldown
 def api_stop():
     """Stop instance - returns plain text."""
     try:
-        instance_id = current_instance["id"]
-        
-        if not instance_id:
-            return "No active instance"
-        
-        url = f"{BASE_URL}/instances/{instance_id}"
-        r = requests.delete(url, headers=HEADERS)
-        if r.status_code in (200, 204):
-            current_instance["id"] = None
-            current_instance["state"] = "STOPPED"
-            return "Stream stopped"
-        return f"Error {r.status_code}: {r.text}"
+        return stop_instance()
     except Exception as e:
-        print(f"Error in api_stop: {e}")
+        log.error("Error in api_stop", error=str(e))
         return f"Error: {str(e)}"
 
 
-@app.route("/api/outputs")
+def set_outputs(state):
+    state = state.upper()
+    if state not in ("LIVE", "OFFLINE"):
+        return "Invalid state"
+
+    instance_id = current_configuration()["instance"]["id"]
+    if not instance_id:
+        return "No active instance. Start stream first."
+
+    # Use PUT endpoint as per API docs for setting outputs
+    path = f"/configurations/{configuration_id()}/instances"
+    body = {
+        "outputs": state
+    }
+    log.debug("Setting outputs", path=path, body=body)
+    r = upstream("PUT", path, json=body)
+
+    if not r.ok:
+        log.warning("Upstream error", status=r.status_code, body=r.text)
+        return f"Error {r.status_code}: {r.text}"
+
+    return f"Outputs {state}"
+
+
+@routes.route("/api/outputs")
+@caller_cooldown
 def api_outputs():
     """Toggle outputs LIVE/OFFLINE - returns plain text."""
     try:
-        state = request.args.get("state", "LIVE").upper()
-        if state not in ("LIVE", "OFFLINE"):
-            return "Invalid state"
+        return set_outputs(request.args.get("state", "LIVE"))
+    except Exception as e:
+        log.error("Error in api_outputs", error=str(e))
+        return f"Error: {str(e)}"
+
+
+def check_switch(ref):
+    """Validate a switch against local state: (element_id, None) or (None, message)."""
+    if not ref:
+        return None, "Missing element_id"
+
+    state = current_configuration()
+    if not state["instance"]["id"]:
+        return None, "No active instance. Start stream first."
+
+    if not state["switch_element_id"]:
+        return None, "Switch element not found in configuration"
+
+    element_id = resolve_element_id(ref)
+    if element_id is None:
+        return None, "Unknown element"
+    return element_id, None
 
-        instance_id = current_instance["id"]
-        if not instance_id:
-            return "No active instance. Start stream first."
 
-        # Use PUT endpoint as per API docs for setting outputs
-        url = f"{BASE_URL}/configurations/{CONFIGURATION_ID}/instances"
-        body = {
-            "outputs": state
+def switch_body(element_id):
+    # PATCH the switch element with the selected input
+    # Based on API docs: {"switch-1": {"input": "element-id"}}
+    return {
+        current_configuration()["switch_element_id"]: {
+            "input": element_id
         }
-        print(f"PUT {url} with body: {body}")
-        r = requests.put(url, headers=HEADERS, json=body)
-        
-        if not r.ok:
-            print(f"Error {r.status_code}: {r.text}")
-            return f"Error {r.status_code}: {r.text}"
+    }
+
+
+def patch_switch(instance_id, element_id):
+    """Send the switch override upstream; returns None or an error message."""
+    body = switch_body(element_id)
+    path = f"/instances/{instance_id}/overrides"
+    log.debug("Switching input", path=path, body=body)
+    r = upstream("PATCH", path, json=body)
+
+    if not r.ok:
+        log.warning("Upstream error", status=r.status_code, body=r.text)
+        return f"Error {r.status_code}: {r.text}"
+    return None
+
+
+def switch_element(ref):
+    started = time.perf_counter()
+    element_id, problem = check_switch(ref)
+    if problem:
+        return problem
+
+    error = patch_switch(current_configuration()["instance"]["id"], element_id)
+    SWITCH_LATENCY.observe(time.perf_counter() - started, "blocking", "failed" if error else "confirmed")
+    if error:
+        return error
+
+    log.info("Switched input", element_id=element_id)
+    set_active_input(element_id)
+    return f"Switched to element"
+
+
+# ============ OPTIMISTIC SWITCHING ============
+# The requested input is shown as "pending" at once and the PATCH goes out on
+# the configuration's own background thread, in request order, over the
+# pooled keep-alive session. The outcome arrives as a "switch" event: "confirmed", or "failed"
+# with the display rolled back to the last confirmed input. A switch that a
+# newer one overtakes before it is sent is skipped ("superseded").
+
+_switch_ops = OrderedDict()
+_switch_lock = threading.Lock()
+_switch_executors = {}  # configuration id -> single-thread executor
+_switch_executors_lock = threading.Lock()
+_switch_executors_pid = None
+
+
+def get_switch_executor():
+    """The current configuration's switch thread in this worker (rebuilt after
+    fork), so a slow PATCH for one configuration never delays another's."""
+    global _switch_executors_pid
+    config_id = configuration_id()
+    with _switch_executors_lock:
+        if _switch_executors_pid != os.getpid():
+            _switch_executors.clear()
+            _switch_executors_pid = os.getpid()
+        executor = _switch_executors.get(config_id)
+        if executor is None:
+            executor = _switch_executors[config_id] = ThreadPoolExecutor(1, thread_name_prefix="switch")
+    return executor
+
+
+def close_switch_executor(config_id):
+    """Let an evicted configuration's switch thread finish its queue and exit."""
+    with _switch_executors_lock:
+        executor = _switch_executors.pop(config_id, None)
+    if executor is not None:
+        executor.shutdown(wait=False)
 
-        return f"Outputs {state}"
+
+def begin_switch(element_id):
+    """Show element_id as pending and return the new operation id."""
+    op_id = uuid.uuid4().hex[:12]
+    with _switch_lock:
+        _switch_ops[op_id] = {
+            "element_id": element_id,
+            "status": "pending",
+            "error": None,
+            "accepted": time.perf_counter()
+        }
+        while len(_switch_ops) > 256:
+            _switch_ops.popitem(last=False)
+    set_active_input(element_id, "pending", op_id)
+    return op_id
+
+
+def switch_superseded(op_id):
+    return current_configuration()["active_input"]["op_id"] != op_id
+
+
+def finish_switch(op_id, status, error=None):
+    """Settle an optimistic switch and publish the outcome if it is still current.
+
+    A successful PATCH always becomes the confirmed input, current or not.
+    """
+    with _switch_lock:
+        op = _switch_ops.get(op_id)
+        if op is None:
+            return
+        op["status"] = status
+        op["error"] = error
+    SWITCH_LATENCY.observe(time.perf_counter() - op["accepted"], "optimistic", status)
+    if switch_superseded(op_id):
+        # A newer switch owns the display, but upstream now shows this input:
+        # a rollback of the newer one must land here
+        if status == "confirmed":
+            set_confirmed_input(op["element_id"])
+        return
+    if status == "confirmed":
+        log.info("Switched input", element_id=op["element_id"], op_id=op_id)
+        set_active_input(op["element_id"], "confirmed", op_id)
+    else:
+        log.warning("Switch failed, rolling back", element_id=op["element_id"], op_id=op_id, error=error)
+        set_active_input(current_configuration()["active_input"]["confirmed_id"], "failed", op_id)
+
+
+def _send_switch(op_id, instance_id, element_id):
+    if switch_superseded(op_id):
+        finish_switch(op_id, "superseded")
+        return
+    try:
+        error = patch_switch(instance_id, element_id)
     except Exception as e:
-        print(f"Error in api_outputs: {e}")
-        return f"Error: {str(e)}"
+        error = f"Error: {str(e)}"
+    finish_switch(op_id, "failed" if error else "confirmed", error)
+
+
+def switch_element_optimistic(ref):
+    element_id, problem = check_switch(ref)
+    if problem:
+        return problem
+    op_id = begin_switch(element_id)
+    context = contextvars.copy_context()
+    instance_id = current_configuration()["instance"]["id"]
+    get_switch_executor().submit(context.run, _send_switch, op_id, instance_id, element_id)
+    return f"Switching to element (op {op_id})"
+
+
+def switch_op_status(op_id):
+    """Plain-text status of an optimistic switch."""
+    with _switch_lock:
+        op = _switch_ops.get(op_id)
+        if op is not None:
+            return f"{op['status']}: {op['error']}" if op["error"] else op["status"]
+    # Another worker took it; the shared state knows about the latest one
+    active_input = current_configuration()["active_input"]
+    if op_id and active_input["op_id"] == op_id:
+        return active_input["status"]
+    return "Unknown operation"
 
 
-@app.route("/api/switch-element")
+@routes.route("/api/switch-element")
+@caller_cooldown
 def api_switch_element():
-    """Switch element input - returns plain text. Uses PATCH /instances/{id}/overrides"""
+    """Switch element input - returns plain text. Uses PATCH /instances/{id}/overrides
+
+    ?mode=optimistic answers before upstream confirms (see OPTIMISTIC SWITCHING).
+    """
     try:
         element_id = request.args.get("element_id")
-        if not element_id:
-            return "Missing element_id"
+        if request.args.get("mode", SWITCH_MODE) == "optimistic":
+            return switch_element_optimistic(element_id)
+        return switch_element(element_id)
+    except Exception as e:
+        log.error("Error in api_switch_element", error=str(e))
+        return f"Error: {str(e)}"
 
-        instance_id = current_instance["id"]
-        
-        if not instance_id:
-            return "No active instance. Start stream first."
 
-        if not switch_element_id:
-            return "Switch element not found in configuration"
+@routes.route("/api/switch-status")
+def api_switch_status():
+    """Outcome of an optimistic switch (?op=<id>) - returns plain text."""
+    return switch_op_status(request.args.get("op"))
+
+
+# ============ BATCH COMMANDS ============
+# One request runs several commands, e.g. "switch to PC and set outputs LIVE"
+# for returning from a break. Operations without dependencies run
+# concurrently; an operation listed in another's "after" runs first, and if it
+# fails its dependents are skipped. As a query string, commas separate
+# concurrent operations and semicolons separate steps:
+#
+#     /api/batch?ops=golive;switch-element:input-pc,outputs:LIVE
+#
+# or POST JSON: {"operations": [{"id": "pc", "op": "switch-element",
+# "element_id": "input-pc"}, {"op": "outputs", "state": "LIVE", "after": ["pc"]}]}
+
+# Operation name -> (handler, name of its single argument or None)
+BATCH_OPERATIONS = {
+    "golive": (start_instance, None),
+    "stop": (stop_instance, None),
+    "outputs": (set_outputs, "state"),
+    "switch-element": (switch_element, "element_id"),
+}
+
+# Arguments an operation falls back to when the batch leaves them out, as its route does
+BATCH_DEFAULTS = {"outputs": "LIVE"}
+
+# Command results that mean the operation did not happen
+BATCH_FAILURES = ("Error", "No active", "Invalid", "Missing", "Unknown", "Switch element not found")
 
-        # PATCH the switch element with the selected input
-        # Based on API docs: {"switch-1": {"input": "element-id"}}
-        body = {
-            switch_element_id: {
-                "input": element_id
-            }
-        }
-        
-        url = f"{BASE_URL}/instances/{instance_id}/overrides"
-        print(f"PATCH {url} with body: {body}")
-        r = requests.patch(url, headers=HEADERS, json=body)
-        
-        if not r.ok:
-            print(f"Error {r.status_code}: {r.text}")
-            return f"Error {r.status_code}: {r.text}"
 
-        print(f"Successfully switched to element {element_id}")
-        return f"Switched to element"
+def parse_batch_query(ops):
+    """Turn "a:x,b;c" into operations where each step runs after the previous one."""
+    operations, previous = [], []
+    for step in ops.split(";"):
+        current = []
+        for item in filter(None, (part.strip() for part in step.split(","))):
+            name, _, arg = item.partition(":")
+            operation = {"id": str(len(operations)), "op": name, "after": list(previous)}
+            argument = BATCH_OPERATIONS.get(name, (None, None))[1]
+            if argument and arg:
+                operation[argument] = arg
+            operations.append(operation)
+            current.append(operation["id"])
+        previous = current or previous
+    return operations
+
+
+def parse_batch(operations):
+    """Validate a list of operation dicts into [{id, op, arg, after}].
+
+    Dependencies name an earlier operation by id or position, and a missing
+    argument takes its BATCH_DEFAULTS value. Raises ValueError for unknown
+    operations, duplicate ids, non-string arguments, or any other dependency.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("no operations")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"at most {BATCH_MAX_OPERATIONS} operations")
+    parsed, seen = [], {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in BATCH_OPERATIONS:
+            raise ValueError(f"unknown operation at {index}")
+        op_id = str(operation.get("id", index))
+        if op_id in seen:
+            raise ValueError(f"duplicate id {op_id}")
+        after = operation.get("after") or []
+        after = [str(dep) for dep in (after if isinstance(after, list) else [after])]
+        missing = [dep for dep in after if dep not in seen]
+        if missing:
+            raise ValueError(f"{op_id} runs after unknown or later operation {missing[0]}")
+        after = list(dict.fromkeys(seen[dep] for dep in after))
+        argument = BATCH_OPERATIONS[operation["op"]][1]
+        arg = None
+        if argument:
+            arg = operation.get(argument)
+            if arg is None:
+                arg = BATCH_DEFAULTS.get(operation["op"])
+            elif not isinstance(arg, str):
+                raise ValueError(f"{op_id}: {argument} must be a string")
+        parsed.append({
+            "id": op_id,
+            "op": operation["op"],
+            "arg": arg,
+            "after": after,
+        })
+        seen[str(index)] = seen[op_id] = op_id
+    return parsed
+
+
+def batch_failed(result):
+    return result.startswith(BATCH_FAILURES)
+
+
+def batch_result(operation, result, started):
+    return {
+        "id": operation["id"],
+        "op": operation["op"],
+        "ok": not batch_failed(result),
+        "result": result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def skipped_result(operation, results):
+    failed = next(dep for dep in operation["after"] if not results[dep]["ok"])
+    return {
+        "id": operation["id"],
+        "op": operation["op"],
+        "ok": False,
+        "result": f"Skipped: {failed} failed",
+        "elapsed_ms": 0.0,
+    }
+
+
+def batch_text(results):
+    return " | ".join(f"{r['op']}: {r['result']}" for r in results)
+
+
+_batch_executor = None
+_batch_executor_pid = None
+
+
+def get_batch_executor():
+    """This worker's batch thread pool (rebuilt after fork)."""
+    global _batch_executor, _batch_executor_pid
+    if _batch_executor is None or _batch_executor_pid != os.getpid():
+        _batch_executor = ThreadPoolExecutor(BATCH_CONCURRENCY, thread_name_prefix="batch")
+        _batch_executor_pid = os.getpid()
+    return _batch_executor
+
+
+def run_batch_operation(operation):
+    started = time.perf_counter()
+    handler, argument = BATCH_OPERATIONS[operation["op"]]
+    try:
+        result = handler(operation["arg"]) if argument else handler()
+    except Exception as e:
+        log.error("Error in batch operation", op=operation["op"], error=str(e))
+        result = f"Error: {str(e)}"
+    return batch_result(operation, result, started)
+
+
+def run_batch(operations):
+    """Run parsed operations, each as soon as its dependencies succeed."""
+    executor = get_batch_executor()
+    results, pending, running = {}, list(operations), {}
+    while pending or running:
+        for operation in list(pending):
+            if any(dep not in results for dep in operation["after"]):
+                continue
+            pending.remove(operation)
+            if all(results[dep]["ok"] for dep in operation["after"]):
+                # Carry the request id into the pool thread's log records
+                context = contextvars.copy_context()
+                running[executor.submit(context.run, run_batch_operation, operation)] = operation
+            else:
+                results[operation["id"]] = skipped_result(operation, results)
+        if running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)["id"]] = future.result()
+    return [results[operation["id"]] for operation in operations]
+
+
+@routes.route("/api/batch", methods=["GET", "POST"])
+@caller_cooldown
+def api_batch():
+    """Run several commands in one round-trip - plain text, or JSON when asked."""
+    body = request.get_json(silent=True) if request.method == "POST" else None
+    as_json = body is not None or request.args.get("format") == "json"
+    try:
+        if body is not None:
+            operations = parse_batch(body.get("operations") if isinstance(body, dict) else body)
+        else:
+            operations = parse_batch(parse_batch_query(request.args.get("ops", "")))
+    except ValueError as e:
+        message = f"Invalid batch: {e}"
+        return (jsonify({"ok": False, "error": message}), 400) if as_json else message
+
+    try:
+        results = run_batch(operations)
+    except Exception as e:
+        log.error("Error in api_batch", error=str(e))
+        return f"Error: {str(e)}"
+    if as_json:
+        return jsonify({"ok": all(r["ok"] for r in results), "results": results})
+    return batch_text(results)
+
+
+@routes.route("/api/refresh-config")
+def api_refresh_config():
+    """Pick up configuration changes now - returns plain text."""
+    try:
+        return refresh_configuration()
     except Exception as e:
-        print(f"Error in api_switch_element: {e}")
+        log.error("Error in api_refresh_config", error=str(e))
         return f"Error: {str(e)}"
 
 
-@app.route("/api/destinations")
+@routes.route("/api/destinations")
 def api_destinations():
     """List destinations - returns plain text."""
     try:
-        url = f"{BASE_URL}/destinations"
-        r = requests.get(url, headers=HEADERS)
-        if not r.ok:
-            return f"Error {r.status_code}"
-
-        data = r.json()
-        lines = []
-        for d in data:
-            name = d.get("name", "unknown")
-            dest_id = d.get("id", "no-id")
-            lines.append(f"{name}:{dest_id}")
-        return " | ".join(lines) or "No destinations"
+        entry = cached_get("/destinations")
+        if not entry["ok"]:
+            return f"Error {entry['status']}"
+
+        text = memoized(entry, "text", lambda: format_destinations(entry["data"]))
+        return f"{text} (stale)" if entry.get("stale") else text
     except Exception as e:
-        print(f"Error in api_destinations: {e}")
+        log.error("Error in api_destinations", error=str(e))
         return f"Error: {str(e)}"
 
 
-@app.errorhandler(500)
+# ============ ADMIN ============
+# Runtime diagnostics, behind STREAMRUN_ADMIN_TOKEN:
+#
+#     GET  /admin/timing                  slowest requests since the last reset
+#     POST /admin/timing?enabled=1|0      turn Server-Timing on or off
+#     POST /admin/timing?reset=1          forget the slowest requests
+#     POST /admin/profile?seconds=30      sample all threads for 30s (&interval=0.01)
+#     POST /admin/profile?stop=1          end the window early
+#     GET  /admin/profile                 collapsed stacks of the last window
+#
+# Settings and results are per worker process.
+
+
+def admin_denied(headers):
+    """Check the admin bearer token; returns (HTTP status, plain text) or None."""
+    if not ADMIN_TOKEN:
+        return 404, "Admin endpoints are not configured"
+    token = (headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return 401, "Unauthorized"
+    return None
+
+
+def admin_timing(args, headers):
+    """Show or change request timing; returns (HTTP status, plain text)."""
+    denied = admin_denied(headers)
+    if denied:
+        return denied
+    if args.get("enabled") is not None:
+        profiling.set_timing(args.get("enabled").lower() in ("1", "true", "yes", "on"))
+        log.info("Server-Timing", enabled=profiling.TIMING_ENABLED)
+    if args.get("reset"):
+        profiling.reset_slowest()
+    return 200, profiling.timing_report()
+
+
+def admin_profile(args, headers):
+    """Start, stop or read the sampling profiler; returns (HTTP status, plain text)."""
+    denied = admin_denied(headers)
+    if denied:
+        return denied
+    if args.get("stop"):
+        profiling.stop_profile()
+    elif args.get("seconds") is not None:
+        try:
+            seconds = float(args.get("seconds"))
+            interval = float(args.get("interval") or 0.01)
+        except ValueError:
+            return 400, "seconds and interval must be numbers"
+        error = profiling.start_profile(seconds, interval)
+        if error:
+            return 409, error
+    return 200, profiling.profile_report()
+
+
+@routes.route("/admin/timing", methods=["GET", "POST"])
+def admin_timing_endpoint():
+    """Server-Timing switch and slowest requests - returns plain text."""
+    status, message = admin_timing(request.args, request.headers)
+    return message, status
+
+
+@routes.route("/admin/profile", methods=["GET", "POST"])
+def admin_profile_endpoint():
+    """Sampling profiler - returns plain text."""
+    status, message = admin_profile(request.args, request.headers)
+    return message, status
+
+
+@routes.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for this worker."""
+    return current_app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@routes.app_errorhandler(500)
 def handle_500(e):
     """Handle 500 errors gracefully."""
-    print(f"500 Error: {e}")
+    log.error("500 Error", error=str(e))
     return f"Server Error: {str(e)}", 500
 
 
+def add_configuration_routes(flask_app):
+    """Serve the dashboard and API under /c/<config_id>/ as well."""
+    for rule in list(flask_app.url_map.iter_rules()):
+        if (rule.rule == "/" or rule.rule.startswith("/api/")) and rule.endpoint != "streamrun.api_webhook":
+            flask_app.add_url_rule(CONFIGURATION_PREFIX + rule.rule, rule.endpoint,
+                                   methods=rule.methods - {"HEAD", "OPTIONS"})
+
+
+# ============ APP FACTORY ============
+# Under `gunicorn --preload` the master imports this module and builds the
+# app once; workers are forked from it. Everything built here is read-only
+# afterwards - the precompressed dashboard, category rules, the snapshot - so
+# the workers share those pages copy-on-write instead of each rebuilding
+# them. Sockets, threads and pools (upstream session, SQLite connection, log
+# writer, poller, refresher, the live config fetch) are only created in the
+# process that uses them and are rebuilt when their pid changes.
+#
+#     gunicorn --preload -w 4 streamrun_proxy:app
+#     gunicorn -w 4 'streamrun_proxy:create_app()'
+
+# Milliseconds a cold start (import through create_app) should stay under;
+# going over logs a warning. bench/boot.py measures it.
+BOOT_BUDGET_MS = float(os.environ.get("STREAMRUN_BOOT_BUDGET_MS", "1000"))
+
+# Startup timings in milliseconds: import and preload in the process that
+# built the app, ready since import started, config since the worker started
+startup_timings = {
+    "import_ms": None,
+    "preload_ms": None,
+    "ready_ms": None,
+    "config_ms": None,
+    "snapshot_loaded": False
+}
+
+_preloaded = False
+_preload_lock = threading.Lock()
+
+
+def preload():
+    """Build the shared read-only state once per process that imports this module."""
+    global static_assets, _preloaded
+    with _preload_lock:
+        if _preloaded:
+            return
+        started = time.perf_counter()
+        startup_timings["import_ms"] = (started - _boot_started) * 1000
+        static_assets = build_static_assets()
+        # Start with every configured category empty until a snapshot or fetch fills it
+        apply_elements([])
+        # Serve the last snapshot until the worker's live fetch lands
+        startup_timings["snapshot_loaded"] = load_snapshot()
+        startup_timings["preload_ms"] = (time.perf_counter() - started) * 1000
+        # Keep the collector off these objects so it never writes to (and so
+        # copies) their pages in forked workers
+        gc.freeze()
+        _preloaded = True
+    STARTUP_SECONDS.set("import", value=startup_timings["import_ms"] / 1000)
+    STARTUP_SECONDS.set("preload", value=startup_timings["preload_ms"] / 1000)
+
+
+def finish_startup():
+    """Record how long startup took and warn when it went over BOOT_BUDGET_MS."""
+    if startup_timings["ready_ms"] is not None:
+        return
+    startup_timings["ready_ms"] = (time.perf_counter() - _boot_started) * 1000
+    STARTUP_SECONDS.set("ready", value=startup_timings["ready_ms"] / 1000)
+    log.info("Startup ready", ms=round(startup_timings["ready_ms"], 1),
+             import_ms=round(startup_timings["import_ms"], 1),
+             preload_ms=round(startup_timings["preload_ms"], 1),
+             snapshot_loaded=startup_timings["snapshot_loaded"])
+    if startup_timings["ready_ms"] > BOOT_BUDGET_MS:
+        log.warning("Startup over budget", ms=round(startup_timings["ready_ms"], 1), budget_ms=BOOT_BUDGET_MS)
+
+
+def create_app(config=None):
+    """Build the Flask app; config is an optional mapping of Flask settings."""
+    preload()
+    flask_app = Flask(__name__)
+    flask_app.json = TimedJSONProvider(flask_app)
+    # Keep JSON keys in insertion order so categories come out in rule order
+    flask_app.json.sort_keys = False
+    if config:
+        flask_app.config.update(config)
+    flask_app.register_blueprint(routes)
+    add_configuration_routes(flask_app)
+    finish_startup()
+    return flask_app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""Fixtures: the proxy pointed at an in-process bench/fake_streamrun.py.
+
+The proxy reads its settings at import, so the environment is set up here
+before any test module imports it.
+"""
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from http.server import ThreadingHTTPServer
+
+import pytest
+from werkzeug.serving import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+_workdir = tempfile.mkdtemp(prefix="streamrun-tests-")
+os.environ.update(
+    # Nothing listens here; the fake fixture points the proxy at a live fake
+    STREAMRUN_BASE_URL="http://127.0.0.1:9/api/v1",
+    STREAMRUN_SNAPSHOT_PATH=os.path.join(_workdir, "snapshot.json"),
+    STREAMRUN_STATE_STORE="memory",
+    STREAMRUN_WEBHOOK_SECRET="test-secret",
+    STREAMRUN_CONFIG_REFRESH_INTERVAL="0",
+    STREAMRUN_LOG_LEVEL="CRITICAL",
+    STREAMRUN_RETRIES="0",
+    STREAMRUN_READ_RATE="100000",
+    STREAMRUN_READ_BURST="100000",
+    STREAMRUN_WRITE_RATE="100000",
+    STREAMRUN_WRITE_BURST="100000",
+)
+
+import fake_streamrun  # noqa: E402
+import streamrun_proxy as proxy  # noqa: E402
+
+
+@pytest.fixture
+def serve_fake(monkeypatch):
+    """Serve a FakeStreamrun on a free port and point the proxy at it."""
+    servers = []
+
+    def serve(streamrun):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), fake_streamrun.make_handler(streamrun, 0, 0, 0))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(proxy, "BASE_URL", f"http://127.0.0.1:{server.server_port}/api/v1")
+        with proxy._response_cache_lock:
+            proxy._response_cache.clear()
+        return streamrun
+
+    try:
+        yield serve
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        # Breakers opened against this fake must not leak into the next test
+        with proxy._circuits_lock:
+            proxy._circuits.clear()
+
+
+@pytest.fixture
+def fake(serve_fake):
+    """A fresh fake Streamrun whose instances start at once."""
+    return serve_fake(fake_streamrun.FakeStreamrun(start_delay=0))
+
+
+@pytest.fixture
+def proxy_url():
+    """The Flask app served over HTTP on a free port, for callbacks from the fake."""
+    server = make_server("127.0.0.1", 0, proxy.app, threaded=True)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+@pytest.fixture
+def configuration(monkeypatch):
+    """An empty, loaded configuration that the test runs against."""
+    state = proxy.new_configuration(f"cfg-{uuid.uuid4().hex[:8]}")
+    state["loaded"].set()
+    monkeypatch.setattr(proxy, "CONFIGURATION_IDS", proxy.CONFIGURATION_IDS | {state["id"]})
+    with proxy._configurations_lock:
+        proxy._configurations[state["id"]] = state
+    try:
+        with proxy.using_configuration(state):
+            yield state
+    finally:
+        with proxy._configurations_lock:
+            proxy._configurations.pop(state["id"], None)
+
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import streamrun_async
+import streamrun_proxy as proxy
+from state_store import open_state_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def blocking_store(request, monkeypatch, tmp_path):
+    """Run each test with the in-memory store inline and SQLite on the executor."""
+    monkeypatch.setattr(proxy, "STATE_STORE_KIND", request.param)
+    monkeypatch.setattr(proxy, "state_store", open_state_store(request.param, str(tmp_path / "state.db")))
+
+
+def run(fn, configuration):
+    """Run fn(client) against a fresh aiohttp app, scoped to configuration."""
+    async def main():
+        async with TestClient(TestServer(streamrun_async.build_app())) as client:
+            await fn(client, f"/c/{configuration['id']}")
+    asyncio.run(main())
+
+
+def test_batch_and_optimistic_switch(fake, configuration, blocking_store):
+    async def scenario(client, prefix):
+        r = await client.get(f"{prefix}/api/batch?ops=golive;outputs")
+        assert await r.text() == "golive: Starting stream | outputs: Outputs LIVE"
+        r = await client.get(f"{prefix}/api/refresh-config")
+        assert (await r.text()).startswith("Configuration updated")
+        r = await client.get(f"{prefix}/api/switch-element?element_id=input-brb&mode=optimistic")
+        assert (await r.text()).startswith("Switching to element")
+        for _ in range(100):
+            if configuration["active_input"]["status"] == "confirmed":
+                break
+            await asyncio.sleep(0.01)
+        assert configuration["active_input"]["element_id"] == "input-brb"
+        assert configuration["active_input"]["status"] == "confirmed"
+        r = await client.get(f"{prefix}/api/stop")
+        assert await r.text() == "Stream stopped"
+        assert configuration["instance"]["state"] == "STOPPED"
+
+    run(scenario, configuration)
+
+
+def test_throttled_golive_answers_from_the_registry(fake, configuration, blocking_store, monkeypatch):
+    async def scenario(client, prefix):
+        r = await client.get(f"{prefix}/api/golive")
+        assert await r.text() == "Starting stream"
+        configuration["instance"]["checked_at"] = 0
+        for entry in configuration["instances"]["by_id"].values():
+            entry["seen_at"] = 0
+        monkeypatch.setitem(proxy._read_bucket, "rate", 0.001)
+        monkeypatch.setitem(proxy._read_bucket, "tokens", 0.0)
+        r = await client.get(f"{prefix}/api/golive")
+        assert await r.text() == "Instance already running: RUNNING"
+
+    run(scenario, configuration)
+
+
+def test_stale_instance_data_wakes_the_poller(fake, configuration, blocking_store, monkeypatch):
+    monkeypatch.setattr(proxy, "STATUS_POLL_SLOW_INTERVAL", 60.0)
+
+    async def scenario(client, prefix):
+        r = await client.get(f"{prefix}/api/golive")
+        assert await r.text() == "Starting stream"
+        fake.instances[-1]["state"] = "STOPPED"
+        configuration["instance"]["checked_at"] = time.time() - proxy.STATUS_MAX_AGE - 1
+        r = await client.get(f"{prefix}/api/instance-data")
+        assert r.status == 200
+        for _ in range(100):
+            if configuration["instance"]["state"] == "STOPPED":
+                break
+            await asyncio.sleep(0.01)
+        assert configuration["instance"]["state"] == "STOPPED"
+
+    run(scenario, configuration)
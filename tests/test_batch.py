@@ -0,0 +1,67 @@
+import pytest
+
+import streamrun_proxy as proxy
+
+
+def test_query_steps_run_after_the_previous_step():
+    operations = proxy.parse_batch(proxy.parse_batch_query("golive;switch-element:input-pc,outputs:OFFLINE"))
+    assert operations == [
+        {"id": "0", "op": "golive", "arg": None, "after": []},
+        {"id": "1", "op": "switch-element", "arg": "input-pc", "after": ["0"]},
+        {"id": "2", "op": "outputs", "arg": "OFFLINE", "after": ["0"]},
+    ]
+
+
+def test_dependencies_name_an_operation_by_id_or_position():
+    operations = proxy.parse_batch([
+        {"id": "pc", "op": "switch-element", "element_id": "input-pc"},
+        {"op": "stop"},
+        {"op": "outputs", "state": "LIVE", "after": [0, "pc", 1]},
+    ])
+    assert operations[2]["after"] == ["pc", "1"]
+
+
+def test_missing_outputs_state_defaults_to_live():
+    assert proxy.parse_batch(proxy.parse_batch_query("outputs"))[0]["arg"] == "LIVE"
+    assert proxy.parse_batch([{"op": "outputs"}])[0]["arg"] == "LIVE"
+
+
+@pytest.mark.parametrize("operations, error", [
+    ([], "no operations"),
+    ([{"op": "reboot"}], "unknown operation at 0"),
+    ([{"id": "a", "op": "stop"}, {"id": "a", "op": "golive"}], "duplicate id a"),
+    ([{"op": "stop", "after": [1]}, {"op": "golive"}], "0 runs after unknown or later operation 1"),
+    ([{"op": "stop", "after": ["nope"]}], "0 runs after unknown or later operation nope"),
+    ([{"op": "outputs", "state": 1}], "0: state must be a string"),
+    ([{"op": "stop"}] * (proxy.BATCH_MAX_OPERATIONS + 1), f"at most {proxy.BATCH_MAX_OPERATIONS} operations"),
+])
+def test_invalid_batches_are_rejected(operations, error):
+    with pytest.raises(ValueError, match=error):
+        proxy.parse_batch(operations)
+
+
+def test_failed_dependency_skips_its_dependents(fake, configuration):
+    results = proxy.run_batch(proxy.parse_batch(proxy.parse_batch_query("switch-element:input-pc;outputs")))
+    assert [(r["ok"], r["result"]) for r in results] == [
+        (False, "No active instance. Start stream first."),
+        (False, "Skipped: 0 failed"),
+    ]
+
+
+def test_dependents_run_once_their_dependencies_succeed(fake, configuration):
+    results = proxy.run_batch(proxy.parse_batch(proxy.parse_batch_query("golive;outputs")))
+    assert [(r["ok"], r["result"]) for r in results] == [(True, "Starting stream"), (True, "Outputs LIVE")]
+    assert fake.outputs[configuration["id"]] == "LIVE"
+
+
+def test_batch_route_reports_each_operation(fake, configuration):
+    client = proxy.app.test_client()
+    response = client.post(f"/c/{configuration['id']}/api/batch", json={"operations": [
+        {"id": "live", "op": "golive"},
+        {"id": "out", "op": "outputs", "after": ["live"]},
+        {"op": "stop", "after": ["out"]},
+    ]})
+    body = response.get_json()
+    assert body["ok"]
+    assert [r["id"] for r in body["results"]] == ["live", "out", "2"]
+    assert client.get(f"/c/{configuration['id']}/api/batch?ops=reboot").data == b"Invalid batch: unknown operation at 0"
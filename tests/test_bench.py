@@ -0,0 +1,13 @@
+import pytest
+
+import bench
+
+
+@pytest.mark.parametrize("route, body, failed", [
+    ("/api/golive", b"Starting stream", False),
+    ("/api/golive", b"Error 503: Service Unavailable", True),
+    ("/api/batch?ops=golive;outputs", b"golive: Starting stream | outputs: Outputs LIVE", False),
+    ("/api/batch?ops=golive;outputs", b"golive: Starting stream | outputs: Error 502: Bad Gateway", True),
+])
+def test_error_bodies_count_as_failures(route, body, failed):
+    assert bench.command_failed(route, body) is failed
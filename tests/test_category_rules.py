@@ -0,0 +1,22 @@
+import pytest
+
+import fake_streamrun
+import streamrun_proxy as proxy
+
+
+@pytest.mark.parametrize("rules", [
+    '[{"match": ["pc"]}]',
+    '[{"category": "PC", "match": "pc"}]',
+    '[["pc"]]',
+    '[{"category": "PC", "types": [1]}]',
+])
+def test_malformed_rules_fall_back_to_the_defaults(monkeypatch, rules):
+    monkeypatch.setattr(proxy, "CATEGORY_RULES", rules)
+    assert proxy.load_category_rules() is proxy.DEFAULT_CATEGORY_RULES
+
+
+def test_custom_rules_are_used(monkeypatch, configuration):
+    monkeypatch.setattr(proxy, "CATEGORY_RULES", '[{"category": "Cameras", "match": ["camera"], "types": ["srt"]}]')
+    proxy.apply_elements(fake_streamrun.build_elements(6))
+    assert list(configuration["categories"]) == ["Cameras"]
+    assert configuration["categories"]["Cameras"]["id"] == "input-cam-5"
@@ -0,0 +1,82 @@
+import time
+import uuid
+
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(proxy, "BREAKER_FAILURES", 2)
+    monkeypatch.setattr(proxy, "BREAKER_RESET", 0.05)
+    return f"/test/{uuid.uuid4().hex[:8]}"
+
+
+def open_circuit(endpoint):
+    for _ in range(proxy.BREAKER_FAILURES):
+        proxy.circuit_allow(endpoint)
+        proxy.circuit_record(endpoint, False)
+
+
+def test_opens_after_consecutive_failures(endpoint):
+    proxy.circuit_allow(endpoint)
+    proxy.circuit_record(endpoint, False)
+    assert proxy.circuit_state(endpoint) == "closed"
+    proxy.circuit_allow(endpoint)
+    proxy.circuit_record(endpoint, False)
+    assert proxy.circuit_state(endpoint) == "open"
+    with pytest.raises(proxy.CircuitOpen):
+        proxy.circuit_allow(endpoint)
+
+
+def test_success_resets_the_failure_count(endpoint):
+    proxy.circuit_record(endpoint, False)
+    proxy.circuit_record(endpoint, True)
+    proxy.circuit_record(endpoint, False)
+    assert proxy.circuit_state(endpoint) == "closed"
+
+
+def test_half_open_probe_closes_on_success(endpoint):
+    open_circuit(endpoint)
+    time.sleep(proxy.BREAKER_RESET)
+    proxy.circuit_allow(endpoint)
+    assert proxy.circuit_state(endpoint) == "half_open"
+    # Only one probe at a time
+    with pytest.raises(proxy.CircuitOpen):
+        proxy.circuit_allow(endpoint)
+    proxy.circuit_record(endpoint, True)
+    assert proxy.circuit_state(endpoint) == "closed"
+    proxy.circuit_allow(endpoint)
+
+
+def test_half_open_probe_reopens_on_failure(endpoint):
+    open_circuit(endpoint)
+    time.sleep(proxy.BREAKER_RESET)
+    proxy.circuit_allow(endpoint)
+    proxy.circuit_record(endpoint, False)
+    assert proxy.circuit_state(endpoint) == "open"
+    with pytest.raises(proxy.CircuitOpen):
+        proxy.circuit_allow(endpoint)
+
+
+def test_open_circuit_serves_stale_cache(endpoint, fake):
+    entry = proxy.cached_get("/destinations", max_age=0)
+    assert entry["ok"] and not entry.get("stale")
+    open_circuit(proxy.endpoint_name("/destinations"))
+    stale = proxy.cached_get("/destinations", max_age=0)
+    assert stale["stale"] and stale["data"] == entry["data"]
+
+
+def test_instance_data_is_flagged_while_its_circuit_is_open(endpoint, fake, configuration):
+    client = proxy.app.test_client()
+    url = f"/c/{configuration['id']}/api/instance-data"
+    proxy.start_instance()
+    fresh = client.get(url)
+    assert "X-Streamrun-Stale" not in fresh.headers
+    open_circuit(proxy.endpoint_name(f"/instances/{configuration['instance']['id']}"))
+    stale = client.get(url)
+    assert stale.headers["X-Streamrun-Stale"] == "1"
+    assert stale.headers["Warning"] == '110 - "Response is Stale"'
+    assert stale.get_json() == fresh.get_json()
+    assert client.get(url, headers={"If-None-Match": stale.headers["ETag"]}).headers["X-Streamrun-Stale"] == "1"
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import streamrun_async
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def client():
+    return proxy.app.test_client()
+
+
+def test_unlisted_configuration_is_not_loaded(client):
+    assert client.get("/api/status?config=not-listed").status_code == 404
+    assert client.get("/c/not-listed/api/status").status_code == 404
+    assert proxy.loaded_configuration("not-listed") is None
+
+
+def test_configuration_loads_once_outside_the_lock(monkeypatch):
+    monkeypatch.setattr(proxy, "CONFIGURATION_IDS", {"cfg-slow"})
+    loads, load_configuration = [], proxy.load_configuration
+
+    def slow_load():
+        loads.append(proxy.configuration_id())
+        time.sleep(0.2)
+        load_configuration()
+
+    monkeypatch.setattr(proxy, "load_configuration", slow_load)
+    states = []
+    threads = [threading.Thread(target=lambda: states.append(proxy.get_configuration("cfg-slow"))) for _ in range(3)]
+    try:
+        for thread in threads:
+            thread.start()
+        # The default configuration is served while cfg-slow loads
+        started = time.perf_counter()
+        assert proxy.get_configuration(proxy.CONFIGURATION_ID) is not None
+        assert time.perf_counter() - started < 0.1
+        for thread in threads:
+            thread.join()
+        assert loads == ["cfg-slow"]
+        assert all(state is states[0] and state["loaded"].is_set() for state in states)
+    finally:
+        with proxy._configurations_lock:
+            proxy._configurations.pop("cfg-slow", None)
+
+
+def test_dashboard_query_redirects_to_the_configuration_path(client, configuration):
+    r = client.get(f"/?config={configuration['id']}")
+    assert r.status_code == 302
+    assert r.headers["Location"] == f"/c/{configuration['id']}/"
+    assert client.get(r.headers["Location"]).status_code == 200
+    assert client.get("/?config=not-listed").status_code == 404
+
+
+def test_async_dashboard_query_redirects_to_the_configuration_path(configuration):
+    async def main():
+        async with TestClient(TestServer(streamrun_async.build_app())) as client:
+            r = await client.get(f"/?config={configuration['id']}", allow_redirects=False)
+            assert r.status == 302
+            assert r.headers["Location"] == f"/c/{configuration['id']}/"
+
+    asyncio.run(main())
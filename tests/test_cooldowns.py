@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def cooldown(monkeypatch):
+    monkeypatch.setattr(proxy, "CALLER_COOLDOWN", 30.0)
+    monkeypatch.setattr(proxy, "_cooldowns", {})
+
+
+def test_repeat_command_waits_out_the_cooldown(configuration, cooldown):
+    assert proxy.cooldown_remaining("/api/golive", "chan:viewer") == 0.0
+    assert 29 < proxy.cooldown_remaining("/api/golive", "chan:viewer") <= 30
+    # Other callers and other routes have their own cooldowns
+    assert proxy.cooldown_remaining("/api/golive", "chan:mod") == 0.0
+    assert proxy.cooldown_remaining("/api/stop", "chan:viewer") == 0.0
+
+
+def test_purging_expired_entries_keeps_the_new_cooldown(configuration, cooldown):
+    expired = time.monotonic() - 1
+    proxy._cooldowns.update({(configuration["id"], "/api/golive", f"chan:{n}"): expired for n in range(10001)})
+    assert proxy.cooldown_remaining("/api/golive", "chan:viewer") == 0.0
+    assert len(proxy._cooldowns) == 1
+    assert proxy.cooldown_remaining("/api/golive", "chan:viewer") > 0
+
+
+def test_cooldown_answers_the_route(configuration, cooldown):
+    client = proxy.app.test_client()
+    prefix = f"/c/{configuration['id']}"
+    proxy.cooldown_remaining("/api/stop", "chan:viewer")
+    r = client.get(f"{prefix}/api/stop?channel=chan&user=viewer")
+    assert r.get_data(as_text=True) == "Cooldown: try again in 30s"
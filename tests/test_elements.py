@@ -0,0 +1,65 @@
+import pytest
+
+import fake_streamrun
+import streamrun_proxy as proxy
+
+
+def snapshot(state):
+    """What apply_elements built, without identity or version details."""
+    registry = state["registry"]
+    return {
+        "by_id": registry["by_id"],
+        "by_title": registry["by_title"],
+        "by_type": registry["by_type"],
+        "category_of": registry["category_of"],
+        "categories": state["categories"],
+        "switch_element_id": state["switch_element_id"],
+    }
+
+
+def rebuilt(elements):
+    """A fresh configuration with only elements applied."""
+    state = proxy.new_configuration("rebuild")
+    with proxy.using_configuration(state):
+        proxy.apply_elements(elements)
+    return snapshot(state)
+
+
+def edits(elements):
+    """Element lists that each differ from elements in one way."""
+    renamed = [dict(e, title="Spare PC") if e["id"] == "input-cam-5" else e for e in elements]
+    retitled_pc = [dict(e, title="Old capture") if e["id"] == "input-pc" else e for e in elements]
+    removed = [e for e in elements if e["id"] != "input-mobile"]
+    added = elements + [{"id": "input-brb-2", "title": "BRB Loop", "type": "image"}]
+    return {
+        "renamed": renamed,
+        "retitled": retitled_pc,
+        "removed": removed,
+        "added": added,
+        "reordered": list(reversed(elements)),
+        "unchanged": list(elements),
+    }
+
+
+@pytest.mark.parametrize("edit", ["renamed", "retitled", "removed", "added", "reordered", "unchanged"])
+def test_incremental_apply_matches_a_full_rebuild(configuration, edit):
+    elements = fake_streamrun.build_elements(8)
+    proxy.apply_elements(elements)
+    changed = edits(elements)[edit]
+    proxy.apply_elements(changed)
+    assert snapshot(configuration) == rebuilt(changed)
+
+
+def test_diff_reports_added_removed_and_changed(configuration):
+    elements = fake_streamrun.build_elements(6)
+    proxy.apply_elements(elements)
+    changed = edits(elements)
+    diff = proxy.apply_elements(changed["renamed"][1:] + changed["added"][-1:])
+    assert diff == {"added": ["input-brb-2"], "removed": ["switch-1"], "changed": ["input-cam-5"]}
+
+
+def test_last_matching_element_wins_a_category(configuration):
+    elements = fake_streamrun.build_elements(6)
+    proxy.apply_elements(elements)
+    proxy.apply_elements(edits(elements)["renamed"])
+    assert configuration["categories"]["PC"]["id"] == "input-cam-5"
@@ -0,0 +1,10 @@
+import streamrun_proxy as proxy
+
+
+def test_events_need_a_concurrent_worker(monkeypatch):
+    # The test client, like gunicorn's sync worker, reports wsgi.multithread=False
+    assert proxy.app.test_client().get("/api/events").status_code == 503
+    monkeypatch.setattr(proxy, "EVENTS_MODE", "off")
+    assert not proxy.events_supported(True)
+    monkeypatch.setattr(proxy, "EVENTS_MODE", "on")
+    assert proxy.events_supported(False)
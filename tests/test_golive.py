@@ -0,0 +1,50 @@
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def no_read_budget(monkeypatch):
+    """Spend the read bucket so every upstream GET is throttled."""
+    monkeypatch.setitem(proxy._read_bucket, "rate", 0.001)
+    monkeypatch.setitem(proxy._read_bucket, "tokens", 0.0)
+
+
+def test_golive_starts_one_instance(fake, configuration):
+    assert proxy.start_instance() == "Starting stream"
+    assert configuration["instance"]["id"] == "inst-1"
+    assert proxy.active_instance()["id"] == "inst-1"
+
+
+def test_golive_with_fresh_state_answers_locally(fake, configuration):
+    proxy.start_instance()
+    assert proxy.start_instance() == "Instance already running: RUNNING"
+    assert len(fake.instances) == 1
+
+
+def test_golive_with_stale_state_adopts_the_running_instance(fake, configuration):
+    proxy.start_instance()
+    configuration["instance"]["checked_at"] = 0
+    proxy.set_instance(None, "UNKNOWN")
+    assert proxy.start_instance() == "Instance already running: RUNNING"
+    assert configuration["instance"]["id"] == "inst-1"
+
+
+def test_throttled_reads_fall_back_to_the_registry(fake, configuration, no_read_budget):
+    proxy.start_instance()
+    configuration["instance"]["checked_at"] = 0
+    for entry in configuration["instances"]["by_id"].values():
+        entry["seen_at"] = 0
+    assert proxy.start_instance() == "Instance already running: RUNNING"
+
+
+def test_throttled_reads_without_a_known_instance(fake, configuration, no_read_budget):
+    fake.create_instance(configuration["id"], {})
+    assert proxy.start_instance() == "Instance already running"
+
+
+def test_idempotency_key_replays_the_first_result(fake, configuration):
+    proxy.remember_result("key-1", proxy.start_instance())
+    assert proxy.idempotent_result("key-1") == "Starting stream"
+    proxy.remember_result("key-2", "Error 503: down")
+    assert proxy.idempotent_result("key-2") is None
@@ -0,0 +1,14 @@
+import profiling
+
+
+def test_fast_requests_are_ranked_but_not_logged(monkeypatch):
+    logged = []
+    monkeypatch.setattr(profiling.log, "warning", lambda msg, **entry: logged.append(entry["ms"]))
+    profiling.reset_slowest()
+    try:
+        for ms in (0.1, 5.0, profiling.SLOW_REQUEST_LOG_MS + 1):
+            profiling.note_request({"ms": ms})
+        assert [entry["ms"] for entry in profiling.slowest_requests()][0] == profiling.SLOW_REQUEST_LOG_MS + 1
+        assert logged == [profiling.SLOW_REQUEST_LOG_MS + 1]
+    finally:
+        profiling.reset_slowest()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import streamrun_async
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def client():
+    return proxy.app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/api/instance-data", "/api/elements-categorized"])
+def test_unchanged_state_is_not_modified(client, configuration, path):
+    url = f"/c/{configuration['id']}{path}"
+    first = client.get(url)
+    assert first.status_code == 200
+    assert client.get(url).headers["ETag"] == first.headers["ETag"]
+    r = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert r.status_code == 304
+    assert r.get_data() == b""
+    assert client.get(url, headers={"If-None-Match": "W/" + first.headers["ETag"]}).status_code == 304
+
+
+def test_changed_state_gets_a_new_body_and_etag(client, configuration):
+    url = f"/c/{configuration['id']}/api/instance-data"
+    first = client.get(url)
+    proxy.set_instance("inst-1", "STARTING")
+    r = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != first.headers["ETag"]
+    assert r.get_json()["state"] == "STARTING"
+
+
+def test_body_is_serialized_once_per_version(configuration):
+    first = proxy.state_response("instance")
+    assert proxy.state_response("instance") is first
+    proxy.set_instance("inst-1", "STARTING")
+    assert proxy.state_response("instance") is not first
+
+
+def test_async_state_is_not_modified(configuration):
+    async def main():
+        async with TestClient(TestServer(streamrun_async.build_app())) as client:
+            url = f"/c/{configuration['id']}/api/instance-data"
+            first = await client.get(url)
+            r = await client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+            assert r.status == 304
+
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import state_store
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+def test_sqlite_writes_are_seen_by_another_connection(db_path):
+    writer, reader = state_store.SqliteStateStore(db_path), state_store.SqliteStateStore(db_path)
+    seen = {}
+    assert reader.changed_since(seen) == {}
+    assert writer.put("instance:cfg", {"state": "RUNNING"}) == 1
+    assert writer.put("instance:cfg", {"state": "STOPPED"}) == 2
+    changed = reader.changed_since(seen)
+    assert changed == {"instance:cfg": (2, {"state": "STOPPED"})}
+    seen.update((key, version) for key, (version, _) in changed.items())
+    # Nothing committed since, so the data_version check short-circuits
+    assert reader.changed_since(seen) == {}
+
+
+def test_sqlite_writes_from_another_process(db_path):
+    store = state_store.SqliteStateStore(db_path)
+    store.put("switch:cfg", {"element_id": "input-pc"})
+    subprocess.run([sys.executable, "-c", (
+        "import sys, state_store;"
+        "store = state_store.SqliteStateStore(sys.argv[1]);"
+        "print(store.put('switch:cfg', {'element_id': 'input-brb'}))"
+    ), db_path], cwd=os.path.dirname(state_store.__file__), check=True)
+    assert store.read(["switch:cfg", "missing"]) == {"switch:cfg": (2, {"element_id": "input-brb"})}
+
+
+def test_concurrent_puts_get_distinct_versions(db_path):
+    stores = [state_store.SqliteStateStore(db_path) for _ in range(4)]
+    versions = []
+
+    def put(store):
+        for _ in range(25):
+            versions.append(store.put("elements:cfg", {"elements": []}))
+
+    threads = [threading.Thread(target=put, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(versions) == list(range(1, 101))
+
+
+def test_instance_is_published_without_holding_the_status_lock(configuration, monkeypatch):
+    held = []
+
+    class Store(state_store.MemoryStateStore):
+        def put(self, key, value):
+            # Another thread can take the status lock while the write runs
+            taken = []
+
+            def take():
+                if proxy._status_cond.acquire(timeout=1):
+                    proxy._status_cond.release()
+                    taken.append(True)
+
+            thread = threading.Thread(target=take)
+            thread.start()
+            thread.join()
+            held.append(not taken)
+            return super().put(key, value)
+
+    monkeypatch.setattr(proxy, "state_store", Store())
+    proxy.set_instance("inst-1", "STARTING")
+    proxy.record_instance_state("inst-1", "RUNNING")
+    assert held == [False, False]
+    assert proxy.state_store.read([proxy.shared_key("instance")])[proxy.shared_key("instance")][1]["state"] == "RUNNING"
+
+
+@pytest.mark.parametrize("multiprocess, kind", [(False, "memory"), (True, "sqlite")])
+def test_auto_store_follows_the_worker_count(db_path, monkeypatch, multiprocess, kind):
+    monkeypatch.setattr(proxy, "STATE_STORE_KIND", "auto")
+    monkeypatch.setattr(proxy, "STATE_DB_PATH", db_path)
+    monkeypatch.setattr(proxy, "state_store", proxy.state_store)
+    monkeypatch.setattr(proxy, "_state_versions", {})
+    proxy.app.test_client().get("/api/status", environ_overrides={"wsgi.multiprocess": multiprocess})
+    assert proxy.STATE_STORE_KIND == kind
+    assert isinstance(proxy.state_store, state_store.SqliteStateStore) is multiprocess
@@ -0,0 +1,52 @@
+import gzip
+import re
+
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def client():
+    proxy.preload()
+    return proxy.app.test_client()
+
+
+def asset_urls(client):
+    return re.findall(r'"(/assets/[^"]+)"', client.get("/").get_data(as_text=True))
+
+
+def test_assets_have_content_hashed_immutable_urls(client):
+    urls = asset_urls(client)
+    assert len(urls) == 2
+    for url in urls:
+        r = client.get(url)
+        assert r.status_code == 200
+        assert r.headers["Cache-Control"] == proxy.IMMUTABLE_CACHE_CONTROL
+    assert client.get("/assets/dashboard.0000000000000000.js").status_code == 404
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br" if proxy.brotli else "gzip"),
+    ("br;q=0, gzip", "gzip"),
+])
+def test_precompressed_variant_follows_accept_encoding(client, accept, encoding):
+    identity = client.get("/").get_data()
+    r = client.get("/", headers={"Accept-Encoding": accept})
+    assert r.headers.get("Content-Encoding") == encoding
+    assert r.headers["Vary"] == "Accept-Encoding"
+    if encoding == "gzip":
+        assert gzip.decompress(r.get_data()) == identity
+    elif encoding == "br":
+        assert proxy.brotli.decompress(r.get_data()) == identity
+
+
+def test_matching_etag_is_not_modified_across_encodings(client):
+    sent = client.get("/", headers={"Accept-Encoding": "gzip"})
+    r = client.get("/", headers={"If-None-Match": sent.headers["ETag"]})
+    assert r.status_code == 304
+    assert r.get_data() == b""
+    assert client.get("/", headers={"If-None-Match": "W/" + sent.headers["ETag"]}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def live(fake, configuration):
+    """A running instance with the fake's elements loaded and PC on screen."""
+    proxy.start_instance()
+    proxy.fetch_and_categorize_elements()
+    proxy.set_active_input("input-pc")
+    yield configuration
+    proxy.close_switch_executor(configuration["id"])
+
+
+def drain_switches():
+    """Wait until every optimistic switch queued so far has been settled."""
+    proxy.get_switch_executor().submit(lambda: None).result(timeout=5)
+
+
+def test_optimistic_switch_is_pending_then_confirmed(live, fake):
+    answer = proxy.switch_element_optimistic("BRB Screen")
+    op_id = live["active_input"]["op_id"]
+    assert answer == f"Switching to element (op {op_id})"
+    drain_switches()
+    assert live["active_input"]["element_id"] == "input-brb"
+    assert live["active_input"]["status"] == "confirmed"
+    assert proxy.switch_op_status(op_id) == "confirmed"
+    assert fake.instances[-1]["overrides"] == {"switch-1": {"input": "input-brb"}}
+
+
+def test_failed_switch_rolls_back_to_the_confirmed_input(live, monkeypatch):
+    monkeypatch.setattr(proxy, "patch_switch", lambda instance_id, element_id: "Error 503: down")
+    release = threading.Event()
+    proxy.get_switch_executor().submit(release.wait, 5)
+    proxy.switch_element_optimistic("input-mobile")
+    op_id = live["active_input"]["op_id"]
+    assert live["active_input"]["status"] == "pending"
+    release.set()
+    drain_switches()
+    assert live["active_input"]["element_id"] == "input-pc"
+    assert live["active_input"]["status"] == "failed"
+    assert proxy.switch_op_status(op_id) == "failed: Error 503: down"
+
+
+def test_rollback_lands_on_a_superseded_switch_that_succeeded(live, monkeypatch):
+    in_flight, release = threading.Event(), threading.Event()
+
+    def patch_switch(instance_id, element_id):
+        if element_id == "input-brb":
+            in_flight.set()
+            release.wait(5)
+            return None
+        return "Error 503: down"
+
+    monkeypatch.setattr(proxy, "patch_switch", patch_switch)
+    proxy.switch_element_optimistic("input-brb")
+    assert in_flight.wait(5)
+    proxy.switch_element_optimistic("input-mobile")
+    release.set()
+    drain_switches()
+    # Upstream shows BRB, so that is where the failed switch to mobile lands
+    assert live["active_input"]["element_id"] == "input-brb"
+    assert live["active_input"]["confirmed_id"] == "input-brb"
+    assert live["active_input"]["status"] == "failed"
+
+
+def test_switches_overtaken_before_they_are_sent_are_skipped(live, monkeypatch):
+    sent, release = [], threading.Event()
+    monkeypatch.setattr(proxy, "patch_switch", lambda instance_id, element_id: sent.append(element_id))
+    # Hold the switch thread so all three queue up behind it
+    proxy.get_switch_executor().submit(release.wait, 5)
+    proxy.switch_element_optimistic("input-brb")
+    first = live["active_input"]["op_id"]
+    proxy.switch_element_optimistic("input-mobile")
+    second = live["active_input"]["op_id"]
+    proxy.switch_element_optimistic("input-pc")
+    release.set()
+    drain_switches()
+    assert proxy.switch_op_status(first) == "superseded"
+    assert proxy.switch_op_status(second) == "superseded"
+    assert sent == ["input-pc"]
+    assert live["active_input"]["element_id"] == "input-pc"
+    assert live["active_input"]["status"] == "confirmed"
+
+
+def test_unknown_element_is_refused(live):
+    assert proxy.switch_element_optimistic("Webcam") == "Unknown element"
+    assert live["active_input"]["element_id"] == "input-pc"
+
+
+def test_a_held_switch_thread_does_not_delay_another_configuration(live, fake, configuration):
+    release = threading.Event()
+    proxy.get_switch_executor().submit(release.wait, 5)
+    try:
+        other = proxy.new_configuration(f"{live['id']}-other")
+        other["loaded"].set()
+        with proxy.using_configuration(other):
+            proxy.start_instance()
+            proxy.fetch_and_categorize_elements()
+            proxy.switch_element_optimistic("BRB Screen")
+            proxy.get_switch_executor().submit(lambda: None).result(timeout=1)
+            assert other["active_input"]["status"] == "confirmed"
+        assert not release.is_set()
+    finally:
+        release.set()
+        proxy.close_switch_executor(f"{live['id']}-other")
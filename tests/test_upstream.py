@@ -0,0 +1,50 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import streamrun_proxy as proxy
+
+
+@pytest.fixture
+def throttling_upstream(monkeypatch):
+    """An upstream that answers 429 with a long Retry-After, then 200."""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            calls.append(self.path)
+            if len(calls) == 1:
+                self.send_response(429)
+                self.send_header("Retry-After", "3600")
+                body = b""
+            else:
+                self.send_response(200)
+                body = b'{"state": "RUNNING"}'
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(proxy, "BASE_URL", f"http://127.0.0.1:{server.server_port}/api/v1")
+    monkeypatch.setattr(proxy, "UPSTREAM_RETRIES", 1)
+    monkeypatch.setattr(proxy, "UPSTREAM_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(proxy, "_session", None)
+    try:
+        yield calls
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sync_retry_ignores_a_long_retry_after(throttling_upstream):
+    started = time.perf_counter()
+    r = proxy.get_session().get(f"{proxy.BASE_URL}/instances/inst-1", timeout=5)
+    assert r.status_code == 200
+    assert len(throttling_upstream) == 2
+    assert time.perf_counter() - started < 2
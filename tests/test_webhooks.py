@@ -0,0 +1,120 @@
+import json
+import time
+import uuid
+
+import pytest
+
+import fake_streamrun
+import streamrun_proxy as proxy
+
+
+@pytest.fixture(autouse=True)
+def fresh_webhooks():
+    """Forget the event ids and instance times earlier tests delivered."""
+    with proxy._webhook_lock:
+        proxy._webhook_event_ids.clear()
+        proxy._webhook_latest.clear()
+
+
+def signed(event, secret="test-secret", timestamp=None):
+    """Body and X-Streamrun-Signature header for a webhook delivery."""
+    body = json.dumps(event).encode()
+    timestamp = str(int(timestamp or time.time()))
+    return body, f"t={timestamp},v1={proxy.webhook_signature(secret, timestamp, body)}"
+
+
+def event(instance_id, state, created, config_id, **fields):
+    return {
+        "id": f"evt-{uuid.uuid4().hex[:12]}",
+        "type": "instance.updated",
+        "created": created,
+        "data": {"instance": dict(fields, id=instance_id, state=state, configurationId=config_id)},
+    }
+
+
+def deliver(payload, **kwargs):
+    return proxy.handle_webhook(*signed(payload, **kwargs))
+
+
+def test_signed_event_is_applied(configuration):
+    assert deliver(event("inst-1", "RUNNING", 1, configuration["id"])) == (200, "Instance RUNNING")
+    assert configuration["instance"]["id"] == "inst-1"
+    assert configuration["instance"]["pushed_at"] is not None
+
+
+@pytest.mark.parametrize("kwargs, reason", [
+    ({"secret": "wrong"}, "Bad signature"),
+    ({"timestamp": time.time() - 3600}, "Signature expired"),
+])
+def test_bad_signatures_are_rejected(configuration, kwargs, reason):
+    assert deliver(event("inst-1", "RUNNING", 1, configuration["id"]), **kwargs) == (401, reason)
+    assert configuration["instance"]["id"] is None
+
+
+def test_missing_signature_is_rejected(configuration):
+    body, _ = signed(event("inst-1", "RUNNING", 1, configuration["id"]))
+    assert proxy.handle_webhook(body, None) == (401, "Missing signature")
+
+
+def test_repeated_event_is_a_duplicate(configuration):
+    payload = event("inst-1", "RUNNING", 1, configuration["id"])
+    assert deliver(payload) == (200, "Instance RUNNING")
+    assert deliver(payload) == (200, "Duplicate")
+
+
+def test_older_event_for_the_same_instance_changes_nothing(configuration):
+    assert deliver(event("inst-1", "RUNNING", 1, configuration["id"]))[1] == "Instance RUNNING"
+    assert deliver(event("inst-1", "STOPPED", 5, configuration["id"]))[1] == "Instance STOPPED"
+    assert deliver(event("inst-1", "RUNNING", 3, configuration["id"]))[1] == "Ignored: out of order"
+    assert configuration["instance"]["id"] is None
+
+
+def test_older_active_instance_does_not_replace_a_newer_one(configuration):
+    assert deliver(event("inst-1", "RUNNING", 5, configuration["id"]))[1] == "Instance RUNNING"
+    assert deliver(event("inst-0", "RUNNING", 1, configuration["id"]))[1] == "Ignored: newer instance active"
+    assert configuration["instance"]["id"] == "inst-1"
+
+
+def test_newer_active_instance_takes_over(configuration):
+    deliver(event("inst-1", "RUNNING", 1, configuration["id"], createdAt="2026-01-01T00:00:00+00:00"))
+    deliver(event("inst-2", "STARTING", 2, configuration["id"], createdAt="2026-01-02T00:00:00+00:00"))
+    assert configuration["instance"]["id"] == "inst-2"
+
+
+def test_event_for_an_unloaded_configuration_applies_on_replay(configuration):
+    payload = event("inst-1", "RUNNING", 1, configuration["id"])
+    with proxy._configurations_lock:
+        del proxy._configurations[configuration["id"]]
+    assert deliver(payload) == (200, "Ignored: configuration not loaded")
+    with proxy._configurations_lock:
+        proxy._configurations[configuration["id"]] = configuration
+    assert deliver(payload) == (200, "Instance RUNNING")
+    assert configuration["instance"]["id"] == "inst-1"
+
+
+def test_fake_replays_are_acknowledged_as_duplicates(serve_fake, proxy_url, configuration, monkeypatch):
+    results = []
+    handle_webhook = proxy.handle_webhook
+
+    def recording(body, signature):
+        result = handle_webhook(body, signature)
+        results.append(result)
+        return result
+
+    monkeypatch.setattr(proxy, "handle_webhook", recording)
+    sender = fake_streamrun.WebhookSender(f"{proxy_url}/api/webhooks/streamrun", "test-secret")
+    serve_fake(fake_streamrun.FakeStreamrun(start_delay=0, webhooks=sender))
+
+    assert proxy.start_instance() == "Starting stream"
+    deadline = time.monotonic() + 5
+    while len(results) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [status for status, _ in results] == [200, 200]
+    assert configuration["instance"]["state"] == "RUNNING"
+
+    assert sender.replay() == 2
+    deadline = time.monotonic() + 5
+    while len(results) < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert results[2:] == [(200, "Duplicate"), (200, "Duplicate")]
+    assert configuration["instance"]["state"] == "RUNNING"